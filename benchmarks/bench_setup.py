@@ -0,0 +1,209 @@
+'''
+Benchmark Setup load/save on synthetic setups of realistic size
+
+Generates a setup with --components components, each with --history calibrations holding
+arrays of --array-size float64 elements and dataframes of --df-rows rows, then times:
+    load                 Setup.load() of the latest calibrations
+    load_epoch           Setup.load(run_time_epoch) in the middle of the history
+    save_component_cal   one new calibration of one component
+    list_setups          listing a storage dir of --setups setups
+    load_to_dict         resolving the file references of one cal.yaml tree
+    save_from_dict       writing the arrays/dataframes of one calibration
+
+Each case reports latency percentiles, throughput and the peak python memory (tracemalloc, so
+memory-mapped files aren't counted). Results can be saved and compared with an earlier run:
+
+    python benchmarks/bench_setup.py --output before.json
+    python benchmarks/bench_setup.py --compare before.json
+'''
+
+import argparse
+import json
+import os
+import pathlib
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1] / 'src'))
+
+import calibration_manager as cm
+from calibration_manager import manager
+from calibration_manager.timeline import parse_cal_id
+
+def make_calibration(rng, n_arrays: int, array_size: int, df_rows: int, n_params: int):
+    cal = {f'param_{i}': float(rng.random()) for i in range(n_params)}
+    cal['arrays'] = {f'array_{i}': rng.random(array_size) for i in range(n_arrays)}
+    cal['table'] = pd.DataFrame({'x': rng.random(df_rows), 'y': rng.random(df_rows), 'id': np.arange(df_rows)})
+    return cal
+
+def generate_setup(setup_dir: pathlib.Path, args, rng):
+    '''Write a synthetic setup, returns the run_time_epoch in the middle of its history'''
+    setup = cm.Setup(setup_dir, fsync=False, table_format=args.table_format, yaml_mode=args.yaml_mode)
+    for c in range(args.components):
+        name = f'component_{c}'
+        setup.save_component_cfg(name, {f'cfg_{i}': i for i in range(args.params)})
+        setup.load_component_cfg(name) # so calibrations store a copy of the cfg, as in use
+        for _ in range(args.history):
+            setup.save_component_cal(name, make_calibration(rng, args.arrays, args.array_size, args.df_rows, args.params))
+    names = setup.timeline(setup_dir / 'component_0').names()
+    return parse_cal_id(names[len(names) // 2]) / 1e9
+
+def measure(fn, repeat: int, setup_fn=None, nbytes: int = 0):
+    '''Time fn repeat times (after setup_fn, untimed), then trace the peak memory of one more run
+
+    Memory is traced separately since tracemalloc slows allocation heavy code down several times.
+    '''
+    latencies = []
+    for _ in range(repeat):
+        if setup_fn is not None:
+            setup_fn()
+        t0 = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t0)
+    if setup_fn is not None:
+        setup_fn()
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    latencies = np.array(latencies)
+    result = {
+        'n': repeat,
+        'mean_ms': latencies.mean() * 1e3,
+        'p50_ms': np.percentile(latencies, 50) * 1e3,
+        'p90_ms': np.percentile(latencies, 90) * 1e3,
+        'p99_ms': np.percentile(latencies, 99) * 1e3,
+        'max_ms': latencies.max() * 1e3,
+        'ops_per_s': 1 / latencies.mean(),
+        'peak_mem_mb': peak / 1e6,
+    }
+    if nbytes:
+        result['mb_per_s'] = nbytes / 1e6 / latencies.mean()
+    return result
+
+def tree_bytes(d):
+    total = 0
+    for v in d.values():
+        if isinstance(v, dict):
+            total += tree_bytes(v)
+        elif isinstance(v, np.ndarray):
+            total += v.nbytes
+        elif isinstance(v, pd.DataFrame):
+            total += int(v.memory_usage(index=True).sum())
+    return total
+
+def run(args):
+    rng = np.random.default_rng(args.seed)
+    results = {}
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        tmp = pathlib.Path(tmp)
+        setup_dir = tmp / 'setups' / 'bench_setup'
+        t0 = time.perf_counter()
+        mid_epoch = generate_setup(setup_dir, args, rng)
+        print(f'generated {args.components} components x {args.history} calibrations in {time.perf_counter() - t0:.1f} s')
+
+        def new_setup():
+            return cm.Setup(setup_dir, lazy=args.lazy, mmap_mode=args.mmap_mode, table_format=args.table_format,
+                            yaml_mode=args.yaml_mode, fsync=not args.no_fsync)
+
+        loaded = new_setup()
+        loaded.load()
+        cal_bytes = sum(tree_bytes(cal) for cal in loaded.cal.values())
+        results['load'] = measure(lambda: new_setup().load(), args.repeat, nbytes=cal_bytes)
+        results['load_epoch'] = measure(lambda: new_setup().load(mid_epoch), args.repeat, nbytes=cal_bytes)
+
+        cal = make_calibration(rng, args.arrays, args.array_size, args.df_rows, args.params)
+        saver = new_setup()
+        saver.load_component_cfg('component_0')
+        results['save_component_cal'] = measure(lambda: saver.save_component_cal('component_0', dict(cal)),
+                                                args.repeat, nbytes=tree_bytes(cal))
+
+        for i in range(args.setups):
+            (tmp / 'setups' / f'setup_{i}').mkdir()
+        home = os.environ.get('HOME')
+        os.environ['HOME'] = str(tmp) # list_setups reads ~/.ros/setups/
+        try:
+            (tmp / '.ros').mkdir()
+            (tmp / '.ros' / 'setups').symlink_to(tmp / 'setups')
+            results['list_setups'] = measure(manager.list_setups, args.repeat)
+        finally:
+            if home is not None:
+                os.environ['HOME'] = home
+
+        cal_dir = loaded.paths['component_0']['cal']
+        results['load_to_dict'] = measure(
+            lambda: manager.load_to_dict(manager.load_yaml(cal_dir / 'cal.yaml', mode=args.yaml_mode), cal_dir, mmap_mode=args.mmap_mode),
+            args.repeat, nbytes=tree_bytes(loaded.cal['component_0']))
+
+        out_dir = tmp / 'save_from_dict'
+        results['save_from_dict'] = measure(
+            lambda: manager.save_from_dict(dict(cal, arrays=dict(cal['arrays'])), out_dir, table_format=args.table_format),
+            args.repeat, setup_fn=lambda: (shutil.rmtree(out_dir, ignore_errors=True), out_dir.mkdir()), nbytes=tree_bytes(cal))
+    return results
+
+def print_results(results: dict, baseline: dict = None):
+    print(f'{"case":<20}{"p50 ms":>10}{"p90 ms":>10}{"p99 ms":>10}{"ops/s":>10}{"MB/s":>10}{"peak MB":>10}', end='')
+    print(f'{"vs base":>10}' if baseline else '')
+    for case, r in results.items():
+        line = f'{case:<20}{r["p50_ms"]:>10.2f}{r["p90_ms"]:>10.2f}{r["p99_ms"]:>10.2f}{r["ops_per_s"]:>10.1f}'
+        line += f'{r.get("mb_per_s", float("nan")):>10.1f}{r["peak_mem_mb"]:>10.1f}'
+        if baseline and case in baseline:
+            line += f'{r["p50_ms"] / baseline[case]["p50_ms"]:>9.2f}x' # < 1 is faster
+        print(line)
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=pathlib.Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--components', type=int, default=20)
+    parser.add_argument('--history', type=int, default=10, help='calibrations per component')
+    parser.add_argument('--arrays', type=int, default=4, help='arrays per calibration')
+    parser.add_argument('--array-size', type=int, default=100_000, help='float64 elements per array')
+    parser.add_argument('--df-rows', type=int, default=1000, help='rows of the dataframe in each calibration')
+    parser.add_argument('--params', type=int, default=50, help='scalar params per cfg/calibration')
+    parser.add_argument('--setups', type=int, default=100, help='setups in the storage dir for list_setups')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--table-format', default='csv')
+    parser.add_argument('--yaml-mode', default='rt')
+    parser.add_argument('--lazy', action='store_true')
+    parser.add_argument('--mmap-mode', default=None)
+    parser.add_argument('--no-fsync', action='store_true')
+    parser.add_argument('--dir', default=None, help='where to generate the setup, e.g. on the storage under test')
+    parser.add_argument('--output', help='save results to this json file')
+    parser.add_argument('--compare', help='json results of an earlier run to compare against')
+    args = parser.parse_args()
+
+    results = run(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'revision': git_revision(),
+                'time': time.time(),
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'pandas': pd.__version__,
+                'args': vars(args),
+                'results': results,
+            }, f, indent=2)
+
+if __name__ == '__main__':
+    main()
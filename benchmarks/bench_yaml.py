@@ -0,0 +1,57 @@
+'''
+Compare the round-trip and fast yaml modes on a large synthetic cfg/cal tree
+
+    python benchmarks/bench_yaml.py --keys 5000 --points 2000
+'''
+
+import argparse
+import pathlib
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1] / 'src'))
+
+from calibration_manager import fastyaml
+from calibration_manager.manager import dump_yaml, load_yaml
+
+def make_tree(n_keys: int, n_points: int, seed: int = 0):
+    '''A cfg/cal-like tree: nested groups of scalar params and a long list of calibration points'''
+    rng = random.Random(seed)
+    tree = {}
+    for i in range(n_keys):
+        group = tree.setdefault(f'group_{i % 50}', {})
+        group[f'param_{i}'] = rng.choice([rng.random(), rng.randint(0, 1000), rng.random() > 0.5, f'name_{i}'])
+    tree['points'] = [[rng.random(), rng.random(), rng.random()] for _ in range(n_points)]
+    return tree
+
+def best_of(fn, repeat: int):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--keys', type=int, default=5000)
+    parser.add_argument('--points', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    tree = make_tree(args.keys, args.points)
+    print(f'libyaml (PyYAML) available: {fastyaml.imports_pyyaml}')
+    with tempfile.TemporaryDirectory() as tmp:
+        f = pathlib.Path(tmp) / 'cal.yaml'
+        results = {}
+        for mode in fastyaml.YAML_MODES:
+            dump = best_of(lambda: dump_yaml(tree, f, mode), args.repeat)
+            load = best_of(lambda: load_yaml(f, mode=mode), args.repeat)
+            results[mode] = (dump, load)
+            print(f'{mode:>4}: dump {dump*1e3:8.1f} ms  load {load*1e3:8.1f} ms  ({f.stat().st_size/1e6:.2f} MB)')
+        print(f'fast mode speedup: dump {results["rt"][0]/results["fast"][0]:.1f}x, load {results["rt"][1]/results["fast"][1]:.1f}x')
+
+if __name__ == '__main__':
+    main()
@@ -1 +1,6 @@
-from calibration_manager.manager import Setup
\ No newline at end of file
+from calibration_manager.manager import Setup
+from calibration_manager.cache import CalibrationCache, calibration_cache
+from calibration_manager.watcher import SetupWatcher
+from calibration_manager.iostats import IOStats
+from calibration_manager.chunked import ChunkedArray
+from calibration_manager.writer import AsyncCalWriter
@@ -0,0 +1,128 @@
+'''
+Compressed archive of pruned calibrations, per component in {component_dir}/.archive/
+
+Each prune writes one new zip volume holding the removed cal folders as {cal_id}/..., so existing
+volumes are never rewritten and a crash leaves at worst a stray temporary file. Archived
+calibrations stay in the component's timeline; loading one extracts it once to
+.archive/extracted/{cal_id}/, after which it reads like any other cal folder.
+'''
+
+import errno
+import os
+import pathlib
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+
+from calibration_manager.atomic import fsync_dir, fsync_file
+
+ARCHIVE_DIR = '.archive'
+EXTRACTED_DIR = 'extracted'
+
+_volume_ids = {} # (volume path, mtime_ns): cal ids in it
+_volume_ids_lock = threading.Lock()
+
+class CalArchive:
+    """
+    The archive volumes of one component directory
+
+    component_dir: path to the component folder
+    """
+    def __init__(self, component_dir):
+        self.component_dir = pathlib.Path(component_dir)
+        self.root = self.component_dir / ARCHIVE_DIR
+
+    def volumes(self):
+        if not self.root.is_dir():
+            return []
+        return sorted(p for p in self.root.glob('*.zip'))
+
+    def cal_ids(self):
+        '''{cal id: volume path} of every archived calibration'''
+        ids = {}
+        for volume in self.volumes():
+            for cal_id in volume_cal_ids(volume):
+                ids[cal_id] = volume
+        return ids
+
+    def add(self, cal_dirs: list, fsync: bool = True):
+        '''Write the cal folders to a new volume, returns its path. The folders are left in place'''
+        if not cal_dirs:
+            return None
+        self.root.mkdir(parents=True, exist_ok=True)
+        volume = self.root / f'{time.time_ns()}.zip'
+        fd, tmp = tempfile.mkstemp(prefix='.', suffix='.zip.tmp', dir=self.root)
+        os.close(fd)
+        try:
+            with zipfile.ZipFile(tmp, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+                for cal_dir in cal_dirs:
+                    cal_dir = pathlib.Path(cal_dir)
+                    for dirpath, dirnames, filenames in os.walk(cal_dir):
+                        for filename in filenames:
+                            f = pathlib.Path(dirpath) / filename
+                            zf.write(f, f'{cal_dir.name}/{f.relative_to(cal_dir).as_posix()}')
+            if fsync:
+                fsync_file(tmp)
+            os.replace(tmp, volume)
+            if fsync:
+                fsync_dir(self.root)
+        finally:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+        return volume
+
+    def extract(self, cal_id: str, volume: pathlib.Path = None):
+        '''Folder holding the archived calibration cal_id, extracting it on first use
+
+        Returns None if cal_id is not archived.
+        '''
+        target = self.root / EXTRACTED_DIR / cal_id
+        if target.is_dir():
+            return target
+        if volume is None:
+            volume = self.cal_ids().get(cal_id)
+            if volume is None:
+                return None
+        target.parent.mkdir(parents=True, exist_ok=True)
+        staging = pathlib.Path(tempfile.mkdtemp(prefix=f'.{cal_id}-', dir=target.parent))
+        try:
+            with zipfile.ZipFile(volume) as zf:
+                members = [m for m in zf.namelist() if m.startswith(f'{cal_id}/')]
+                zf.extractall(staging, members)
+            try:
+                os.rename(staging / cal_id, target)
+            except OSError as ex: # extracted concurrently
+                if ex.errno not in (errno.EEXIST, errno.ENOTEMPTY):
+                    raise
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        return target
+
+    def clear_extracted(self):
+        '''Remove the extracted copies, they are recreated when needed
+
+        They are renamed away first, so readers see each copy either whole or gone (see Setup._load_tree).
+        '''
+        removed = self.root / f'.{EXTRACTED_DIR}-{os.getpid()}-{threading.get_ident()}'
+        try:
+            os.rename(self.root / EXTRACTED_DIR, removed)
+        except FileNotFoundError:
+            return
+        shutil.rmtree(removed, ignore_errors=True)
+
+def volume_cal_ids(volume: pathlib.Path):
+    '''Cal ids in a volume, cached by the volume's mtime (volumes are written once)'''
+    key = (str(volume), volume.stat().st_mtime_ns)
+    with _volume_ids_lock:
+        ids = _volume_ids.get(key)
+    if ids is None:
+        with zipfile.ZipFile(volume) as zf:
+            ids = sorted({name.split('/', 1)[0] for name in zf.namelist()})
+        with _volume_ids_lock:
+            _volume_ids[key] = ids
+    return ids
+
+def archived_cal_ids(component_dir):
+    return list(CalArchive(component_dir).cal_ids())
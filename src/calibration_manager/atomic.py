@@ -0,0 +1,131 @@
+'''
+Helpers for crash-safe writes: files are written to a private staging directory, optionally
+fsynced, then published with renames so readers never see a partially written calibration.
+'''
+
+import contextlib
+import os
+import pathlib
+import tempfile
+import threading
+
+try:
+    import fcntl
+    imports_fcntl = True
+except ImportError: # windows
+    imports_fcntl = False
+
+STAGING_DIR = '.staging'
+LOCK_FILE = '.lock'
+
+def make_staging_dir(parent: pathlib.Path):
+    '''Create a private staging directory in {parent}/.staging/, on the same filesystem as parent
+
+    Working in the .staging/ subdirectory leaves parent's mtime alone until the result is published.
+    '''
+    staging_root = parent / STAGING_DIR
+    staging_root.mkdir(parents=True, exist_ok=True)
+    return pathlib.Path(tempfile.mkdtemp(prefix=f'{os.getpid()}-{threading.get_ident()}-', dir=staging_root))
+
+@contextlib.contextmanager
+def locked(directory: pathlib.Path):
+    '''Hold an exclusive lock on a directory (via {directory}/.staging/.lock) between writers
+
+    Uses POSIX record locks, which work across processes on one host and over NFS (with lockd).
+    A thread lock is held too, since record locks don't exclude threads of the same process.
+    Without fcntl (windows) only threads are excluded.
+    '''
+    lock_path = directory / STAGING_DIR / LOCK_FILE
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with _thread_lock(lock_path):
+        if not imports_fcntl:
+            yield
+            return
+        with open(lock_path, 'a') as f:
+            fcntl.lockf(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.lockf(f, fcntl.LOCK_UN)
+
+_thread_locks = {}
+_thread_locks_lock = threading.Lock()
+
+def _thread_lock(path: pathlib.Path):
+    with _thread_locks_lock:
+        return _thread_locks.setdefault(str(path), threading.Lock())
+
+def fsync_file(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def fsync_dir(path):
+    '''fsync a directory so renames/creations in it are durable (no-op where unsupported)'''
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def fsync_tree(path):
+    '''fsync every file and directory below path'''
+    for dirpath, dirnames, filenames in os.walk(path):
+        for filename in filenames:
+            fsync_file(os.path.join(dirpath, filename))
+        fsync_dir(dirpath)
+
+def replace_files(staging_dir: pathlib.Path, target_dir: pathlib.Path, last: tuple = ()):
+    '''Move every file of staging_dir over the same path in target_dir, one atomic rename each
+
+    Files named in last are moved after all others (e.g. the yaml that references the rest).
+    The emptied staging_dir is removed.
+    '''
+    target_dir.mkdir(parents=True, exist_ok=True)
+    deferred = []
+    for dirpath, dirnames, filenames in os.walk(staging_dir):
+        rel = pathlib.Path(dirpath).relative_to(staging_dir)
+        (target_dir / rel).mkdir(parents=True, exist_ok=True)
+        for filename in filenames:
+            if rel == pathlib.Path('.') and filename in last:
+                deferred.append(filename)
+                continue
+            replace_file(pathlib.Path(dirpath) / filename, target_dir / rel / filename)
+    for filename in sorted(deferred, key=last.index):
+        replace_file(staging_dir / filename, target_dir / filename)
+    remove_empty_tree(staging_dir)
+
+def replace_file(src: pathlib.Path, dst: pathlib.Path):
+    '''os.replace, except that src is unlinked if it is a hard link to dst (e.g. the same dedup blob)
+
+    Renaming a file over another link to the same inode is a no-op that leaves src in place.
+    '''
+    try:
+        if os.path.samefile(src, dst):
+            os.unlink(src)
+            return
+    except FileNotFoundError:
+        pass
+    os.replace(src, dst)
+
+def remove_empty_tree(path: pathlib.Path):
+    for dirpath, dirnames, filenames in os.walk(path, topdown=False):
+        os.rmdir(dirpath)
+
+def swap_symlink(link: pathlib.Path, target: pathlib.Path, tmp_dir: pathlib.Path = None):
+    '''Point link at target with a single atomic rename, replacing any existing link
+
+    tmp_dir: where to make the new link before renaming it over link, defaults to next to link
+    '''
+    tmp_dir = link.parent if tmp_dir is None else tmp_dir
+    tmp_link = tmp_dir / f'.{link.name}-{os.getpid()}-{threading.get_ident()}'
+    tmp_link.unlink(missing_ok=True)
+    tmp_link.symlink_to(target)
+    os.replace(tmp_link, link)
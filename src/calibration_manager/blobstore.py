@@ -0,0 +1,171 @@
+import hashlib
+import logging
+import os
+import pathlib
+import shutil
+import tempfile
+import threading
+
+BLOB_DIR = '.blobs'
+
+class BlobStore:
+    """
+    A content-addressed store of calibration files, shared by all components of a setup
+
+    Each distinct file content is stored once as {setup_dir}/.blobs/{hash[:2]}/{hash} and hard linked
+    (or copied, where links aren't supported) into the cal/cfg folders that use it, so readers see the
+    usual file layout. Blobs are never modified in place: every write in this package replaces files by
+    rename, which only drops the link. Live, user editable files (the cfg/ folder) are copied into the
+    store rather than linked. A blob with no links left can be removed with gc().
+
+    root: path to the blob directory
+    """
+    def __init__(self, root):
+        self.root = pathlib.Path(root)
+        self._hashes = {} # (dev, inode, mtime, size): digest, avoids rehashing linked files
+        self._lock = threading.Lock()
+
+    def blob_path(self, digest: str):
+        return self.root / digest[:2] / digest
+
+    def put_bytes(self, data):
+        '''Store data, skipping the write if an identical blob exists. Returns the blob path'''
+        digest = hashlib.blake2b(data, digest_size=32).hexdigest()
+        blob = self.blob_path(digest)
+        if not blob.exists():
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            tmp = blob.with_name(f'.{digest}-{os.getpid()}-{threading.get_ident()}')
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, blob)
+        self._remember(blob, digest)
+        return blob
+
+    def put_written(self, write):
+        '''Store what write(file) writes to a binary file, skipping it if an identical blob exists. Returns the blob path
+
+        The content goes straight to a temporary file in the store and is hashed from there, so large
+        files are never held in memory.
+        '''
+        self.root.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix='.new-', dir=self.root)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            digest = file_digest(tmp)
+            blob = self.blob_path(digest)
+            if blob.exists():
+                os.unlink(tmp)
+            else:
+                blob.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp, blob)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        self._remember(blob, digest)
+        return blob
+
+    def _remember(self, path, digest):
+        st = os.stat(path)
+        with self._lock:
+            self._hashes[(st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)] = digest
+
+    def put_file(self, path, reuse_inode: bool = False):
+        '''Store the content of an existing file. Returns the blob path
+
+        If reuse_inode, a new blob is made by hard linking the file instead of copying it; only do
+        this for private files that will never be edited in place (e.g. in a staging directory).
+        '''
+        digest = self.hash_file(path)
+        blob = self.blob_path(digest)
+        if not blob.exists():
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            tmp = blob.with_name(f'.{digest}-{os.getpid()}-{threading.get_ident()}')
+            tmp.unlink(missing_ok=True)
+            try:
+                if not reuse_inode:
+                    raise OSError
+                os.link(path, tmp)
+            except OSError:
+                shutil.copyfile(path, tmp)
+            os.replace(tmp, blob)
+            self._remember(blob, digest)
+        return blob
+
+    def hash_file(self, path):
+        st = os.stat(path)
+        key = (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            digest = self._hashes.get(key)
+        if digest is None:
+            digest = file_digest(path)
+            self._remember(path, digest)
+        return digest
+
+    def link(self, blob, dest):
+        '''Make dest refer to blob, replacing dest if it exists'''
+        dest = pathlib.Path(dest)
+        tmp = dest.with_name(f'.{dest.name}-{os.getpid()}-{threading.get_ident()}')
+        tmp.unlink(missing_ok=True)
+        try:
+            os.link(blob, tmp)
+        except OSError: # e.g. cross-device or no hard link support
+            shutil.copyfile(blob, tmp)
+        os.replace(tmp, dest)
+
+    def copy(self, src, dest):
+        '''shutil.copytree copy_function that links dest to the blob of src instead of copying'''
+        self.link(self.put_file(src), dest)
+        return dest
+
+    def ingest_tree(self, path):
+        '''Replace every file below path with a link to its blob'''
+        for dirpath, dirnames, filenames in os.walk(path):
+            for filename in filenames:
+                f = pathlib.Path(dirpath) / filename
+                blob = self.put_file(f, reuse_inode=True)
+                if not os.path.samefile(blob, f):
+                    self.link(blob, f)
+
+    def gc(self):
+        '''Remove blobs no cal/cfg folder links to any more. Returns the number of bytes freed
+
+        Unreferenced blobs are found by their link count, so nothing is removed on filesystems without
+        hard links (where blobs are copied into cal folders instead).
+        '''
+        if not self.supports_links():
+            logging.warning(f'{self.root} does not support hard links, skipping blob gc')
+            return 0
+        freed = 0
+        for blob in self.root.glob('*/*'):
+            if blob.name.startswith('.'):
+                continue
+            st = blob.stat()
+            if st.st_nlink == 1:
+                blob.unlink()
+                freed += st.st_size
+        logging.debug(f'blob store gc freed {freed} bytes')
+        return freed
+
+    def supports_links(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        probe = self.root / f'.probe-{os.getpid()}-{threading.get_ident()}'
+        probe.touch()
+        try:
+            os.link(probe, probe.with_name(probe.name + '-link'))
+        except OSError:
+            return False
+        else:
+            os.unlink(probe.with_name(probe.name + '-link'))
+            return True
+        finally:
+            probe.unlink()
+
+def file_digest(path):
+    '''blake2b digest of a file, as put_bytes() computes it for bytes'''
+    h = hashlib.blake2b(digest_size=32)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(2**20), b''):
+            h.update(chunk)
+    return h.hexdigest()
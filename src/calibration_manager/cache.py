@@ -0,0 +1,119 @@
+import collections
+import copy
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+class CalibrationCache:
+    """
+    An in-process LRU cache of parsed cfg.yaml/cal.yaml trees and loaded calibration files
+
+    Entries are keyed on the file path plus its mtime and size, so a file that changed on disk is
+    reloaded and its old entry dropped. Cached values are handed out protected: numpy arrays as
+    read-only views, dataframes and yaml trees as copies, so callers can't corrupt the cache.
+
+    max_bytes: approximate memory limit of the cached values, least recently used entries are evicted
+    max_entries: limit on the number of cached files
+    """
+    def __init__(self, max_bytes: int = 512 * 2**20, max_entries: int = 4096):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict() # key: (value, nbytes)
+        self._keys_by_path = {}
+        self._lock = threading.Lock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, path, loader, variant=None):
+        '''Return the cached value of a file, calling loader(path) on a miss
+
+        variant distinguishes different loads of the same file (e.g. memory-mapped or not)
+        '''
+        st = os.stat(path)
+        key = (str(path), variant, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return protect(entry[0])
+            self.misses += 1
+
+        value = loader(path)
+        nbytes = sizeof(value, st.st_size)
+        if nbytes <= self.max_bytes:
+            with self._lock:
+                self._insert(key, value, nbytes)
+        return protect(value)
+
+    def _insert(self, key, value, nbytes):
+        stale_key = self._keys_by_path.get(key[:2])
+        if stale_key is not None: # the file changed since it was cached
+            self._remove(stale_key)
+        self._entries[key] = (value, nbytes)
+        self._keys_by_path[key[:2]] = key
+        self.nbytes += nbytes
+        while self.nbytes > self.max_bytes or len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.nbytes -= entry[1]
+        if self._keys_by_path.get(key[:2]) == key:
+            del self._keys_by_path[key[:2]]
+
+    def clear(self):
+        '''Drop all entries and reset statistics'''
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_path.clear()
+            self.nbytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        '''Hit/miss statistics and current size of the cache'''
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self.nbytes,
+                'max_bytes': self.max_bytes,
+            }
+
+# shared by all Setups created with cache=True
+calibration_cache = CalibrationCache()
+
+def protect(value):
+    '''Return a view or copy of a cached value that can't modify the cached one'''
+    if isinstance(value, np.ndarray):
+        view = value.view()
+        view.flags.writeable = False
+        return view
+    if isinstance(value, pd.DataFrame):
+        return value.copy()
+    if isinstance(value, dict) and all(isinstance(v, np.ndarray) for v in value.values()):
+        return {k: protect(v) for k, v in value.items()} # arrays of a plain .npz
+    return copy.deepcopy(value)
+
+def sizeof(value, file_size: int):
+    '''Approximate memory held by a cached value'''
+    if isinstance(value, np.memmap):
+        return 0 # backed by the shared page cache, not process memory
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=False).sum())
+    return file_size # parsed yaml trees, roughly the size of the text
@@ -0,0 +1,408 @@
+'''
+Catalog of the setups in a setup storage folder, for listing and searching many setups quickly
+
+    python -m calibration_manager.catalog ~/.ros/setups/ --prefix cell3_ --component camera1
+    python -m calibration_manager.catalog /mnt/fleet_setups --rebuild
+
+Per setup it holds the components, the latest calibration of each (cal id and time) and the size of
+their folders, kept in {storage}/.catalog/ as an index plus a journal:
+
+    index.json              every setup as of the last compaction, with its generation g
+    journal.{g}.jsonl       one line per change since, appended by the saves of any machine
+
+Saving a configuration or calibration appends a line (under a lock kept in .catalog/), so readers
+never walk the setup folders. Once the journal is large it is folded into a new index and generation.
+Saves only update a catalog that exists; the first read of a storage without one builds it with a
+scan, as does rebuild(), e.g. after setups were edited by hand. Storage that can't be written (read-only
+or shared mounts) is scanned into a catalog kept in memory instead.
+
+Setup folders made or deleted outside of Setup (mkdir, cp -r, rm -r) write no journal line. The index
+holds the mtime of the storage folder, which changes whenever an entry is added, removed or renamed
+in it, so a read only lists the top level folders when it changed, scans the added setups and drops
+the removed ones.
+'''
+
+import argparse
+import bisect
+import concurrent.futures
+import json
+import logging
+import os
+import pathlib
+import threading
+import time
+
+from calibration_manager.archive import CalArchive
+from calibration_manager.atomic import locked
+from calibration_manager.timeline import parse_cal_id, scan_cal_ids
+
+CATALOG_DIR = '.catalog'
+INDEX_FILE = 'index.json'
+INDEX_VERSION = 1
+SETUP_FILE = 'setup.yaml'
+COMPACT_BYTES = 2**20
+
+class SetupCatalog:
+    """
+    The catalog of one setup storage folder
+
+    Reads are cached and only pick up the journal lines added since the last one.
+
+    storage: folder holding the setup folders
+    """
+    def __init__(self, storage='~/.ros/setups/'):
+        self.storage = pathlib.Path(storage).expanduser().resolve()
+        self.root = self.storage / CATALOG_DIR
+        self._lock = threading.Lock()
+        self._index_key = None # (inode, mtime, size) of the index read
+        self._generation = None
+        self._dir_mtime_ns = None # of the storage folder, when the catalog last matched its setup folders
+        self._in_memory = False # the storage can't be written, the catalog is kept in memory only
+        self._offset = 0
+        self._setups = {}
+        self._names = []
+
+    def exists(self):
+        return (self.root / INDEX_FILE).is_file()
+
+    def setups(self):
+        '''{name: entry} of every setup, entries like
+        {'name', 'setup_yaml': bool, 'bytes', 'components': {name: {'latest_cal', 'latest_cal_time', 'cfg_bytes', 'cal_bytes'}}}
+        '''
+        with self._lock:
+            if self._in_memory:
+                if self._stat_storage() != self._dir_mtime_ns:
+                    self._catch_up_in_memory()
+                return self._setups
+            for attempt in range(3):
+                try:
+                    self._refresh()
+                    if self._stat_storage() != self._dir_mtime_ns:
+                        self._reconcile_locked()
+                    return self._setups
+                except FileNotFoundError: # missing, or compacted while reading
+                    if not self.exists():
+                        break
+            self._rebuild_locked()
+            return self._setups
+
+    def _refresh(self):
+        st = os.stat(self.root / INDEX_FILE)
+        index_key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if index_key != self._index_key: # new generation, or first read
+            with open(self.root / INDEX_FILE) as f:
+                index = json.load(f)
+            if index.get('version') != INDEX_VERSION:
+                raise FileNotFoundError(f'{self.root / INDEX_FILE} has an unknown version')
+            self._setups = index['setups']
+            self._names = sorted(self._setups)
+            self._generation = index['generation']
+            self._dir_mtime_ns = index.get('dir_mtime_ns')
+            self._offset = 0
+            self._index_key = index_key
+        try:
+            with open(self.root / journal_name(self._generation), 'rb') as f:
+                f.seek(self._offset)
+                data = f.read()
+        except FileNotFoundError: # compacted since the index was read
+            self._index_key = None
+            raise
+        end = data.rfind(b'\n') + 1 # a line still being appended is read next time
+        if end:
+            for line in data[:end].splitlines():
+                apply_change(self._setups, json.loads(line))
+            self._names = sorted(self._setups)
+            self._offset += end
+
+    def _stat_storage(self):
+        return os.stat(self.storage).st_mtime_ns
+
+    def _reconcile_locked(self):
+        '''Catch up with setup folders added or removed without a journal line (caller holds self._lock)'''
+        dir_mtime_ns = self._stat_storage()
+        if set(setup_dir_names(self.storage)) == set(self._setups):
+            self._dir_mtime_ns = dir_mtime_ns # e.g. selected_setup was switched, nothing to record
+            return
+        try:
+            with locked(self.root):
+                self._refresh() # saves may have appended meanwhile
+                # stat before listing, a folder made in between is caught by the next read
+                dir_mtime_ns = self._stat_storage()
+                self._write_locked(self._reconciled(setup_dir_names(self.storage)), dir_mtime_ns)
+        except FileNotFoundError: # catalog removed, see setups()
+            raise
+        except OSError: # read-only storage, catch up in memory only
+            self._catch_up_in_memory()
+
+    def _catch_up_in_memory(self):
+        dir_mtime_ns = self._stat_storage()
+        setups = self._reconciled(setup_dir_names(self.storage))
+        self._setups = setups
+        self._names = sorted(setups)
+        self._dir_mtime_ns = dir_mtime_ns
+
+    def _reconciled(self, names: list, workers: int = 16):
+        '''The catalog's setups with those not in names dropped and the new ones in names scanned'''
+        present = set(names)
+        setups = {name: entry for name, entry in self._setups.items() if name in present}
+        added = [name for name in names if name not in setups]
+        if added:
+            logging.info(f'cataloguing {len(added)} new setups in {self.storage}')
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            for entry in pool.map(lambda name: scan_setup(self.storage / name), added):
+                setups[entry['name']] = entry
+        return setups
+
+    def names(self, prefix: str = ''):
+        '''Sorted setup names starting with prefix'''
+        self.setups()
+        with self._lock:
+            names = self._names
+        start = bisect.bisect_left(names, prefix)
+        end = bisect.bisect_left(names, prefix + '\U0010ffff') if prefix else len(names)
+        return names[start:end]
+
+    def get(self, name: str):
+        return self.setups().get(name)
+
+    def query(self, prefix: str = '', component: str = None, setup_yaml: bool = None,
+              calibrated_after: float = None, calibrated_before: float = None, min_bytes: int = None, max_bytes: int = None):
+        '''Entries of the setups matching every given field, sorted by name
+
+        component: has this component; with calibrated_after/before (epoch seconds) the latest
+        calibration of that component, otherwise of any component, must fall in the range
+        setup_yaml: has (or hasn't) a setup.yaml, i.e. was made with the rqt SetupManager
+        min_bytes/max_bytes: size of the component folders
+        '''
+        setups = self.setups()
+        matches = []
+        for name in self.names(prefix):
+            entry = setups[name]
+            if component is not None and component not in entry['components']:
+                continue
+            if setup_yaml is not None and entry['setup_yaml'] != setup_yaml:
+                continue
+            if min_bytes is not None and entry['bytes'] < min_bytes:
+                continue
+            if max_bytes is not None and entry['bytes'] > max_bytes:
+                continue
+            if calibrated_after is not None or calibrated_before is not None:
+                components = [entry['components'][component]] if component is not None else entry['components'].values()
+                times = [c['latest_cal_time'] for c in components if c['latest_cal_time'] is not None]
+                if not any((calibrated_after is None or t >= calibrated_after) and (calibrated_before is None or t <= calibrated_before)
+                           for t in times):
+                    continue
+            matches.append(entry)
+        return matches
+
+    def record(self, change: dict):
+        '''Append a change to the journal; does nothing if the storage has no catalog'''
+        if not self.root.is_dir():
+            return
+        with locked(self.root):
+            journals = sorted(self.root.glob('journal.*.jsonl'))
+            if not journals:
+                return
+            with open(journals[-1], 'a') as f:
+                f.write(json.dumps(change) + '\n')
+                size = f.tell()
+        if size > COMPACT_BYTES:
+            self.compact()
+
+    def compact(self):
+        '''Fold the journal into a new index'''
+        with self._lock, locked(self.root):
+            self._index_key = None
+            self._refresh()
+            self._write_locked(self._setups, self._dir_mtime_ns)
+
+    def rebuild(self, workers: int = 16):
+        '''Scan every setup folder and replace the catalog
+
+        workers: folders scanned concurrently, shared drives are mostly waiting on latency
+        '''
+        with self._lock:
+            self._rebuild_locked(workers)
+
+    def _rebuild_locked(self, workers: int = 16):
+        t0 = time.perf_counter() # caller holds self._lock
+        try:
+            # make the catalog dir (holding the lock) before the stat, so creating it doesn't invalidate the new index
+            self.root.mkdir(exist_ok=True)
+            with locked(self.root):
+                dir_mtime_ns = self._stat_storage()
+                self._setups = {}
+                self._write_locked(self._reconciled(setup_dir_names(self.storage), workers), dir_mtime_ns)
+            self._in_memory = False
+        except OSError as ex: # read-only or shared storage, list it without writing a catalog
+            logging.info(f'keeping the catalog of {self.storage} in memory, it can not be written: {ex}')
+            self._setups = {}
+            self._catch_up_in_memory()
+            self._in_memory = True
+        logging.info(f'catalogued {len(self._setups)} setups in {self.storage} in {time.perf_counter() - t0:.1f} s')
+
+    def _write_locked(self, setups: dict, dir_mtime_ns: int):
+        '''Write setups as a new generation (caller holds both locks)
+
+        dir_mtime_ns: mtime of the storage folder, stated before its setup folders were listed
+        '''
+        self.root.mkdir(exist_ok=True)
+        old_journals = list(self.root.glob('journal.*.jsonl'))
+        generation = time.time_ns()
+        (self.root / journal_name(generation)).touch()
+        tmp = self.root / f'{INDEX_FILE}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'version': INDEX_VERSION, 'generation': generation, 'dir_mtime_ns': dir_mtime_ns, 'setups': setups}, f)
+        os.replace(tmp, self.root / INDEX_FILE)
+        st = os.stat(self.root / INDEX_FILE)
+        for journal in old_journals:
+            journal.unlink()
+        self._setups = setups
+        self._names = sorted(setups)
+        self._generation = generation
+        self._dir_mtime_ns = dir_mtime_ns
+        self._offset = 0
+        self._index_key = (st.st_ino, st.st_mtime_ns, st.st_size)
+
+_catalogs = {} # storage path: SetupCatalog
+_catalogs_lock = threading.Lock()
+
+def storage_catalog(storage='~/.ros/setups/'):
+    '''The SetupCatalog of a storage folder shared within this process
+
+    Its reads stay incremental: the index is read once, then only new journal lines, and the storage
+    folder is only listed again when its mtime changes from what this catalog last saw.
+    '''
+    storage = pathlib.Path(storage).expanduser().resolve()
+    with _catalogs_lock:
+        if storage not in _catalogs:
+            _catalogs[storage] = SetupCatalog(storage)
+        return _catalogs[storage]
+
+def journal_name(generation: int):
+    return f'journal.{generation}.jsonl'
+
+def setup_dir_names(storage):
+    '''Folders of a setup storage folder, leaving out hidden ones and symlinks like selected_setup'''
+    with os.scandir(storage) as it:
+        return [d.name for d in it if not d.name.startswith('.') and d.is_dir(follow_symlinks=False)]
+
+def new_entry(name: str):
+    return {'name': name, 'setup_yaml': False, 'bytes': 0, 'components': {}}
+
+def new_component_entry():
+    return {'latest_cal': None, 'latest_cal_time': None, 'cfg_bytes': 0, 'cal_bytes': 0}
+
+def apply_change(setups: dict, change: dict):
+    '''Apply one journal line to the {name: entry} dict'''
+    entry = setups.setdefault(change['setup'], new_entry(change['setup']))
+    op = change['op']
+    if op == 'setup':
+        entry['setup_yaml'] = change['setup_yaml']
+        return
+    if op == 'remove':
+        del setups[change['setup']]
+        return
+    cmp = entry['components'].setdefault(change['component'], new_component_entry())
+    if op == 'cfg':
+        cmp['cfg_bytes'] = change['cfg_bytes']
+    elif op == 'cal':
+        if cmp['latest_cal'] is None or parse_cal_id(change['cal_id']) >= (parse_cal_id(cmp['latest_cal']) or 0):
+            cmp['latest_cal'] = change['cal_id']
+            cmp['latest_cal_time'] = parse_cal_id(change['cal_id']) / 1e9
+        cmp['cal_bytes'] += change['cal_bytes']
+    elif op == 'component':
+        cmp.update(change['fields'])
+    entry['bytes'] = sum(c['cfg_bytes'] + c['cal_bytes'] for c in entry['components'].values())
+
+def tree_bytes(path):
+    '''Total size of the files under path, not following symlinks'''
+    total = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, filename)).st_size
+            except OSError: # removed while walking
+                pass
+    return total
+
+def is_component_dir(path):
+    path = pathlib.Path(path)
+    return (path / 'cfg').is_dir() or (path / 'latest').is_symlink() or bool(scan_cal_ids(path))
+
+def scan_component(component_dir):
+    component_dir = pathlib.Path(component_dir)
+    cmp = new_component_entry()
+    latest = component_dir / 'latest'
+    cal_ids = scan_cal_ids(component_dir)
+    if latest.is_symlink():
+        cmp['latest_cal'] = pathlib.Path(os.readlink(latest)).name
+    elif cal_ids:
+        cmp['latest_cal'] = max(cal_ids, key=parse_cal_id)
+    if cmp['latest_cal'] is not None and parse_cal_id(cmp['latest_cal']) is not None:
+        cmp['latest_cal_time'] = parse_cal_id(cmp['latest_cal']) / 1e9
+    cmp['cfg_bytes'] = tree_bytes(component_dir / 'cfg')
+    # cal folders and archive volumes; indexes, staging and extracted archive copies are left out
+    cmp['cal_bytes'] = sum(tree_bytes(component_dir / cal_id) for cal_id in cal_ids) \
+        + sum(volume.stat().st_size for volume in CalArchive(component_dir).volumes())
+    return cmp
+
+def scan_setup(setup_dir):
+    '''Catalog entry of a setup folder, from its files'''
+    setup_dir = pathlib.Path(setup_dir)
+    entry = new_entry(setup_dir.name)
+    entry['setup_yaml'] = (setup_dir / SETUP_FILE).is_file()
+    with os.scandir(setup_dir) as it:
+        for d in it:
+            if not d.name.startswith('.') and d.is_dir(follow_symlinks=False) and is_component_dir(d.path):
+                entry['components'][d.name] = scan_component(d.path)
+    entry['bytes'] = sum(c['cfg_bytes'] + c['cal_bytes'] for c in entry['components'].values())
+    return entry
+
+def _record(setup_dir: pathlib.Path, make_change):
+    # the catalog is an index, failing to update it must not fail the save
+    catalog = SetupCatalog(setup_dir.parent)
+    if not catalog.root.is_dir():
+        return
+    try:
+        catalog.record(dict(make_change(), setup=setup_dir.name))
+    except OSError as ex:
+        logging.warning(f'could not update the setup catalog of {setup_dir.parent}: {ex}')
+
+def record_setup(setup_dir, setup_yaml: bool = None):
+    setup_dir = pathlib.Path(setup_dir).expanduser().resolve()
+    if setup_yaml is None:
+        setup_yaml = (setup_dir / SETUP_FILE).is_file()
+    _record(setup_dir, lambda: {'op': 'setup', 'setup_yaml': setup_yaml})
+
+def record_cfg(setup_dir: pathlib.Path, component_dir: pathlib.Path):
+    _record(setup_dir, lambda: {'op': 'cfg', 'component': component_dir.name, 'cfg_bytes': tree_bytes(component_dir / 'cfg')})
+
+def record_cal(setup_dir: pathlib.Path, cal_dir: pathlib.Path):
+    '''A new calibration was published in cal_dir'''
+    _record(setup_dir, lambda: {'op': 'cal', 'component': cal_dir.parent.name, 'cal_id': cal_dir.name, 'cal_bytes': tree_bytes(cal_dir)})
+
+def record_component(setup_dir: pathlib.Path, component_dir: pathlib.Path):
+    '''Rescan a component, after changes that can't be recorded incrementally (overwrites, pruning)'''
+    _record(setup_dir, lambda: {'op': 'component', 'component': component_dir.name, 'fields': scan_component(component_dir)})
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('storage', nargs='?', default='~/.ros/setups/')
+    parser.add_argument('--rebuild', action='store_true', help='rescan every setup folder')
+    parser.add_argument('--prefix', default='')
+    parser.add_argument('--component', default=None)
+    parser.add_argument('--calibrated-after', type=float, default=None, help='epoch seconds')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    catalog = SetupCatalog(args.storage)
+    if args.rebuild:
+        catalog.rebuild()
+    for entry in catalog.query(args.prefix, component=args.component, calibrated_after=args.calibrated_after):
+        times = [c['latest_cal_time'] for c in entry['components'].values() if c['latest_cal_time'] is not None]
+        latest = time.strftime('%Y-%m-%d %H:%M', time.localtime(max(times))) if times else '-'
+        print(f"{entry['name']:40} {len(entry['components']):4} components  {entry['bytes'] / 2**20:10.1f} MiB  latest cal {latest}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+'''
+Chunked, compressed storage (.npc) for very large calibration arrays
+
+The array is split along its first axis into chunks of about CHUNK_BYTES, compressed on a thread pool
+(the codecs release the GIL) and written one after another, followed by a json index of the chunk
+offsets. Reading a slice only decompresses the chunks it touches, see ChunkedArray.
+
+Layout: chunk data..., index (utf-8 json), index length (uint64 little endian), MAGIC (8 bytes)
+
+Codecs: zstd (zstandard) and lz4 if installed, zlib always; 'auto' picks the first available.
+'''
+
+import collections
+import concurrent.futures
+import json
+import os
+import pathlib
+import struct
+import threading
+import zlib
+
+import numpy as np
+
+try:
+    import zstandard
+    imports_zstd = True
+except ImportError:
+    imports_zstd = False
+
+try:
+    import lz4.block
+    imports_lz4 = True
+except ImportError:
+    imports_lz4 = False
+
+MAGIC = b'CALCHNK1'
+FOOTER = struct.Struct('<Q8s') # index length, MAGIC
+CHUNK_BYTES = 4 * 2**20
+
+_zstd_local = threading.local()
+
+def _zstd_compress(data, level):
+    # compressor objects aren't thread safe, keep one per thread and level
+    compressors = _zstd_local.__dict__.setdefault('compressors', {})
+    if level not in compressors:
+        compressors[level] = zstandard.ZstdCompressor(level=level)
+    return compressors[level].compress(data)
+
+def _zstd_decompress(data, nbytes):
+    if not hasattr(_zstd_local, 'decompressor'):
+        _zstd_local.decompressor = zstandard.ZstdDecompressor()
+    return _zstd_local.decompressor.decompress(data, max_output_size=nbytes)
+
+# name: (compress(data, level), decompress(data, nbytes), default level)
+codecs = {'zlib': (lambda data, level: zlib.compress(data, level), lambda data, nbytes: zlib.decompress(data, bufsize=nbytes), 1)}
+if imports_zstd:
+    codecs['zstd'] = (_zstd_compress, _zstd_decompress, 3)
+if imports_lz4:
+    codecs['lz4'] = (lambda data, level: lz4.block.compress(data, mode='fast', acceleration=level), lambda data, nbytes: lz4.block.decompress(data), 1)
+
+def resolve_codec(codec: str = 'auto'):
+    if codec == 'auto':
+        return next(name for name in ('zstd', 'lz4', 'zlib') if name in codecs)
+    if codec not in codecs:
+        raise ValueError(f'codec {codec} is not available, install it or use one of {list(codecs)}')
+    return codec
+
+def save_chunked(f, arr: np.ndarray, codec: str = 'auto', level: int = None, chunk_bytes: int = CHUNK_BYTES, workers: int = None):
+    '''Write arr to f (a path or binary file) as compressed chunks along the first axis
+
+    workers: compression threads, default one per cpu
+    '''
+    if arr.dtype.hasobject:
+        raise TypeError('object arrays can not be stored chunked, use .npy')
+    codec = resolve_codec(codec)
+    compress, _, default_level = codecs[codec]
+    level = default_level if level is None else level
+    row_bytes = arr.itemsize * int(np.prod(arr.shape[1:])) if arr.ndim else arr.itemsize
+    rows = len(arr) if arr.ndim else 1
+    chunk_rows = max(1, chunk_bytes // max(row_bytes, 1))
+    bounds = [(i, min(i + chunk_rows, rows)) for i in range(0, rows, chunk_rows)] or [(0, 0)]
+
+    def compress_chunk(bound):
+        chunk = arr[bound[0]:bound[1]] if arr.ndim else arr.reshape(1)
+        return compress(np.ascontiguousarray(chunk).reshape(-1).view(np.uint8), level)
+
+    index = {
+        'dtype': np.lib.format.dtype_to_descr(arr.dtype),
+        'shape': list(arr.shape),
+        'codec': codec,
+        'chunk_rows': chunk_rows,
+        'chunks': [], # [offset, compressed size] per chunk
+    }
+    own_file = not hasattr(f, 'write')
+    out = open(f, 'wb') if own_file else f
+    try:
+        offset = 0
+        workers = workers or os.cpu_count() or 1
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            # bounded queue of chunks in flight, so at most ~2*workers compressed chunks are held
+            pending = collections.deque()
+            bounds_iter = iter(bounds)
+            for bound in bounds_iter:
+                pending.append(pool.submit(compress_chunk, bound))
+                if len(pending) >= 2 * workers:
+                    break
+            while pending:
+                data = pending.popleft().result()
+                out.write(data)
+                index['chunks'].append([offset, len(data)])
+                offset += len(data)
+                bound = next(bounds_iter, None)
+                if bound is not None:
+                    pending.append(pool.submit(compress_chunk, bound))
+        index_bytes = json.dumps(index).encode()
+        out.write(index_bytes)
+        out.write(FOOTER.pack(len(index_bytes), MAGIC))
+    finally:
+        if own_file:
+            out.close()
+
+class ChunkedArray:
+    """
+    Read-only array stored in a .npc file, decompressing only the chunks that are accessed
+
+    Indexing (arr[1000:2000], arr[5, :, 3], ...) returns a numpy array and reads just the chunks
+    covering the selected rows of the first axis; np.asarray(arr) or arr.read() load everything.
+
+    source: path of the .npc file, or a bytes-like object holding one
+    workers: decompression threads used for reads spanning several chunks
+    """
+    def __init__(self, source, workers: int = None):
+        if isinstance(source, (str, pathlib.Path)):
+            self.path = pathlib.Path(source)
+            self._buffer = None
+            size = self.path.stat().st_size
+        else:
+            self.path = None
+            self._buffer = memoryview(source)
+            size = len(self._buffer)
+        self.workers = workers or os.cpu_count() or 1
+        index_length, magic = FOOTER.unpack(self._read_at(size - FOOTER.size, FOOTER.size))
+        if magic != MAGIC:
+            raise ValueError(f'{source} is not a chunked array')
+        index = json.loads(bytes(self._read_at(size - FOOTER.size - index_length, index_length)))
+        self.dtype = np.lib.format.descr_to_dtype(index['dtype'])
+        self.shape = tuple(index['shape'])
+        self.codec = index['codec']
+        self.chunk_rows = index['chunk_rows']
+        self.chunks = index['chunks']
+        if self.codec not in codecs:
+            raise ValueError(f'{source} is compressed with {self.codec}, which is not installed')
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    @property
+    def nbytes(self):
+        return self.size * self.dtype.itemsize
+
+    def __len__(self):
+        if not self.shape:
+            raise TypeError('len() of unsized object')
+        return self.shape[0]
+
+    def __repr__(self):
+        return f'ChunkedArray(shape={self.shape}, dtype={self.dtype}, codec={self.codec}, chunks={len(self.chunks)})'
+
+    def _read_at(self, offset: int, size: int):
+        if self._buffer is not None:
+            return self._buffer[offset:offset + size]
+        with open(self.path, 'rb') as f: # a handle per read, so threads don't share a file position
+            f.seek(offset)
+            return f.read(size)
+
+    def _chunk(self, i: int):
+        offset, size = self.chunks[i]
+        rows = min(self.chunk_rows, self.shape[0] - i * self.chunk_rows) if self.shape else 1
+        chunk_shape = (rows,) + self.shape[1:] if self.shape else (1,)
+        nbytes = int(np.prod(chunk_shape)) * self.dtype.itemsize
+        data = codecs[self.codec][1](self._read_at(offset, size), nbytes)
+        return np.frombuffer(data, dtype=self.dtype, count=int(np.prod(chunk_shape))).reshape(chunk_shape)
+
+    def _rows(self, start: int, stop: int):
+        '''Rows start:stop of the first axis, decompressing the chunks concurrently'''
+        out = np.empty((stop - start,) + self.shape[1:], dtype=self.dtype)
+        if stop <= start:
+            return out
+        first, last = start // self.chunk_rows, (stop - 1) // self.chunk_rows
+
+        def fill(i):
+            chunk_start = i * self.chunk_rows
+            lo, hi = max(start, chunk_start), min(stop, chunk_start + self.chunk_rows)
+            out[lo - start:hi - start] = self._chunk(i)[lo - chunk_start:hi - chunk_start]
+
+        if first == last or self.workers == 1:
+            for i in range(first, last + 1):
+                fill(i)
+        else:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.workers, last - first + 1)) as pool:
+                list(pool.map(fill, range(first, last + 1)))
+        return out
+
+    def read(self):
+        '''Load the whole array'''
+        if not self.shape:
+            return self._chunk(0).reshape(())
+        return self._rows(0, self.shape[0])
+
+    def __array__(self, dtype=None, copy=None):
+        arr = self.read()
+        return arr if dtype is None else arr.astype(dtype, copy=False)
+
+    def __getitem__(self, key):
+        if not self.shape:
+            return self.read()[key]
+        key = key if isinstance(key, tuple) else (key,)
+        first, rest = (key[0], key[1:]) if key else (slice(None), ())
+        if first is Ellipsis or first is None or not isinstance(first, (int, np.integer, slice)):
+            return self.read()[key] # fancy/boolean indexing on the first axis, load all
+        if isinstance(first, slice):
+            start, stop, step = first.indices(self.shape[0])
+            if step < 0:
+                lo, hi = (stop + 1, start + 1) if stop < start else (0, 0)
+                return self._rows(lo, hi)[::step][(slice(None),) + rest]
+            return self._rows(start, max(start, stop))[(slice(None, None, step),) + rest]
+        i = int(first) + self.shape[0] if first < 0 else int(first)
+        if not 0 <= i < self.shape[0]:
+            raise IndexError(f'index {first} is out of bounds for axis 0 with size {self.shape[0]}')
+        return self._rows(i, i + 1)[(0,) + rest]
+
+    def __copy__(self):
+        return self # read-only, safe to share
+
+    def __deepcopy__(self, memo):
+        return self
+
+def load_chunked(f, mmap_mode: str = None):
+    '''Load a .npc file (path or binary file object)
+
+    With an mmap_mode the data stays on disk as a ChunkedArray that reads only the chunks accessed,
+    otherwise the whole array is decompressed into memory.
+    '''
+    arr = ChunkedArray(f if isinstance(f, (str, pathlib.Path)) else f.read())
+    return arr if mmap_mode is not None else arr.read()
@@ -0,0 +1,86 @@
+'''
+Fast yaml reading and writing for large cfg/cal trees
+
+The default round-trip mode (ruamel) keeps comments and key order so hand-edited files survive a
+load/save, but parses in pure python and returns CommentedMaps. The fast mode parses with libyaml
+(PyYAML's CSafeLoader, which ROS installs anyway) into plain dicts and lists, falling back to ruamel's
+safe loader without PyYAML; writes use libyaml too, or ruamel's round-trip dumper. Comments are
+dropped in fast mode, so cfgs edited by hand should be saved in round-trip mode.
+
+Both modes resolve plain scalars by the YAML 1.2 core rules ruamel uses (PyYAML alone follows YAML 1.1,
+where on/no are bools, 010 is octal and 1:30 is sexagesimal), so a file reads the same in either mode.
+The fast dumper quotes strings that either version would take for another type.
+'''
+
+import threading
+
+from ruamel.yaml import YAML
+from ruamel.yaml.resolver import implicit_resolvers
+
+try:
+    import yaml as pyyaml
+    imports_pyyaml = True
+except ImportError:
+    imports_pyyaml = False
+
+YAML_MODES = ('rt', 'fast')
+
+# ruamel's YAML 1.2 resolvers, without the value tag ('=') PyYAML has no constructor for
+YAML_12_RESOLVERS = [(tag, regexp, first) for versions, tag, regexp, first in implicit_resolvers
+                     if (1, 2) in versions and tag != 'tag:yaml.org,2002:value']
+
+def construct_yaml_12_int(loader, node):
+    '''Ints by YAML 1.2 rules: 0o for octal, a leading 0 is decimal'''
+    value = loader.construct_scalar(node).replace('_', '')
+    sign = -1 if value[0] == '-' else 1
+    value = value.lstrip('+-')
+    for prefix, base in (('0b', 2), ('0o', 8), ('0x', 16)):
+        if value.startswith(prefix):
+            return sign * int(value[2:], base)
+    return sign * int(value)
+
+if imports_pyyaml:
+    class Loader(getattr(pyyaml, 'CSafeLoader', pyyaml.SafeLoader)):
+        """libyaml safe loader resolving plain scalars by YAML 1.2 rules"""
+        yaml_implicit_resolvers = {}
+
+    for tag, regexp, first in YAML_12_RESOLVERS:
+        Loader.add_implicit_resolver(tag, regexp, first)
+    Loader.add_constructor('tag:yaml.org,2002:int', construct_yaml_12_int)
+
+    class Dumper(getattr(pyyaml, 'CSafeDumper', pyyaml.SafeDumper)):
+        """Safe dumper that also accepts subclasses of the plain types (CommentedMap, LazyDict, ScalarFloat...)
+
+        Resolves by YAML 1.1 and 1.2 rules, so strings looking like a scalar of either are quoted.
+        """
+
+    for tag, regexp, first in YAML_12_RESOLVERS:
+        Dumper.add_implicit_resolver(tag, regexp, first)
+
+    for base, represent in ((dict, Dumper.represent_dict), (list, Dumper.represent_list),
+                            (bool, Dumper.represent_bool), (int, Dumper.represent_int),
+                            (float, Dumper.represent_float), (str, Dumper.represent_str)):
+        Dumper.add_multi_representer(base, represent)
+
+_local = threading.local()
+
+def ruamel_yaml(typ: str):
+    '''Per-thread ruamel YAML instance of a type, used when PyYAML is not installed'''
+    if not hasattr(_local, typ):
+        setattr(_local, typ, YAML(typ=typ))
+    return getattr(_local, typ)
+
+def load(f):
+    '''Parse the yaml file at path f into plain python types'''
+    with open(f, 'rb') as stream:
+        if imports_pyyaml:
+            return pyyaml.load(stream, Loader=Loader)
+        return ruamel_yaml('safe').load(stream)
+
+def dump(data, f):
+    '''Write data to the yaml file at path f, block style and in insertion order'''
+    with open(f, 'w') as stream:
+        if imports_pyyaml:
+            pyyaml.dump(data, stream, Dumper=Dumper, default_flow_style=False, sort_keys=False, allow_unicode=True)
+        else: # the safe dumper rejects dict subclasses
+            ruamel_yaml('rt').dump(data, stream)
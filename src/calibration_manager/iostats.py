@@ -0,0 +1,202 @@
+'''
+Opt-in timing of Setup I/O: per component and phase durations and bytes, exportable as a Chrome trace
+
+Setup(stats=True) activates an IOStats around each component it loads or saves; the functions doing
+the I/O open a span() for their phase (yaml_load, load.npy, copy_cfg, fsync, param_upload, ...).
+Without an active IOStats a span is a shared no-op, so uninstrumented setups pay one context lookup.
+'''
+
+import collections
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+
+_active = contextvars.ContextVar('calibration_manager_iostats', default=None) # (IOStats, component name)
+
+Event = collections.namedtuple('Event', 'phase component start_ns duration_ns nbytes path thread')
+
+class IOStats:
+    """
+    A record of timed I/O operations, queryable by component and phase
+
+    Events are kept in memory as (phase, component, start_ns, duration_ns, nbytes, path, thread), the
+    most recent max_events of them, so stats left on in a long running node stay bounded. Totals per
+    component and phase are counted separately and cover every event since the last clear().
+    Spans nest, e.g. load_component contains the yaml_load and load.npy spans of that component, so
+    only sum leaf phases (or use summary()) when totalling time.
+
+    max_events: raw events kept for slowest() and the Chrome trace, None for no limit
+    """
+    GROUPS = ('component', 'phase')
+
+    def __init__(self, max_events: int = 100_000):
+        self.max_events = max_events
+        self.events = collections.deque(maxlen=max_events)
+        self._totals = {} # (component, phase): {'count', 'seconds', 'bytes'}
+        self._lock = threading.Lock()
+        self._origin_ns = time.perf_counter_ns()
+        self._thread_names = {}
+
+    @contextlib.contextmanager
+    def activate(self, component: str = None):
+        '''Record spans opened in this context (thread/task) under component'''
+        token = _active.set((self, component))
+        try:
+            yield self
+        finally:
+            _active.reset(token)
+
+    def record(self, phase: str, component: str, start_ns: int, duration_ns: int, nbytes: int = 0, path=None):
+        thread = threading.current_thread()
+        with self._lock:
+            self._thread_names.setdefault(thread.ident, thread.name)
+            self.events.append(Event(phase, component, start_ns, duration_ns, nbytes, None if path is None else str(path), thread.ident))
+            add_to_total(self._totals.setdefault((component, phase), new_total()), duration_ns, nbytes)
+
+    def summary(self, by: tuple = ('component', 'phase')):
+        '''Totals per group of events, {key: {'count', 'seconds', 'bytes'}}
+
+        by: event fields to group on, e.g. ('phase',); the key is a tuple of their values. Grouping on
+        component and phase covers every event, on other fields (path, thread) only the kept events.
+        '''
+        totals = {}
+        if set(by) <= set(self.GROUPS):
+            with self._lock:
+                groups = [(dict(zip(self.GROUPS, group)), dict(total)) for group, total in self._totals.items()]
+            for fields, group_total in groups:
+                total = totals.setdefault(tuple(fields[field] for field in by), new_total())
+                for name in total:
+                    total[name] += group_total[name]
+            return totals
+        with self._lock:
+            events = list(self.events)
+        for event in events:
+            key = tuple(getattr(event, field) for field in by)
+            add_to_total(totals.setdefault(key, new_total()), event.duration_ns, event.nbytes)
+        return totals
+
+    def by_phase(self):
+        return {key[0]: total for key, total in self.summary(('phase',)).items()}
+
+    def by_component(self, phase: str = 'load_component'):
+        '''Totals of one phase per component, by default the whole load of each'''
+        return {key[0]: total for key, total in self.summary(('component', 'phase')).items() if key[1] == phase}
+
+    def slowest(self, n: int = 10, phase: str = None):
+        '''The n longest events, of one phase if given'''
+        with self._lock:
+            events = [e for e in self.events if phase is None or e.phase == phase]
+        return sorted(events, key=lambda e: e.duration_ns, reverse=True)[:n]
+
+    def report(self):
+        '''Per phase totals as a printable table'''
+        lines = [f'{"phase":<20}{"count":>8}{"seconds":>12}{"MB":>12}']
+        for phase, total in sorted(self.by_phase().items(), key=lambda item: -item[1]['seconds']):
+            lines.append(f'{phase:<20}{total["count"]:>8}{total["seconds"]:>12.4f}{total["bytes"] / 1e6:>12.3f}')
+        return '\n'.join(lines)
+
+    def to_chrome_trace(self, path=None):
+        '''Events in Chrome trace event format (chrome://tracing, ui.perfetto.dev), written to path if given'''
+        pid = os.getpid()
+        with self._lock:
+            events = list(self.events)
+            thread_names = dict(self._thread_names)
+        trace = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                 for tid, name in thread_names.items()]
+        for event in events:
+            args = {'bytes': event.nbytes}
+            if event.path is not None:
+                args['path'] = event.path
+            trace.append({
+                'name': event.phase if event.component is None else f'{event.phase} {event.component}',
+                'cat': event.phase,
+                'ph': 'X',
+                'ts': (event.start_ns - self._origin_ns) / 1e3,
+                'dur': event.duration_ns / 1e3,
+                'pid': pid,
+                'tid': event.thread,
+                'args': args,
+            })
+        trace = {'traceEvents': trace, 'displayTimeUnit': 'ms'}
+        if path is not None:
+            with open(path, 'w') as f:
+                json.dump(trace, f)
+        return trace
+
+    def clear(self):
+        with self._lock:
+            self.events.clear()
+            self._totals = {}
+
+def new_total():
+    return {'count': 0, 'seconds': 0.0, 'bytes': 0}
+
+def add_to_total(total: dict, duration_ns: int, nbytes: int):
+    total['count'] += 1
+    total['seconds'] += duration_ns / 1e9
+    total['bytes'] += nbytes
+
+class Span:
+    """
+    Times one operation of the active IOStats; set nbytes inside the block if path doesn't tell the size
+    """
+    __slots__ = ('stats', 'component', 'phase', 'path', 'nbytes', 'start_ns')
+
+    def __init__(self, stats: IOStats, component: str, phase: str, path=None, nbytes: int = None):
+        self.stats = stats
+        self.component = component
+        self.phase = phase
+        self.path = path
+        self.nbytes = nbytes
+
+    def __enter__(self):
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        duration_ns = time.perf_counter_ns() - self.start_ns
+        if self.nbytes is None:
+            self.nbytes = file_size(self.path)
+        self.stats.record(self.phase, self.component, self.start_ns, duration_ns, self.nbytes, self.path)
+
+class NullSpan:
+    """Stand-in for Span when nothing is recording"""
+    nbytes = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def __setattr__(self, name, value):
+        pass # ignore nbytes
+
+_null_span = NullSpan()
+
+def span(phase: str, path=None, nbytes: int = None):
+    '''Time a block as phase of the active IOStats (a no-op if there is none)
+
+    The bytes of the event are nbytes, or the size of the file at path after the block.
+    '''
+    active = _active.get()
+    if active is None:
+        return _null_span
+    return Span(active[0], active[1], phase, path, nbytes)
+
+def activate(stats: IOStats, component: str = None):
+    '''stats.activate(component), or a no-op context if stats is None'''
+    if stats is None:
+        return contextlib.nullcontext()
+    return stats.activate(component)
+
+def file_size(path):
+    if path is None:
+        return 0
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        return 0
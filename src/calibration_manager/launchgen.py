@@ -0,0 +1,150 @@
+'''
+Generate the launch files of setups from their setup.yaml, without ros or a display
+
+    python -m calibration_manager.launchgen ~/.ros/setups/my_machine ~/.ros/setups/other_machine
+    python -m calibration_manager.launchgen --storage /mnt/fleet_setups --check
+
+Each setup gets drivers.launch (the enabled drivers, included by setup_interface.launch),
+services.launch (the enabled services) and routine_{component_name}.launch per enabled routine. They
+sit next to setup.yaml rather than in a subfolder, which load() would take for a component.
+Files are only rewritten when their content changes, so the check mode can tell CI which setups
+are out of date. The rqt SetupManager writes its launch files through the same functions.
+'''
+
+import argparse
+import concurrent.futures
+import logging
+import os
+import pathlib
+import sys
+from xml.etree import ElementTree
+
+SETUP_FILE = 'setup.yaml'
+DRIVERS_LAUNCH = 'drivers.launch'
+SERVICES_LAUNCH = 'services.launch'
+ROUTINE_PREFIX = 'routine_'
+
+def include_component(parent: ElementTree.Element, cmp: dict):
+    '''Add the include of a component (in its group namespace, if any) to a launch element'''
+    el = parent
+    if cmp.get('group_name') not in (None, ''):
+        el = ElementTree.SubElement(parent, 'group')
+        el.attrib['ns'] = cmp['group_name']
+    cmp_child = ElementTree.SubElement(el, 'include')
+    cmp_child.attrib['file'] = f"$(find {cmp['component_package']})/{cmp['component_launch_file']}"
+    for arg_name, arg_val in (cmp.get('args') or {}).items():
+        arg_child = ElementTree.SubElement(cmp_child, 'arg')
+        arg_child.attrib['name'] = str(arg_name)
+        arg_child.attrib['default'] = '' if arg_val is None else str(arg_val)
+    return cmp_child
+
+def components_launch(components: list):
+    '''A <launch> element including each of components'''
+    root = ElementTree.Element('launch')
+    for cmp in components:
+        include_component(root, cmp)
+    return root
+
+def launch_to_string(root: ElementTree.Element):
+    if hasattr(ElementTree, 'indent'): # python >= 3.9
+        ElementTree.indent(root, space='  ')
+    return ElementTree.tostring(root, encoding='unicode') + '\n'
+
+def write_if_changed(path: pathlib.Path, content: str, check: bool = False):
+    '''Write content to path atomically unless it already holds it. Returns True if it differed'''
+    try:
+        if path.read_text() == content:
+            return False
+    except FileNotFoundError:
+        pass
+    if not check:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+        tmp.write_text(content)
+        os.replace(tmp, path)
+    return True
+
+def enabled_components(setup: dict, component_type: str):
+    return [cmp for cmp in setup.get('components') or []
+            if cmp.get('component_type', 'driver') == component_type and cmp.get('enabled', True)]
+
+def launch_files(setup: dict):
+    '''{relative path: content} of every launch file generated for a setup dict'''
+    files = {
+        DRIVERS_LAUNCH: launch_to_string(components_launch(enabled_components(setup, 'driver'))),
+        SERVICES_LAUNCH: launch_to_string(components_launch(enabled_components(setup, 'service'))),
+    }
+    for cmp in enabled_components(setup, 'routine'):
+        files[f"{ROUTINE_PREFIX}{cmp['component_name']}.launch"] = launch_to_string(components_launch([cmp]))
+    return files
+
+def write_launch_files(setup: dict, setup_dir, check: bool = False):
+    '''Write the launch files of a setup dict into setup_dir, returns the relative paths that changed
+
+    Routine launch files of routines no longer in the setup are removed.
+    check: only report what would change, write nothing
+    '''
+    setup_dir = pathlib.Path(setup_dir).expanduser()
+    files = launch_files(setup)
+    changed = [name for name, content in files.items() if write_if_changed(setup_dir / name, content, check)]
+    for f in sorted(setup_dir.glob(f'{ROUTINE_PREFIX}*.launch')):
+        if f.name not in files:
+            changed.append(f.name)
+            if not check:
+                f.unlink()
+    return changed
+
+def read_setup(setup_dir, yaml_mode: str = 'rt'):
+    from calibration_manager.manager import load_yaml
+    setup = load_yaml(pathlib.Path(setup_dir).expanduser() / SETUP_FILE, mode=yaml_mode)
+    return {} if setup is None else setup
+
+def generate(setup_dir, check: bool = False, yaml_mode: str = 'rt'):
+    '''Regenerate the launch files of the setup in setup_dir from its setup.yaml'''
+    return write_launch_files(read_setup(setup_dir, yaml_mode), setup_dir, check)
+
+def find_setups(storage):
+    '''Setup folders (holding a setup.yaml) in a setup storage folder, skipping symlinks like selected_setup'''
+    storage = pathlib.Path(storage).expanduser()
+    return sorted(f for f in storage.iterdir() if not f.is_symlink() and (f / SETUP_FILE).is_file())
+
+def generate_all(setup_dirs: list, check: bool = False, yaml_mode: str = 'rt', workers: int = None):
+    '''Regenerate many setups in parallel processes
+
+    Returns {setup_dir: changed relative paths, or the exception that setup raised}
+    '''
+    results = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(generate, setup_dir, check, yaml_mode): setup_dir for setup_dir in setup_dirs}
+        for future in concurrent.futures.as_completed(futures):
+            setup_dir = futures[future]
+            try:
+                results[setup_dir] = future.result()
+            except Exception as ex:
+                logging.error(f'{setup_dir}: {ex!r}')
+                results[setup_dir] = ex
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('setup_dirs', nargs='*')
+    parser.add_argument('--storage', action='append', default=[], help='also process every setup in this folder')
+    parser.add_argument('--check', action='store_true', help='write nothing, exit 1 if any launch file is out of date')
+    parser.add_argument('--workers', type=int, default=None, help='processes, default one per cpu')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    setup_dirs = [pathlib.Path(d).expanduser() for d in args.setup_dirs]
+    for storage in args.storage:
+        setup_dirs.extend(find_setups(storage))
+    results = generate_all(setup_dirs, check=args.check, workers=args.workers)
+    failed = [d for d, r in results.items() if isinstance(r, Exception)]
+    stale = [d for d, r in results.items() if not isinstance(r, Exception) and r]
+    for setup_dir in sorted(stale):
+        print(f'{setup_dir}: {"out of date" if args.check else "wrote"} {", ".join(results[setup_dir])}')
+    print(f'{len(setup_dirs)} setups, {len(stale)} {"out of date" if args.check else "updated"}, {len(failed)} failed')
+    if failed or (args.check and stale):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+'''
+Persistent index of the launch files in ros packages, used by the rqt SetupManager to offer components
+
+Walking every package for *.launch files takes tens of seconds on large workspaces, so the result is
+kept in a json file with the mtime of every directory walked. A directory's mtime changes whenever an
+entry is added, removed or renamed in it, so a package whose directories all still have their
+recorded mtimes holds the same launch files and is not walked again.
+
+LaunchSignatures parses the args a launch file declares and follows its includes, caching each file
+until it changes, so adding components stays instant for large launch hierarchies.
+'''
+
+import json
+import logging
+import os
+import pathlib
+import re
+import threading
+from xml.etree import ElementTree
+
+INDEX_PATH = '~/.ros/calibration_manager/launch_index.json'
+INDEX_VERSION = 1
+
+class LaunchIndex:
+    """
+    Launch files per package, cached on disk
+
+    path: json file the index is kept in, None to keep it in memory only
+    """
+    def __init__(self, path=INDEX_PATH):
+        self.path = None if path is None else pathlib.Path(path).expanduser()
+        self.packages = {} # package path: {'package': name, 'dirs': {dir: mtime_ns}, 'launch_files': [...]}
+        self.read()
+
+    def read(self):
+        if self.path is None:
+            return
+        try:
+            with open(self.path) as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as ex:
+            logging.warning(f'ignoring unreadable launch file index {self.path}: {ex}')
+            return
+        if index.get('version') == INDEX_VERSION:
+            self.packages = index['packages']
+
+    def write(self):
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f'{self.path.name}.{os.getpid()}.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({'version': INDEX_VERSION, 'packages': self.packages}, f)
+        os.replace(tmp, self.path)
+
+    def is_current(self, package: str, package_path: str):
+        '''True if the indexed launch files of package_path are still valid'''
+        entry = self.packages.get(package_path)
+        if entry is None or entry['package'] != package:
+            return False
+        try:
+            return all(os.stat(d).st_mtime_ns == mtime for d, mtime in entry['dirs'].items())
+        except OSError: # directory removed
+            return False
+
+    def scan(self, package: str, package_path: str):
+        '''Walk a package for launch files and record it in the index
+
+        Symlinked directories are followed, each real directory is walked once so link cycles end.
+        '''
+        dirs = {}
+        launch_files = []
+        walked = set()
+        for dirpath, dirnames, filenames in os.walk(package_path, onerror=lambda ex: None, followlinks=True):
+            real = os.path.realpath(dirpath)
+            if real in walked:
+                dirnames.clear()
+                continue
+            walked.add(real)
+            try:
+                dirs[dirpath] = os.stat(dirpath).st_mtime_ns
+            except OSError:
+                continue
+            dirnames.sort()
+            launch_files.extend(os.path.join(dirpath, f) for f in sorted(filenames) if f.endswith('.launch'))
+        self.packages[package_path] = {'package': package, 'dirs': dirs, 'launch_files': launch_files}
+        return launch_files
+
+    def update(self, packages: dict):
+        '''Bring the index up to date with packages ({name: path}), walking only the changed ones
+
+        Yields (package, package_path, launch_files, rescanned) per package: the unchanged packages
+        first, so callers get most results immediately, then the rescanned ones. Packages no longer
+        listed are dropped from the index.
+        '''
+        packages = {str(path): name for name, path in packages.items()}
+        for stale in set(self.packages) - set(packages):
+            del self.packages[stale]
+        changed = []
+        for package_path, package in packages.items():
+            if self.is_current(package, package_path):
+                yield package, package_path, self.packages[package_path]['launch_files'], False
+            else:
+                changed.append(package_path)
+        for package_path in changed:
+            package = packages[package_path]
+            yield package, package_path, self.scan(package, package_path), True
+
+    def launch_files_info(self):
+        '''[{'package', 'package_path', 'launch_path'}] of every indexed launch file'''
+        return [launch_file_info(entry['package'], package_path, lf)
+                for package_path, entry in self.packages.items() for lf in entry['launch_files']]
+
+def launch_file_info(package: str, package_path: str, launch_path: str):
+    return {'package': package, 'package_path': pathlib.Path(package_path), 'launch_path': launch_path}
+
+class LaunchSignatures:
+    """
+    Parsed argument signatures of launch files, cached until the file changes
+
+    signature(path) gives the args a launch file declares ({name: default, None if required}, args
+    with a fixed value or a computed default left out) and the files it includes, resolved where
+    possible; includes(path) follows them recursively.
+
+    find: function giving the path of a package, for resolving $(find pkg) in include paths
+    """
+    def __init__(self, find=None):
+        self.find = find
+        self._signatures = {} # path: ((mtime_ns, size), signature)
+        self._lock = threading.Lock()
+
+    def signature(self, launch_path):
+        '''{'args': {name: default}, 'includes': [resolved paths], 'unresolved': [include file attributes]}'''
+        launch_path = str(launch_path)
+        st = os.stat(launch_path)
+        key = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            cached = self._signatures.get(launch_path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        signature = self.parse(launch_path)
+        with self._lock:
+            self._signatures[launch_path] = (key, signature)
+        return signature
+
+    def parse(self, launch_path: str):
+        signature = {'args': {}, 'includes': [], 'unresolved': []}
+        try:
+            root = ElementTree.parse(launch_path).getroot()
+        except ElementTree.ParseError as ex:
+            logging.warning(f'could not parse launch file {launch_path}: {ex}')
+            return signature
+
+        def visit(el):
+            for child in el:
+                if child.tag == 'arg':
+                    if 'value' in child.attrib:
+                        continue # TODO: show but make uneditable?
+                    default = child.attrib.get('default')
+                    if default is not None and '$' in default: # filters out calculated params
+                        continue
+                    signature['args'][child.attrib['name']] = default
+                elif child.tag == 'include':
+                    included = self.resolve(child.attrib.get('file', ''), launch_path)
+                    if included is None:
+                        signature['unresolved'].append(child.attrib.get('file', ''))
+                    else:
+                        signature['includes'].append(included)
+                elif child.tag == 'group':
+                    visit(child)
+
+        visit(root)
+        return signature
+
+    def resolve(self, file_attr: str, launch_path: str):
+        '''Path of an include's file attribute, None if it depends on args, env or unknown packages'''
+        path = file_attr.replace('$(dirname)', os.path.dirname(launch_path))
+        m = re.match(r'^\$\(find ([^)\s]+)\)', path)
+        if m is not None:
+            if self.find is None:
+                return None
+            try:
+                package_path = self.find(m[1])
+            except Exception: # rospkg raises ResourceNotFound
+                return None
+            if package_path is None:
+                return None
+            path = str(package_path) + path[m.end():]
+        if '$(' in path:
+            return None
+        return os.path.normpath(os.path.join(os.path.dirname(launch_path), path))
+
+    def includes(self, launch_path):
+        '''Every file included by launch_path, recursively, in depth first order (each once)'''
+        found = []
+        seen = {str(launch_path)}
+        stack = [str(launch_path)]
+        while stack:
+            path = stack.pop()
+            try:
+                children = self.signature(path)['includes']
+            except OSError: # included file missing
+                continue
+            for child in reversed(children):
+                if child not in seen:
+                    seen.add(child)
+                    stack.append(child)
+            if path != str(launch_path):
+                found.append(path)
+        return found
@@ -0,0 +1,75 @@
+import pathlib
+import threading
+
+class LazyFile:
+    """
+    A proxy for a file referenced in a cfg.yaml/cal.yaml, read on first use and cached
+
+    path: pathlib.Path of the referenced file
+    loader: callable taking the path and returning the loaded value
+    """
+    def __init__(self, path: pathlib.Path, loader):
+        self.path = pathlib.Path(path)
+        self.loader = loader
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._value = None
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def load(self):
+        '''Read the file (once) and return its value'''
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._value = self.loader(self.path)
+                    self._loaded = True
+        return self._value
+
+    def __repr__(self):
+        state = 'loaded' if self._loaded else 'not loaded'
+        return f'LazyFile({str(self.path)!r}, {state})'
+
+class LazyDict(dict):
+    """
+    A dict that resolves LazyFile values into the loaded value when they are accessed
+
+    Resolved values replace the proxy in the dict, so each file is read at most once. Iterating
+    items()/values(), or unpacking with **, resolves every file in that level.
+    """
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        if isinstance(value, LazyFile):
+            value = value.load()
+            super().__setitem__(key, value)
+        return value
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def pop(self, key, *default):
+        value = super().pop(key, *default)
+        if isinstance(value, LazyFile):
+            value = value.load()
+        return value
+
+    def __iter__(self):
+        # overriding __iter__ makes ** unpacking go through keys()/__getitem__ instead of the dict fast path
+        return super().__iter__()
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def copy(self):
+        return LazyDict(super().copy())
+
+    def materialize(self):
+        '''Resolve every lazy value (recursively) and return a plain dict'''
+        return {k: (v.materialize() if isinstance(v, LazyDict) else v) for k, v in self.items()}
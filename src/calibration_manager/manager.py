@@ -4,16 +4,57 @@ from ruamel.yaml import YAML; yaml=YAML()
 import time
 import logging
 import pandas as pd
+import os
 import pathlib
 import shutil
-import json
-
-try:
-    import rospy
-    import rosgraph
-    imports_ros = True
-except:
-    imports_ros = False
+import threading
+import concurrent.futures
+import asyncio
+import errno
+import functools
+import io
+
+from calibration_manager.archive import ARCHIVE_DIR, CalArchive
+from calibration_manager.atomic import STAGING_DIR, fsync_dir, fsync_tree, locked, make_staging_dir, replace_files, swap_symlink
+from calibration_manager.blobstore import BLOB_DIR, BlobStore
+from calibration_manager.cache import CalibrationCache, calibration_cache
+from calibration_manager.chunked import load_chunked, save_chunked
+from calibration_manager.iostats import IOStats
+from calibration_manager.lazy import LazyDict, LazyFile
+from calibration_manager import catalog, fastyaml, iostats, paramsync, retention, snapshot
+from calibration_manager.paramsync import ParamSync
+from calibration_manager.tables import resolve_table_format, table_loaders
+from calibration_manager.timeline import Timeline, new_cal_id, parse_cal_id
+from calibration_manager.watcher import SetupWatcher
+from calibration_manager.writer import AsyncCalWriter
+
+yaml.representer.add_representer(LazyDict, lambda representer, d: representer.represent_dict(d))
+
+_yaml_local = threading.local()
+
+LOAD_ATTEMPTS = 3 # a pruned calibration is loaded again from the archive, see Setup._load_tree
+
+def thread_yaml():
+    '''The YAML instance of the calling thread (ruamel YAML instances aren't thread safe)'''
+    if not hasattr(_yaml_local, 'yaml'):
+        _yaml_local.yaml = YAML()
+    return _yaml_local.yaml
+
+def instrumented(phase: str, per_component: bool = True):
+    '''Setup method decorator timing calls as phase of self.stats (if enabled, see iostats.py)
+
+    If per_component, the method's first argument is the component name the I/O inside is recorded under.
+    '''
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if self.stats is None:
+                return method(self, *args, **kwargs)
+            component_name = (args[0] if args else kwargs.get('component_name')) if per_component else None
+            with self.stats.activate(component_name), iostats.span(phase, nbytes=0):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
 
 class Setup:
     """
@@ -28,22 +69,66 @@ class Setup:
     (~/.ros/setups/, /networkdrive/setups/, etc), 
     or a stored backup of the calibration ({build_name}/SCOPS/cal/)
 
+    lazy: if True, referenced arrays/dataframes are only read from disk when first accessed
+    mmap_mode: numpy mmap mode for loading arrays, e.g. 'r' to share read-only pages between processes
+    table_format: file format dataframes are saved in, csv (default), parquet, feather, npz or auto
+    cache: True to reuse unchanged files loaded by any Setup in this process (see cache.py), or a
+    CalibrationCache instance to use instead of the shared one
+    fsync: flush saved calibrations to disk before publishing them; disable for speed when losing
+    the most recent calibrations on power loss is acceptable (writes stay atomic either way)
+    dedup: store calibration files once per distinct content in {setup_dir}/.blobs/ and hard link them
+    into the cal folders, so unchanged arrays and cfg copies aren't rewritten on every calibration
+    param_sync: ParamSync used to upload ros params, defaults to the one shared by the process (pass
+    one with a FakeParamServer client to test uploads without a roscore)
+    yaml_mode: 'rt' (default) round-trips cfg.yaml/cal.yaml keeping comments, 'fast' parses and writes
+    them with libyaml into plain dicts, several times faster on large trees (see fastyaml.py)
+    chunk_threshold: arrays of at least this many bytes are saved chunked and compressed (.npc) instead of
+    as .npy, e.g. 256 * 2**20; loaded with an mmap_mode they stay on disk and are read by slice (see chunked.py)
+    chunk_codec: compression of chunked arrays, zstd, lz4, zlib or auto (the fastest installed)
+    stats: True (or an IOStats to share) to record the duration and bytes of every load/save step per
+    component in self.stats, e.g. to find what slows a node's startup (see iostats.py)
+
     Leave constructor arguments blank to attempt to find the currently selected setup
     """
-    def __init__(self, setup_dir: str = '~/.ros/setups/selected_setup/'):
+    def __init__(self, setup_dir: str = '~/.ros/setups/selected_setup/', lazy: bool = False, mmap_mode: str = None,
+                 table_format: str = 'csv', cache=False, fsync: bool = True,
+                 dedup: bool = False, param_sync: ParamSync = None, yaml_mode: str = 'rt',
+                 chunk_threshold: int = None, chunk_codec: str = 'auto', stats=None):
+        if yaml_mode not in fastyaml.YAML_MODES:
+            raise ValueError(f'unknown yaml_mode {yaml_mode}, use one of {fastyaml.YAML_MODES}')
+        self.lazy = lazy
+        self.mmap_mode = mmap_mode
+        self.table_format = table_format
+        if cache is True:
+            cache = calibration_cache
+        self.cache = cache if isinstance(cache, CalibrationCache) else None
+        self.fsync = fsync
+        self.dedup = dedup
+        self.param_sync = paramsync.param_sync if param_sync is None else param_sync
+        self.yaml_mode = yaml_mode
+        self.chunk_threshold = chunk_threshold
+        self.chunk_codec = chunk_codec
+        self.stats = IOStats() if stats is True else stats or None
+        self.async_writer = None
         if setup_dir is not None:
             self.set_setup_dir(setup_dir)
 
     def set_setup_dir(self, setup_dir):
+        self.flush() # queued saves go to the old setup_dir
         self.cfg = {}
         self.cal = {}
         self.paths = {}
+        self.timelines = {}
+        self.load_errors = {}
+        self.snapshot = None
 
         self.setup_dir = pathlib.Path(setup_dir).expanduser().resolve()
         self.setup_name = str(self.setup_dir.name)
+        self.blobs = BlobStore(self.setup_dir / BLOB_DIR) if self.dedup else None
         logging.info(f'opened setup_dir: {self.setup_dir}')
 
-    def load(self, run_time_epoch: int = None, ros_param_ns: str = None):
+    @instrumented('load', per_component=False)
+    def load(self, run_time_epoch: int = None, ros_param_ns: str = None, workers: int = None):
         '''Loads all component configurations & calibrations of a machine setup
         
         If a run_time_epoch is specified, the latest config/calibration preceeding the time will be loaded,
@@ -52,146 +137,490 @@ class Setup:
         If a ros_param_ns is provided, all values in the cal.yaml will be loaded to the parameter server.
         If ros_param_ns is set to 'default', it will default to /{setup}/{component}/{params}
         If ros_param_ns is set to None, no parameters will be uploaded
+
+        If workers > 1, components are loaded concurrently on a thread pool of that size. Errors are then
+        collected per component in self.load_errors and logged instead of stopping the whole load.
         '''
         self.component_names = []
-        for component_dir in self.setup_dir.iterdir():
-            if not component_dir.is_dir():
+        self.load_errors = {}
+        component_names = self.list_components()
+        if workers is None or workers <= 1:
+            for component_name in component_names:
+                self.load_component(component_name,run_time_epoch, ros_param_ns)
+                self.component_names.append(component_name)
+            return self.component_names
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {component_name: pool.submit(self.load_component, component_name, run_time_epoch, ros_param_ns)
+                       for component_name in component_names}
+        for component_name, future in futures.items(): # keeps the directory order of the serial path
+            ex = future.exception()
+            if ex is not None:
+                logging.error(f'failed to load component {component_name}: {ex!r}')
+                self.load_errors[component_name] = ex
                 continue
-            component_name = str(component_dir.name)
-            self.load_component(component_name,run_time_epoch, ros_param_ns)
             self.component_names.append(component_name)
+        if self.load_errors:
+            logging.error(f'{len(self.load_errors)} of {len(component_names)} components failed to load')
         return self.component_names
     
+    async def aload(self, run_time_epoch: int = None, ros_param_ns: str = None, concurrency: int = None):
+        '''asyncio version of load(): components are loaded concurrently on the loop's default executor
+
+        The event loop isn't blocked by the file I/O or parsing. As with load(workers=...), errors are
+        collected per component in self.load_errors and logged. concurrency limits the components loaded
+        at once (default: as many as the executor runs). Values of a lazy setup are still read on first
+        access, so don't combine lazy=True with access from the event loop thread.
+        '''
+        loop = asyncio.get_running_loop()
+        self.load_errors = {}
+        component_names = await loop.run_in_executor(None, self.list_components)
+        semaphore = asyncio.Semaphore(concurrency) if concurrency else None
+
+        async def load_one(component_name):
+            if semaphore is None:
+                return await self.aload_component(component_name, run_time_epoch, ros_param_ns)
+            async with semaphore:
+                return await self.aload_component(component_name, run_time_epoch, ros_param_ns)
+
+        results = await asyncio.gather(*(load_one(name) for name in component_names), return_exceptions=True)
+        self.component_names = []
+        for component_name, result in zip(component_names, results):
+            if isinstance(result, Exception):
+                logging.error(f'failed to load component {component_name}: {result!r}')
+                self.load_errors[component_name] = result
+                continue
+            self.component_names.append(component_name)
+        if self.load_errors:
+            logging.error(f'{len(self.load_errors)} of {len(component_names)} components failed to load')
+        return self.component_names
+
+    async def aload_component(self, component_name: str, run_time_epoch: int = None, ros_param_ns: str = None):
+        '''asyncio version of load_component()'''
+        return await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(self.load_component, component_name, run_time_epoch, ros_param_ns))
+
+    async def aload_component_cfg(self, component_name: str, run_time_epoch: int = None, ros_param_ns: str = None, default_cfg: str = None):
+        '''asyncio version of load_component_cfg()'''
+        return await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(self.load_component_cfg, component_name, run_time_epoch, ros_param_ns, default_cfg))
+
+    async def aload_component_cal(self, component_name: str, run_time_epoch: int = None, ros_param_ns: str = None):
+        '''asyncio version of load_component_cal()'''
+        return await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(self.load_component_cal, component_name, run_time_epoch, ros_param_ns))
+
+    async def asave_component_cal(self, component_name: str, calibration: dict, overwrite: bool = False):
+        '''asyncio version of save_component_cal(), returns the calibration directory
+
+        Goes through the background writer (see save_component_cal_async): the calibration is copied
+        first, and saves of a component started from concurrent tasks are written in call order.
+        '''
+        return await asyncio.wrap_future(self.save_component_cal_async(component_name, calibration, overwrite))
+
+    async def asave_component_cfg(self, component_name: str, configuration: dict):
+        '''asyncio version of save_component_cfg(), ordered with the component's calibration saves'''
+        if self.async_writer is None:
+            self.async_writer = AsyncCalWriter(self)
+        return await asyncio.wrap_future(self.async_writer.save_component_cfg(component_name, configuration))
+
+    @instrumented('freeze', per_component=False)
+    def freeze(self, path=None, run_time_epoch: int = None):
+        '''Write the cfg & cal every component would load at run_time_epoch to one snapshot file
+
+        path defaults to {setup_dir}/.snapshot. See snapshot.py; the component folders stay the
+        source of truth, refreeze after saving new calibrations. Returns the snapshot path.
+        '''
+        path = self.setup_dir / snapshot.SNAPSHOT_FILE if path is None else pathlib.Path(path)
+        snapshot.freeze(self, path, run_time_epoch, fsync=self.fsync)
+        logging.debug(f'froze setup {self.setup_name} to {path}')
+        return path
+
+    @instrumented('load_snapshot', per_component=False)
+    def load_snapshot(self, path=None, check: bool = False):
+        '''Load all components from a snapshot made with freeze(), with a single mmap of one file
+
+        Arrays are read-only views of the mapped file. If check, the snapshot must still match the
+        component folders (see Snapshot.is_current), otherwise it is ignored and load() is used.
+        '''
+        path = self.setup_dir / snapshot.SNAPSHOT_FILE if path is None else pathlib.Path(path)
+        snap = snapshot.Snapshot(path)
+        if check and not snap.is_current(self.setup_dir):
+            logging.warning(f'snapshot {path} is out of date, loading {self.setup_dir}')
+            return self.load(snap.header['run_time_epoch'])
+        self.snapshot = snap
+        self.component_names = []
+        for component_name in snap.component_names:
+            self.paths[component_name] = {}
+            for kind, tree_dict in (('cfg', self.cfg), ('cal', self.cal)):
+                tree, folder = snap.load_component(component_name, kind)
+                if folder is not None:
+                    tree_dict[component_name] = tree
+                    self.paths[component_name][kind] = self.setup_dir / folder
+            self.component_names.append(component_name)
+        return self.component_names
+
+    def upload_params(self, component_name: str, tree: dict, ros_param_ns: str = 'default'):
+        '''Sync a component's cfg/cal tree to the ros parameter server, if a master is available
+
+        Only keys that changed since the last upload to the namespace are sent (see paramsync.py).
+        '''
+        if ros_param_ns == 'default':
+            ros_param_ns = f'/{self.setup_name}/{component_name}'
+        try: 
+            with iostats.span('param_upload', nbytes=0):
+                self.param_sync.upload(ros_param_ns, tree)
+        except Exception as ex: 
+            logging.warning(f'failed to set ros params: {ex}')
+
+    def watch(self, callback=None, component_names: list = None, ros_param_ns: str = None, poll_interval: float = 1.0):
+        '''Start reloading components into this setup as new calibrations are saved (see watcher.py)
+
+        callback(component_name, cal) is called after each reload, more can be added to the returned
+        SetupWatcher with add_callback(). Call stop() on it to end the watch.
+        '''
+        watcher = SetupWatcher(self, component_names=component_names, ros_param_ns=ros_param_ns, poll_interval=poll_interval)
+        if callback is not None:
+            watcher.add_callback(callback)
+        return watcher.start()
+
+    def list_components(self):
+        '''Names of the component directories in the setup (hidden directories are internal)'''
+        with iostats.span('list_components', nbytes=0):
+            return [str(d.name) for d in self.setup_dir.iterdir() if d.is_dir() and not d.name.startswith('.')]
+
+    @instrumented('load_component')
     def load_component(self, component_name: str, run_time_epoch: int = None, ros_param_ns: str = None):
-        '''Load a single component to the setup'''
-        self.load_component_cfg(component_name,run_time_epoch, ros_param_ns)
-        self.load_component_cal(component_name,run_time_epoch, ros_param_ns)
+        '''Load a single component to the setup
+
+        Only one tree is uploaded to ros_param_ns: the calibration, or the configuration if the component
+        has no calibration (uploading both to one namespace would replace one with the other on every load)
+        '''
+        cal_dir = self.load_component_cal(component_name,run_time_epoch, ros_param_ns)
+        self.load_component_cfg(component_name,run_time_epoch, ros_param_ns if cal_dir is None else None)
 
+    @instrumented('load_cfg')
     def load_component_cfg(self, component_name: str, run_time_epoch: int = None, ros_param_ns: str = None, default_cfg: str = None):
-        '''Load a single component's configuration to the setup'''
-        component_filename = component_name.strip('/')+'/'
-        component_dir = self.setup_dir / component_filename
-        component_dir.mkdir(parents=True,exist_ok=True)
-        
-        cal_dirs = [f for f in component_dir.iterdir() if (f.is_dir() and str(f.name).isdigit())]
-        if run_time_epoch != None and len(cal_dirs) > 0:
-            # Use cal_dir
-            times = [int(str(f.name)) for f in cal_dirs]
-            times.sort(reverse=True)
-            for cal_time in times:
-                if cal_time <= int(run_time_epoch):
-                    break
-            cal_dir = component_dir / str(cal_time)
-            cfg_dir = cal_dir
-        elif (component_dir / 'cfg' / 'cfg.yaml').exists():
-            # try cfg dir
-            cfg_dir = component_dir / 'cfg/'
-        elif default_cfg != None and pathlib.Path(default_cfg).exists():
+        '''Load a single component's configuration to the setup, returns the folder it was loaded from'''
+        cfg_dir = self.find_cfg_dir(component_name, run_time_epoch)
+        if cfg_dir is None and default_cfg != None and pathlib.Path(default_cfg).exists():
             logging.warning('WARNING: no prior configuration found, loading from defaults')
-            cfg_dir = component_dir / 'cfg/'
+            cfg_dir = self.setup_dir / component_name.strip('/') / 'cfg/'
             shutil.copytree(default_cfg,cfg_dir)
-        else:
+        elif cfg_dir is None:
             logging.error('No configuration could be found')
             return
         
-        self.cfg[component_name] = yaml.load(cfg_dir / 'cfg.yaml')
-
-        if not component_name in self.paths:
-            self.paths[component_name] = {}
-        self.paths[component_name]['cfg'] = cfg_dir
-
-        # load ros parameters to the the ros core if available
-        if imports_ros and rosgraph.is_master_online() and ros_param_ns is not None:
-            try: 
-                if ros_param_ns == 'default':
-                    ros_param_ns = f'/{self.setup_name}/{component_name}'
-                rospy.set_param(ros_param_ns,json.loads(json.dumps(self.cfg[component_name]))) 
-                # json recursively converts ordereddict to dict
-            except Exception as ex: 
-                logging.warning(f'failed to set ros params: {ex}')
+        cfg, cfg_dir = self._load_tree(cfg_dir, 'cfg.yaml', lambda: self.find_cfg_dir(component_name, run_time_epoch, from_archive=True),
+                                       component_name, ros_param_ns)
+        # only publish the fully loaded tree, the watcher reloads while others read
+        self.cfg[component_name] = cfg
+        self.paths[component_name] = {**self.paths.get(component_name, {}), 'cfg': cfg_dir}
+        return cfg_dir
+
+    @instrumented('load_cal')
+    def load_component_cal(self, component_name: str, run_time_epoch: int = None, ros_param_ns: str = None, default_cfg: str = None):
+        '''Load a single component's calibration to the setup, returns the folder it was loaded from'''
+        cal_dir = self.find_cal_dir(component_name, run_time_epoch)
+        if cal_dir is None:
+            logging.warning('no calibration found')
+            return
+        
+        cal, cal_dir = self._load_tree(cal_dir, 'cal.yaml', lambda: self.find_cal_dir(component_name, run_time_epoch, from_archive=True),
+                                       component_name, ros_param_ns)
+        # only publish the fully loaded tree, the watcher reloads while others read
+        self.cal[component_name] = cal
+        self.paths[component_name] = {**self.paths.get(component_name, {}), 'cal': cal_dir}
+        return cal_dir
+
+    def _load_tree(self, tree_dir: pathlib.Path, yaml_name: str, resolve_archived, component_name: str = None, ros_param_ns: str = None):
+        '''Load tree_dir/yaml_name with the files it references, returns (tree, folder it was loaded from)
+
+        Readers take no lock, so pruning (see retention.py) may remove a calibration folder, or the extracted
+        copy of an archived one, while it is read. Pruning moves folders away in a single rename before
+        removing them, so if tree_dir still exists after loading nothing was removed underneath;
+        otherwise the tree is loaded again from the folder resolve_archived() gives, which extracts it
+        from the component's archive.
+        '''
+        error = FileNotFoundError(errno.ENOENT, 'removed while loading', str(tree_dir))
+        for attempt in range(LOAD_ATTEMPTS):
+            if attempt:
+                logging.info(f'{tree_dir} was removed while loading, loading it from the archive')
+                tree_dir = resolve_archived()
+                if tree_dir is None:
+                    break
+            try:
+                tree = load_yaml(tree_dir / yaml_name, self.cache, self.yaml_mode)
+                # load ros parameters to the the ros core if available
+                if ros_param_ns is not None:
+                    self.upload_params(component_name, tree, ros_param_ns)
+                tree = load_to_dict(tree,tree_dir,lazy=self.lazy,mmap_mode=self.mmap_mode,cache=self.cache)
+            except FileNotFoundError as ex:
+                error = ex
+                continue
+            if tree_dir.is_dir():
+                return tree, tree_dir
+        raise error
 
-        self.cfg[component_name] = load_to_dict(self.cfg[component_name],cfg_dir)
+    def find_cfg_dir(self, component_name: str, run_time_epoch: int = None, from_archive: bool = False):
+        '''Folder holding the cfg.yaml load_component_cfg would load, or None
 
-    def load_component_cal(self, component_name: str, run_time_epoch: int = None, ros_param_ns: str = None, default_cfg: str = None):
-        '''Load a single component's calibration to the setup'''
-        component_filename = component_name.strip('/').replace('/','+')+'/'
+        With a run_time_epoch, the cfg stored with the calibration in effect then; otherwise the live cfg/
+        from_archive: see cal_path
+        '''
+        component_filename = component_name.strip('/')+'/'
         component_dir = self.setup_dir / component_filename
         component_dir.mkdir(parents=True,exist_ok=True)
-        cal_dirs = [f for f in component_dir.iterdir() if (f.is_dir() and str(f.name).isdigit())]
-        if run_time_epoch != None and len(cal_dirs) > 0:
-            # Use cal_dir
-            times = [int(str(f.name)) for f in cal_dirs]
-            times.sort(reverse=True)
-            for cal_time in times:
-                if cal_time <= int(run_time_epoch):
-                    break
-            cal_dir = component_dir / str(cal_time)
-        elif run_time_epoch == None and len(cal_dirs) > 0:
-            times = [int(str(f.name)) for f in cal_dirs]
-            times.sort(reverse=True)
-            cal_time = times[0]
-            cal_dir = component_dir / str(cal_time)
-        else: 
-            logging.warning('no calibration found')
-            return
         
-        self.cal[component_name] = yaml.load(cal_dir / 'cal.yaml')
+        with iostats.span('timeline', nbytes=0):
+            cal_id = self.timeline(component_dir).at(run_time_epoch)
+        if run_time_epoch != None and cal_id is not None:
+            # Use cal_dir
+            return self.cal_path(component_dir, cal_id, from_archive)
+        elif (component_dir / 'cfg' / 'cfg.yaml').exists():
+            # try cfg dir
+            return component_dir / 'cfg/'
+        return None
 
-        if not component_name in self.paths:
-            self.paths[component_name] = {}
-        self.paths[component_name]['cal'] = cal_dir
+    def find_cal_dir(self, component_name: str, run_time_epoch: int = None, from_archive: bool = False):
+        '''Folder of the calibration in effect at run_time_epoch (latest if None), or None
 
-        # load ros parameters to the the ros core if available
-        if imports_ros and rosgraph.is_master_online() and ros_param_ns is not None:
-            try: 
-                if ros_param_ns == 'default':
-                    ros_param_ns = f'/{self.setup_name}/{component_name}'
-                rospy.set_param(ros_param_ns,json.loads(json.dumps(self.cal[component_name])))
-            except Exception as ex: 
-                logging.warning(f'failed to set ros params: {ex}')
+        from_archive: see cal_path
+        '''
+        component_filename = component_name.strip('/').replace('/','+')+'/'
+        component_dir = self.setup_dir / component_filename
+        component_dir.mkdir(parents=True,exist_ok=True)
+        with iostats.span('timeline', nbytes=0):
+            cal_id = self.timeline(component_dir).at(run_time_epoch)
+        if cal_id is None:
+            return None
+        # latest at or before run_time_epoch, or most recent if None
+        return self.cal_path(component_dir, cal_id, from_archive)
+
+    def cal_path(self, component_dir: pathlib.Path, cal_id: str, from_archive: bool = False):
+        '''Folder of a calibration, extracted from the component's archive if it was pruned (see retention.py)
+
+        from_archive: look in the archive even if the folder still exists, e.g. after it was found
+        half removed by a prune
+        '''
+        cal_dir = component_dir / cal_id
+        if not from_archive and cal_dir.is_dir():
+            return cal_dir
+        with iostats.span('extract', nbytes=0):
+            archived = CalArchive(component_dir).extract(cal_id)
+        return cal_dir if archived is None else archived
+
+    def query_epochs(self, run_time_epochs, component_names: list = None):
+        '''Resolve and load the calibrations in effect at many run_time_epochs at once
+
+        Each distinct calibration is loaded only once, no matter how many epochs resolve to it.
+        Nothing is stored on the setup (self.cal etc. are unchanged).
+
+        Returns a dict per component name:
+            cal_ids: sorted unique cal ids (folder names) the epochs resolve to
+            index: for each epoch, its index into cal_ids (so cal_ids[index] maps epoch -> cal)
+            cal_dirs: the calibration directory of each of cal_ids
+            cal: the loaded calibration of each of cal_ids
+            groups: {cal_id: indices of the epochs that resolve to it}
+        Components without calibrations are left out.
+        '''
+        run_time_epochs = np.asarray(run_time_epochs)
+        if component_names is None:
+            component_names = self.list_components()
+
+        results = {}
+        for component_name in component_names:
+            component_dir = self.setup_dir / component_name.strip('/').replace('/','+')
+            timeline = self.timeline(component_dir)
+            snapshot = timeline.snapshot() # saves may add calibrations meanwhile
+            epoch_cals = timeline.at_many(run_time_epochs, snapshot)
+            if epoch_cals is None:
+                continue
+            unique_cals, index = np.unique(epoch_cals, return_inverse=True)
+            index = index.reshape(run_time_epochs.shape)
+            cal_ids = [snapshot[0][i] for i in unique_cals]
+            cal_dirs = []
+            cals = []
+            with iostats.activate(self.stats, component_name):
+                for cal_id in cal_ids:
+                    cal, cal_dir = self._load_tree(self.cal_path(component_dir, cal_id), 'cal.yaml',
+                                                   lambda: self.cal_path(component_dir, cal_id, from_archive=True))
+                    cal_dirs.append(cal_dir)
+                    cals.append(cal)
+            order = np.argsort(index, axis=None, kind='stable')
+            bounds = np.searchsorted(index.ravel()[order], np.arange(len(cal_ids)+1))
+            results[component_name] = {
+                'cal_ids': cal_ids,
+                'index': index,
+                'cal_dirs': cal_dirs,
+                'cal': cals,
+                'groups': {cal_id: order[bounds[i]:bounds[i+1]] for i, cal_id in enumerate(cal_ids)},
+            }
+        return results
 
-        self.cal[component_name] = load_to_dict(self.cal[component_name],cal_dir)
+    def timeline(self, component_dir: pathlib.Path):
+        '''Get the (cached) calibration timeline index of a component directory'''
+        component_dir = pathlib.Path(component_dir)
+        timeline = self.timelines.get(component_dir)
+        if timeline is None: # one Timeline per component, even if threads ask at once
+            timeline = self.timelines.setdefault(component_dir, Timeline(component_dir))
+        return timeline
 
+    @instrumented('save_cfg')
     def save_component_cfg(self, component_name: str, configuration: dict):
-        '''Save a configuration for a single component - overwrites prior'''
-        component_filename = component_name.strip('/').replace('/','+')
-        cfg_dir = self.setup_dir / component_filename / 'cfg/'
-        cfg_dir.mkdir(parents=True,exist_ok=True)
-
-        configuration = save_from_dict(configuration,cfg_dir)
+        '''Save a configuration for a single component - overwrites prior
 
-        yaml.dump(configuration, cfg_dir / 'cfg.yaml')
+        Files are written to a staging directory first and each moved over the prior file atomically,
+        cfg.yaml last, so a reader never sees a half-written file.
+        '''
+        component_filename = component_name.strip('/').replace('/','+')
+        cmp_dir = self.setup_dir / component_filename
+        cfg_dir = cmp_dir / 'cfg/'
+        staging_dir = make_staging_dir(cmp_dir)
+        try:
+            # not deduplicated, the live cfg may be edited in place and must not share blobs
+            configuration = save_from_dict(configuration,staging_dir,table_format=self.table_format,
+                                           chunk_threshold=self.chunk_threshold,chunk_codec=self.chunk_codec)
+            dump_yaml(configuration, staging_dir / 'cfg.yaml', self.yaml_mode)
+            if self.fsync:
+                with iostats.span('fsync', nbytes=0):
+                    fsync_tree(staging_dir)
+            with iostats.span('publish', nbytes=0):
+                replace_files(staging_dir, cfg_dir, last=('cfg.yaml',))
+            if self.fsync:
+                fsync_dir(cfg_dir)
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+        catalog.record_cfg(self.setup_dir, cmp_dir)
         logging.debug(f'configuration saved in {cfg_dir}')
 
+    @instrumented('save_cal')
     def save_component_cal(self, component_name: str, calibration: dict, overwrite: bool = False):
-        '''Write calibration for a single component'''
+        '''Write calibration for a single component
+
+        The calibration is written to a staging directory, fsynced (unless the setup was made with
+        fsync=False), then published by renaming it to its timestamped folder and atomically swapping
+        the latest symlink, so readers never see a partial calibration.
+        Returns the calibration directory.
+        '''
         component_filename = component_name.strip('/').replace('/','+')
         if component_name not in self.paths:
             self.paths[component_name] = {}
-        if overwrite and 'cal' in self.paths[component_name]:
+        cmp_dir = self.setup_dir / component_filename 
+        new_cal = not (overwrite and 'cal' in self.paths[component_name])
+        if not new_cal:
             # overwrite cal
             cal_dir = pathlib.Path(self.paths[component_name]['cal'])
+            if ARCHIVE_DIR in cal_dir.parts:
+                raise ValueError(f'{cal_dir} is an archived calibration and can not be overwritten')
             logging.debug(f'overwriting cal {cal_dir}')
-        else: # new cal
-            cal_time = str(int(time.time()))
-            cmp_dir = self.setup_dir / component_filename 
-            cal_dir = cmp_dir / cal_time
-            cal_dir.mkdir(parents=True,exist_ok=True)
-            self.paths[component_name]['cal'] = cal_dir
-            logging.debug(f'creating new cal {cal_dir}')
-
-            latest_link = cal_dir.parent / 'latest/'
-            if latest_link.exists() and latest_link.is_symlink():
-                latest_link.unlink()
-            latest_link.symlink_to(pathlib.Path(cal_dir))
-
-        # save and replace objects with paths
-        calibration = save_from_dict(calibration,cal_dir)
-
-        yaml.dump(calibration, cal_dir / 'cal.yaml')
-        if 'cfg' in self.paths[component_name] and self.paths[component_name]['cfg'] not in [cal_dir]:
-            shutil.copytree(self.paths[component_name]['cfg'],cal_dir,dirs_exist_ok=True)
+        else: # new cal, named when published
+            cal_dir = None
+
+        staging_dir = make_staging_dir(cmp_dir)
+        try:
+            # save and replace objects with paths
+            calibration = save_from_dict(calibration,staging_dir,table_format=self.table_format,blobs=self.blobs,
+                                         chunk_threshold=self.chunk_threshold,chunk_codec=self.chunk_codec)
+
+            dump_yaml(calibration, staging_dir / 'cal.yaml', self.yaml_mode)
+            if 'cfg' in self.paths[component_name] and self.paths[component_name]['cfg'] not in [cal_dir]:
+                copy_function = shutil.copy2 if self.blobs is None else self.blobs.copy
+                with iostats.span('copy_cfg', nbytes=0):
+                    shutil.copytree(self.paths[component_name]['cfg'],staging_dir,dirs_exist_ok=True,copy_function=copy_function)
+            if self.blobs is not None:
+                with iostats.span('dedup', nbytes=0):
+                    self.blobs.ingest_tree(staging_dir)
+            if self.fsync:
+                with iostats.span('fsync', nbytes=0):
+                    fsync_tree(staging_dir)
+
+            with iostats.span('publish', nbytes=0):
+                if new_cal:
+                    cal_dir = self._publish_cal(cmp_dir, staging_dir)
+                else: # replace the files one by one
+                    replace_files(staging_dir, cal_dir, last=('cal.yaml',))
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+        self.paths[component_name]['cal'] = cal_dir
+        if new_cal:
+            catalog.record_cal(self.setup_dir, cal_dir)
+        else:
+            catalog.record_component(self.setup_dir, cmp_dir)
         logging.debug(f'calibration written to {cal_dir}')
+        return cal_dir
+
+    def save_component_cal_async(self, component_name: str, calibration: dict, overwrite: bool = False):
+        '''Queue save_component_cal on a background thread, returns a Future of the calibration directory
+
+        The calibration is copied before returning, so it may be modified right away. Saves of a component
+        are written in order (see writer.py). Use flush() to wait for them; queued saves also finish
+        before the interpreter exits.
+        '''
+        if self.async_writer is None:
+            self.async_writer = AsyncCalWriter(self)
+        return self.async_writer.save_component_cal(component_name, calibration, overwrite)
+
+    def flush(self, timeout: float = None):
+        '''Wait for saves queued with save_component_cal_async. Returns True if all finished within timeout'''
+        if self.async_writer is None:
+            return True
+        return self.async_writer.flush(timeout)
+
+    def _publish_cal(self, cmp_dir: pathlib.Path, staging_dir: pathlib.Path):
+        '''Rename a staged calibration to a new cal id and point latest at it, under the component lock
+
+        Cal ids have ns resolution; if another writer took the id, the next free one is used.
+        latest is only moved forward, so with concurrent writers it ends on the newest calibration.
+        '''
+        timeline = self.timeline(cmp_dir)
+        with locked(cmp_dir):
+            timeline.refresh()
+            time_ns = time.time_ns()
+            while True:
+                cal_dir = cmp_dir / new_cal_id(time_ns)
+                try:
+                    os.rename(staging_dir, cal_dir)
+                    break
+                except OSError as ex:
+                    if ex.errno not in (errno.EEXIST, errno.ENOTEMPTY):
+                        raise
+                    time_ns += 1
+
+            latest_link = cmp_dir / 'latest'
+            latest_key = parse_cal_id(pathlib.Path(os.readlink(latest_link)).name) if latest_link.is_symlink() else None
+            if latest_key is None or parse_cal_id(cal_dir.name) >= latest_key:
+                swap_symlink(latest_link, cal_dir, tmp_dir=cmp_dir / STAGING_DIR)
+            timeline.add(cal_dir.name)
+            if self.fsync:
+                fsync_dir(cmp_dir)
+        return cal_dir
+
+    def prune(self, policy: retention.RetentionPolicy = None, component_names: list = None, dry_run: bool = False, now: float = None):
+        '''Move calibrations the retention policy doesn't keep into each component's archive
+
+        Loads at any run_time_epoch still resolve to the same calibrations, archived ones are extracted
+        when needed. latest and pinned calibrations (see pin_cal) are kept. Returns per component
+        {'kept': [cal ids], 'archived': [cal ids]}; with dry_run nothing is changed.
+        '''
+        policy = retention.RetentionPolicy() if policy is None else policy
+        if component_names is None:
+            component_names = self.list_components()
+        report = {}
+        for component_name in component_names:
+            component_dir = self.setup_dir / component_name.strip('/').replace('/','+')
+            report[component_name] = retention.prune_component(component_dir, policy, now=now, dry_run=dry_run, fsync=self.fsync)
+            if report[component_name]['archived'] and not dry_run:
+                catalog.record_component(self.setup_dir, component_dir)
+        return report
+
+    def pin_cal(self, component_name: str, cal_id: str = None, pinned: bool = True):
+        '''Keep a calibration (default the latest) as a folder whatever the retention policy; pinned=False unpins'''
+        component_dir = self.setup_dir / component_name.strip('/').replace('/','+')
+        if cal_id is None:
+            cal_id = self.timeline(component_dir).latest()
+        retention.pin(component_dir, str(cal_id), pinned)
+        return cal_id
 
     def save_example_cal(self):
         '''Write out an example calibration for layout and testing'''
@@ -214,37 +643,113 @@ class Setup:
         self.save_component_cfg('example_component',cfg)
         self.save_component_cal('example_component',cal,overwrite=True)
 
-def load_to_dict(d:dict,dir:pathlib.Path):
+def load_npy(f: pathlib.Path, mmap_mode: str = None):
+    if mmap_mode is not None:
+        try:
+            return np.load(f, mmap_mode=mmap_mode)
+        except ValueError: # object arrays can't be memory-mapped, fall back to a pickle load
+            pass
+    return np.load(f, allow_pickle=True)
+
+# readers for file references in cfg.yaml/cal.yaml, by suffix
+file_loaders = {
+    '.npy': load_npy,
+    '.npc': load_chunked,
+    **table_loaders,
+}
+
+def load_file(f: pathlib.Path, mmap_mode: str = None, cache: CalibrationCache = None):
+    '''Read a single referenced file with the loader for its suffix'''
+    loader = functools.partial(file_loaders[f.suffix], mmap_mode=mmap_mode)
+    with iostats.span(f'load{f.suffix}', f):
+        if cache is not None:
+            return cache.get(f, loader, variant=mmap_mode)
+        return loader(f)
+
+def load_yaml(f: pathlib.Path, cache: CalibrationCache = None, mode: str = 'rt'):
+    '''Parse a cfg.yaml/cal.yaml, round-trip (rt) or with the fast loader (fast)'''
+    loader = fastyaml.load if mode == 'fast' else thread_yaml().load
+    with iostats.span('yaml_load', f):
+        if cache is not None:
+            return cache.get(f, loader, variant=mode)
+        return loader(f)
+
+def dump_yaml(d: dict, f: pathlib.Path, mode: str = 'rt'):
+    '''Write a cfg.yaml/cal.yaml, round-trip (rt) or with the fast dumper (fast)'''
+    with iostats.span('yaml_dump', f):
+        if mode == 'fast':
+            fastyaml.dump(d, f)
+            return
+        try:
+            thread_yaml().dump(d, f)
+        except Exception:
+            del _yaml_local.yaml # a failed dump leaves the instance unusable, the next one starts afresh
+            raise
+
+def load_to_dict(d:dict,dir:pathlib.Path,lazy:bool=False,mmap_mode:str=None,cache:CalibrationCache=None):
+    '''Replace file references in a loaded yaml tree with their contents
+
+    If lazy, files are not read here; the tree is returned as LazyDicts holding LazyFile proxies
+    which read the file the first time the value is accessed.
+    If mmap_mode is set (e.g. 'r'), numpy arrays are memory-mapped instead of read into memory,
+    so processes loading the same calibration share the page cache. Object arrays are still unpickled.
+    If a cache is given, unchanged files are served from it (read-only) instead of being read again.
+    '''
     if not d:
         return
-    for k, v in d.items():
+    if lazy:
+        d = LazyDict(d)
+    for k, v in dict.items(d):
         if isinstance(v,str):
             f = dir / v
-            if f.is_file() and f.suffix == '.npy':
-                d[k] = np.load(f, allow_pickle=True)
-
-            if f.is_file() and f.suffix == '.csv':
-                d[k] = pd.read_csv(f)
+            if f.suffix in file_loaders and f.is_file():
+                if lazy:
+                    d[k] = LazyFile(f, functools.partial(load_file, mmap_mode=mmap_mode, cache=cache))
+                else:
+                    d[k] = load_file(f, mmap_mode=mmap_mode, cache=cache)
 
         if isinstance(v, dict):
-            d[k] = load_to_dict(v,dir)
+            d[k] = load_to_dict(v,dir,lazy,mmap_mode,cache)
     return d
 
-def save_from_dict(d:dict,dir:pathlib.Path,file_ns:str=''):
+def save_file(f: pathlib.Path, save, value, blobs: BlobStore = None):
+    '''Write value to f with save(file, value), through the blob store if given'''
+    with iostats.span(f'save{f.suffix}', f):
+        if blobs is None:
+            save(str(f), value)
+            return
+        blobs.link(blobs.put_written(lambda stream: save(stream, value)), f)
+
+def save_npy(f, arr: np.ndarray):
+    np.save(f, arr)
+
+def save_from_dict(d:dict,dir:pathlib.Path,file_ns:str='',table_format:str='csv',blobs:BlobStore=None,
+                   chunk_threshold:int=None,chunk_codec:str='auto'):
+    '''Write arrays and dataframes in a tree to files in dir, replacing them with the file names
+
+    table_format selects the dataframe storage: csv, parquet, feather, npz, or auto (see tables.py)
+    If a BlobStore is given, files are written into it and only kept there if the content is new.
+    Arrays of chunk_threshold bytes or more are written chunked and compressed with chunk_codec (.npc).
+    '''
+    table_suffix, save_table = resolve_table_format(table_format)
     for k,v in d.items():
         if isinstance(v,pd.DataFrame):
-            d[k] = file_ns+k+'.csv' # replaces key with csv path
-            v.to_csv(str(dir / d[k]))
+            d[k] = file_ns+k+table_suffix # replaces key with table path
+            save_file(dir / d[k], save_table, v, blobs)
+
+        elif isinstance(v,np.ndarray) and chunk_threshold is not None and v.nbytes >= chunk_threshold and not v.dtype.hasobject:
+            d[k] = file_ns+k+'.npc' # replaces key with chunked array path
+            save_file(dir / d[k], functools.partial(save_chunked, codec=chunk_codec), v, blobs)
 
         elif isinstance(v,np.ndarray):
             d[k] = file_ns+k+'.npy' # replaces key with npy path
-            np.save(dir / d[k], v)
+            save_file(dir / d[k], save_npy, v, blobs)
 
         elif isinstance(v,float):
             d[k] = float(d[k])
 
         elif isinstance(v, dict): # recurses
-            d[k] = save_from_dict(v,dir,file_ns+str(k)+'+')
+            d[k] = save_from_dict(v,dir,file_ns+str(k)+'+',table_format,blobs,chunk_threshold,chunk_codec)
     return d
 
 def set_setup_storage(path: str):
@@ -264,13 +769,12 @@ def new_setup(setup_name: str):
     if setup_path.exists():
         raise FileExistsError('setup already exists, choose a unique name')
     setup_path.mkdir(parents=True)
+    catalog.record_setup(setup_path)
     return setup_path
 
-def list_setups():
-    '''Return available setups in set storage directory'''
-    setup_storage = pathlib.Path('~/.ros/setups/').expanduser()
-    setup_names = [d.name for d in setup_storage.iterdir() if d.is_dir()]
-    return setup_names
+def list_setups(prefix: str = ''):
+    '''Return available setups in set storage directory (from its catalog, see catalog.py)'''
+    return catalog.storage_catalog('~/.ros/setups/').names(prefix)
 
 def select_setup(setup_name: str):
     '''Select setup (leaves selected_setup text pointer in setup storage)'''
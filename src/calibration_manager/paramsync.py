@@ -0,0 +1,184 @@
+import logging
+import threading
+import time
+import xmlrpc.client
+
+try:
+    import rospy
+    import rosgraph
+    imports_ros = True
+except:
+    imports_ros = False
+
+class RosParamClient:
+    """
+    Access to the ROS parameter server, with the master availability check cached
+
+    online_ttl: seconds to reuse the result of rosgraph.is_master_online()
+    """
+    def __init__(self, online_ttl: float = 5.0):
+        self.online_ttl = online_ttl
+        self._online = None
+        self._online_checked = 0.0
+        self._multicall = True
+
+    def is_online(self):
+        if not imports_ros:
+            return False
+        now = time.monotonic()
+        if self._online is None or now - self._online_checked > self.online_ttl:
+            self._online = rosgraph.is_master_online()
+            self._online_checked = now
+        return self._online
+
+    def set_params(self, items: list):
+        '''Set several (key, value) params, in one XML-RPC multicall when the master supports it'''
+        if len(items) > 1 and self._multicall:
+            try:
+                master = rosgraph.Master(rospy.get_name())
+                multicall = xmlrpc.client.MultiCall(master.handle)
+                for key, value in items:
+                    multicall.setParam(rospy.get_name(), rospy.resolve_name(key), value)
+                for code, msg, _ in multicall():
+                    if code != 1:
+                        raise rosgraph.MasterError(msg)
+                return
+            except xmlrpc.client.Fault: # no system.multicall on this master
+                self._multicall = False
+        for key, value in items:
+            rospy.set_param(key, value)
+
+    def delete_params(self, keys: list):
+        for key in keys:
+            try:
+                rospy.delete_param(key)
+            except KeyError:
+                pass
+
+class FakeParamServer:
+    """
+    An in-memory stand-in for the ROS parameter server, for testing uploads without a roscore
+
+    Follows the parameter server semantics used here: setting a dict replaces the whole subtree.
+    Every call is recorded in self.calls as (method, keys).
+    """
+    def __init__(self, online: bool = True):
+        self.online = online
+        self.params = {}
+        self.calls = []
+
+    def is_online(self):
+        return self.online
+
+    def set_params(self, items: list):
+        self.calls.append(('set_params', [key for key, _ in items]))
+        for key, value in items:
+            *parents, name = split_key(key)
+            node = self.params
+            for parent in parents:
+                if not isinstance(node.get(parent), dict):
+                    node[parent] = {}
+                node = node[parent]
+            node[name] = to_plain(value)
+
+    def delete_params(self, keys: list):
+        self.calls.append(('delete_params', list(keys)))
+        for key in keys:
+            *parents, name = split_key(key)
+            node = self.params
+            for parent in parents:
+                node = node.get(parent, {})
+            node.pop(name, None)
+
+    def get_param(self, key: str):
+        node = self.params
+        for name in split_key(key):
+            node = node[name]
+        return node
+
+class ParamSync:
+    """
+    Uploads cfg/cal trees to the parameter server, sending only what changed since the last upload
+
+    The last tree uploaded to each namespace is kept, and a new upload is diffed against it: changed
+    and new keys are set, removed keys deleted, all in one batch. Where most of a subtree changed it is
+    set as a whole instead. Uploads from other processes to the same namespace aren't seen; call
+    forget() to force a full upload.
+
+    client: a RosParamClient (default) or FakeParamServer
+    """
+    def __init__(self, client=None):
+        self.client = RosParamClient() if client is None else client
+        self._uploaded = {}
+        self._lock = threading.Lock()
+
+    def upload(self, ns: str, tree: dict):
+        '''Sync tree to ns. Returns the number of keys set or deleted (0 if the master is offline)'''
+        if not self.client.is_online():
+            return 0
+        ns = '/' + ns.strip('/')
+        tree = to_plain(tree)
+        with self._lock:
+            last = self._uploaded.get(ns)
+            if last is None or not isinstance(last, dict) or not isinstance(tree, dict):
+                sets, deletes = [(ns, tree)], []
+            else:
+                sets, deletes = diff_params(last, tree, ns)
+            if deletes:
+                self.client.delete_params(deletes)
+            if sets:
+                self.client.set_params(sets)
+            self._uploaded[ns] = tree
+        logging.debug(f'synced {ns}: {len(sets)} set, {len(deletes)} deleted')
+        return len(sets) + len(deletes)
+
+    def forget(self, ns: str = None):
+        '''Drop the record of uploads to ns (or all namespaces), so the next upload is complete'''
+        with self._lock:
+            if ns is None:
+                self._uploaded.clear()
+            else:
+                self._uploaded.pop('/' + ns.strip('/'), None)
+
+def diff_params(old: dict, new: dict, ns: str):
+    '''Parameter updates turning old into new under ns, as ([(key, value) to set], [keys to delete])'''
+    sets, deletes = [], []
+    for name, value in new.items():
+        key = f'{ns}/{name}'
+        if name not in old:
+            sets.append((key, value))
+        elif isinstance(value, dict) and isinstance(old[name], dict):
+            sub_sets, sub_deletes = diff_params(old[name], value, key)
+            if len(sub_sets) + len(sub_deletes) > 1 and len(sub_sets) + len(sub_deletes) >= len(value):
+                sets.append((key, value)) # cheaper to replace the subtree
+            else:
+                sets.extend(sub_sets)
+                deletes.extend(sub_deletes)
+        elif value != old[name] or type(value) != type(old[name]):
+            sets.append((key, value))
+    for name in old:
+        if name not in new:
+            deletes.append(f'{ns}/{name}')
+    return sets, deletes
+
+def to_plain(value):
+    '''Recursively convert yaml trees (CommentedMap, ScalarFloat, ...) to plain python types'''
+    if isinstance(value, dict):
+        return {str(k): to_plain(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_plain(v) for v in value]
+    if isinstance(value, bool):
+        return bool(value)
+    if isinstance(value, int):
+        return int(value)
+    if isinstance(value, float):
+        return float(value)
+    if isinstance(value, str):
+        return str(value)
+    return value
+
+def split_key(key: str):
+    return [name for name in key.split('/') if name]
+
+# shared by all Setups, the parameter server is global to the process
+param_sync = ParamSync()
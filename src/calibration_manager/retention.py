@@ -0,0 +1,143 @@
+'''
+Retention policy for calibration history: thin out old calibrations into the component's archive
+
+    python -m calibration_manager.retention ~/.ros/setups/my_machine --keep-all-days 7 --daily-days 30 --dry-run
+
+Pruned calibrations are moved to a compressed archive (see archive.py) rather than deleted, so
+loads at a run_time_epoch keep resolving to the calibration that was in effect then. The calibration
+latest points to and pinned calibrations (see pin()) are always kept as folders.
+'''
+
+import argparse
+import json
+import logging
+import os
+import pathlib
+import shutil
+import time
+
+from calibration_manager.archive import CalArchive
+from calibration_manager.atomic import fsync_dir, locked, make_staging_dir
+from calibration_manager.timeline import Timeline, parse_cal_id, scan_cal_ids
+
+DAY = 24 * 3600
+WEEK = 7 * DAY
+PINS_FILE = '.pins'
+
+class RetentionPolicy:
+    """
+    Which calibrations of a component to keep as folders, by age
+
+    Calibrations younger than keep_all_days are all kept. Up to daily_days old, one per day is kept
+    (the last of the day, i.e. the one in effect at its end), then one per week up to weekly_days
+    (None for no limit). Anything older is pruned.
+
+    tiers: alternatively, a list of (max age in seconds or None, interval in seconds or None), youngest
+    first: calibrations up to max age keep one per interval, or all if interval is None
+    """
+    def __init__(self, keep_all_days: float = 7, daily_days: float = 30, weekly_days: float = None, tiers: list = None):
+        if tiers is None:
+            tiers = [(keep_all_days * DAY, None), (daily_days * DAY, DAY), (None if weekly_days is None else weekly_days * DAY, WEEK)]
+        self.tiers = tiers
+
+    def __repr__(self):
+        return f'RetentionPolicy(tiers={self.tiers})'
+
+    def select(self, cal_ids: list, now: float = None):
+        '''The subset of cal_ids to keep at time now (default the current time)'''
+        now = time.time() if now is None else now
+        keep = set()
+        last_bucket = {}
+        for cal_id in sorted(cal_ids, key=parse_cal_id, reverse=True): # newest first, so the last of each bucket wins
+            t = parse_cal_id(cal_id) / 1e9
+            age = now - t
+            for i, (max_age, interval) in enumerate(self.tiers):
+                if max_age is not None and age > max_age:
+                    continue
+                if interval is None:
+                    keep.add(cal_id)
+                else:
+                    bucket = (i, int(t // interval))
+                    if bucket not in last_bucket:
+                        last_bucket[bucket] = cal_id
+                        keep.add(cal_id)
+                break
+        return keep
+
+def read_pins(component_dir):
+    try:
+        with open(pathlib.Path(component_dir) / PINS_FILE) as f:
+            return set(json.load(f))
+    except FileNotFoundError:
+        return set()
+
+def write_pins(component_dir, pins: set):
+    component_dir = pathlib.Path(component_dir)
+    tmp = component_dir / f'{PINS_FILE}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(sorted(pins, key=parse_cal_id), f)
+    os.replace(tmp, component_dir / PINS_FILE)
+
+def pin(component_dir, cal_id: str, pinned: bool = True):
+    '''Protect a calibration from pruning (or release it with pinned=False)'''
+    component_dir = pathlib.Path(component_dir)
+    with locked(component_dir):
+        pins = read_pins(component_dir)
+        if pinned:
+            pins.add(cal_id)
+        else:
+            pins.discard(cal_id)
+        write_pins(component_dir, pins)
+
+def prune_component(component_dir, policy: RetentionPolicy, now: float = None, dry_run: bool = False, fsync: bool = True):
+    '''Archive and remove the cal folders of a component the policy doesn't keep
+
+    Returns {'kept': [...], 'archived': [...]} cal ids. The archive volume is durable before any folder
+    is removed, so an interrupted prune loses nothing (folders already archived are archived again
+    by the next run).
+    '''
+    component_dir = pathlib.Path(component_dir)
+    with locked(component_dir):
+        folders = sorted(scan_cal_ids(component_dir), key=parse_cal_id)
+        keep = policy.select(folders, now) | read_pins(component_dir)
+        latest = component_dir / 'latest'
+        if latest.is_symlink():
+            keep.add(pathlib.Path(os.readlink(latest)).name)
+        if folders:
+            keep.add(folders[-1])
+        archived = [cal_id for cal_id in folders if cal_id not in keep]
+        if archived and not dry_run:
+            CalArchive(component_dir).add([component_dir / cal_id for cal_id in archived], fsync=fsync)
+            # readers take no lock: move each folder away in one rename before removing it, so a
+            # reader finding its folder still there after loading knows it read all of it
+            removed = make_staging_dir(component_dir)
+            for cal_id in archived:
+                os.rename(component_dir / cal_id, removed / cal_id)
+            shutil.rmtree(removed)
+            CalArchive(component_dir).clear_extracted()
+            if fsync:
+                fsync_dir(component_dir)
+            Timeline(component_dir).rebuild()
+    logging.info(f'{component_dir}: {"would archive" if dry_run else "archived"} {len(archived)} of {len(folders)} calibrations')
+    return {'kept': [cal_id for cal_id in folders if cal_id in keep], 'archived': archived}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('setup_dir')
+    parser.add_argument('--components', nargs='*', help='components to prune, default all')
+    parser.add_argument('--keep-all-days', type=float, default=7)
+    parser.add_argument('--daily-days', type=float, default=30)
+    parser.add_argument('--weekly-days', type=float, default=None, help='drop calibrations older than this, default never')
+    parser.add_argument('--dry-run', action='store_true', help='only report what would be archived')
+    args = parser.parse_args()
+
+    from calibration_manager.manager import Setup
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    setup = Setup(args.setup_dir)
+    policy = RetentionPolicy(args.keep_all_days, args.daily_days, args.weekly_days)
+    report = setup.prune(policy, args.components, dry_run=args.dry_run)
+    for component_name, result in report.items():
+        print(f'{component_name}: keep {len(result["kept"])}, archive {len(result["archived"])}')
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,10 @@
 #!/usr/bin/env python3
-from lxml import etree
 import os
 import pathlib
 import re
 import shutil
 import subprocess
+import time
 from ruamel.yaml import YAML
 yaml = YAML()
 
@@ -18,21 +18,23 @@ bridge = CvBridge()
 
 from qt_gui.plugin import Plugin
 from python_qt_binding import loadUi
-from python_qt_binding.QtCore import QSettings, Qt, QEvent
-from python_qt_binding.QtWidgets import QWidget, QTreeWidgetItem, QCompleter, QComboBox, QMenu
+from python_qt_binding.QtCore import QSettings, Qt, QEvent, QThread, QStringListModel, Signal
+from python_qt_binding.QtWidgets import QWidget, QCompleter, QMenu
 
 import tkinter as tk
 from tkinter import filedialog, simpledialog, messagebox
 root = tk.Tk()
 root.withdraw()
 
+from calibration_manager import catalog, launchgen
+from calibration_manager.launchindex import LaunchIndex, LaunchSignatures, launch_file_info
+from calibration_manager.setupmodel import COMPONENT_TYPES, ComboBoxDelegate, ComponentModel, TopicModel
+
 class SetupManager(Plugin):
     def __init__(self, context):
         super(SetupManager, self).__init__(context)
         self.setObjectName('SetupManager')
 
-        self.cmp_type_boxes = []
-
         ### Create QWidget
         self._widget = QWidget()
         ui_file = os.path.join(rospack.get_path('calibration_manager'), 'config', 'SetupManager.ui')
@@ -42,6 +44,16 @@ class SetupManager(Plugin):
             self._widget.setWindowTitle(self._widget.windowTitle() + (' (%d)' % context.serial_number()))
         context.add_widget(self._widget)
 
+        ### Set up tree models, restore_settings loads the selected setup into them
+        self.setup = {'components':[]}
+        self.component_model = ComponentModel(self.setup['components'])
+        self._widget.componentTreeView.setModel(self.component_model)
+        self._widget.componentTreeView.setItemDelegateForColumn(2, ComboBoxDelegate(COMPONENT_TYPES, self._widget.componentTreeView))
+        self._widget.componentTreeView.setUniformRowHeights(True)
+        self.topic_model = TopicModel()
+        self._widget.topicTreeView.setModel(self.topic_model)
+        self._widget.topicTreeView.setUniformRowHeights(True)
+
         ### Set up state vars
         self.restore_settings(None,None)
         
@@ -56,25 +68,26 @@ class SetupManager(Plugin):
         self._widget.runDriversPushButton.clicked.connect(self.run_drivers)
 
         ### Set up component param tree
-        self._widget.componentTreeWidget.setHeaderLabels(['Component','Value','Type'])
-        self.setup = {'components':[]}
+        self.launch_index = LaunchIndex()
+        self.launch_index_thread = None
+        self.launch_signatures = LaunchSignatures(find=rospack.get_path)
+        self.launch_path_model = QStringListModel()
+        self.component_completer = QCompleter(self.launch_path_model, self._widget)
         self.list_components()
-        self.component_completer = QCompleter([f['launch_path'] for f in self.launch_files_info])
         self.component_completer.setFilterMode(Qt.MatchContains)
         self._widget.addComponentLineEdit.setCompleter(self.component_completer)
         self._widget.addComponentLineEdit.returnPressed.connect(self.new_component_from_launch)
-        self._widget.componentTreeWidget.setContextMenuPolicy(Qt.CustomContextMenu)  
-        self._widget.componentTreeWidget.customContextMenuRequested.connect(self.component_context_menu)
+        self._widget.componentTreeView.setContextMenuPolicy(Qt.CustomContextMenu)  
+        self._widget.componentTreeView.customContextMenuRequested.connect(self.component_context_menu)
 
         ### Set up topic recording selection
-        self._widget.topicTreeWidget.setHeaderLabels(['group / topic','recording end delay (s)'])       
         self.refresh_topics()
         self._widget.addTopicToolButton.clicked.connect(self.new_topic)
         self._widget.addGroupToolButton.clicked.connect(self.new_topic_group)
         self._widget.refreshToolButton.clicked.connect(self.refresh_topics)
         self._widget.addTopicLineEdit.returnPressed.connect(self.new_topic)
-        self._widget.topicTreeWidget.setContextMenuPolicy(Qt.CustomContextMenu)  
-        self._widget.topicTreeWidget.customContextMenuRequested.connect(self.topic_context_menu)  
+        self._widget.topicTreeView.setContextMenuPolicy(Qt.CustomContextMenu)  
+        self._widget.topicTreeView.customContextMenuRequested.connect(self.topic_context_menu)  
 
         self._widget.savePushButton.clicked.connect(self.save_setup)
 
@@ -150,10 +163,8 @@ class SetupManager(Plugin):
         return False
     
     def fill_setup_combo_box(self):
-        setup_names = [str(f.name) for f in pathlib.Path(self.setup_storage).expanduser().iterdir() \
-                if f.is_dir() \
-                and (f/'setup.yaml').exists() \
-                and not os.path.islink(f)]
+        setup_catalog = catalog.storage_catalog(self.setup_storage) # shared, so refreshes only read new journal lines
+        setup_names = [entry['name'] for entry in setup_catalog.query(setup_yaml=True)]
         if hasattr(self,'setup_names') and setup_names == self.setup_names:
             return
         self.setup_names = setup_names
@@ -203,6 +214,7 @@ class SetupManager(Plugin):
         filedata = filedata.replace('$(env ROS_SETUP)', os.environ.get('ROS_SETUP'))
         with open(setup_path/'setup.yaml', 'w') as file:
             file.write(filedata)
+        catalog.record_setup(setup_path, setup_yaml=True)
 
         self.set_setup_ns(setup_ns=setup_name) # TODO not working?
         self.save_setup()
@@ -214,27 +226,32 @@ class SetupManager(Plugin):
         self.data_storage_deep = self._widget.deepDataStorageLineEdit.text()
 
     def list_components(self):
-        '''Find all launch files eligible to be added as components'''
-        pkg_list = rospack.list()
-        pkg_paths = [pathlib.Path(rospack.get_path(pkg)) for pkg in pkg_list]
-        
+        '''Find all launch files eligible to be added as components
+
+        Runs on a background thread; launch files are added to the completer as they are found.
+        '''
+        if self.launch_index_thread is not None and self.launch_index_thread.isRunning():
+            return
         self.launch_files_info = []
-        for pkg, pth in zip(pkg_list,pkg_paths):
-            lfs = list(pth.glob('**/*.launch'))
-            for lf in lfs:
-                lf = str(lf)
-                self.launch_files_info.append({
-                    'package':pkg,
-                    'package_path':pth,
-                    'launch_path':lf
-                    })
+        self.launch_files_by_path = {}
+        self.launch_path_model.setStringList([])
+        self.launch_index_thread = LaunchIndexThread(self.launch_index)
+        self.launch_index_thread.found.connect(self.add_launch_files)
+        self.launch_index_thread.start()
+
+    def add_launch_files(self, infos: list):
+        self.launch_files_info.extend(infos)
+        self.launch_files_by_path.update((info['launch_path'], info) for info in infos)
+        row = self.launch_path_model.rowCount()
+        self.launch_path_model.insertRows(row, len(infos))
+        for i, info in enumerate(infos):
+            self.launch_path_model.setData(self.launch_path_model.index(row + i), info['launch_path'])
 
     def load_setup_to_trees(self,setup_path):
         '''Parse prior setup and construct a param tree'''
-        self._widget.componentTreeWidget.clear()
-        self._widget.topicTreeWidget.clear()
-
         if not (setup_path / 'setup.yaml').exists():
+            self.component_model.set_items([])
+            self.topic_model.set_items([])
             return
         
         self.setup = yaml.load(setup_path / 'setup.yaml')
@@ -244,19 +261,16 @@ class SetupManager(Plugin):
         self._widget.deepDataStorageLineEdit.setText(self.setup['data_storage_deep'])
         self.set_data_storage_deep()
 
-        # put components into tree
-        if 'components' in self.setup and self.setup['components'] is not None:
-            for cmp in self.setup['components']:
-                self.add_component_to_tree(cmp)
-        self._widget.componentTreeWidget.resizeColumnToContents(0)
+        # put components and recording topics into trees, the models edit the setup dict in place
+        if self.setup.get('components') is None:
+            self.setup['components'] = []
+        self.component_model.set_items(self.setup['components'])
+        self._widget.componentTreeView.resizeColumnToContents(0)
 
-        # put recording topics into tree
-        if 'bags' in self.setup and self.setup['bags'] is not None:
-            for grp in self.setup['bags']:
-                grp_item = self.new_topic_group(group_name=grp['group_name'],enabled=grp['enabled'],end_delay=grp['end_delay'])
-                for tpc in grp['topics']: #self.setup['topics'][group_name].items():
-                    self.load_topic(tpc, grp_item)
-        self._widget.topicTreeWidget.resizeColumnToContents(0)
+        if self.setup.get('bags') is None:
+            self.setup['bags'] = []
+        self.topic_model.set_items(self.setup['bags'])
+        self._widget.topicTreeView.resizeColumnToContents(0)
 
     def save_setup_as(self):
         '''TODO: Create new setup from current setup with changes'''
@@ -265,66 +279,27 @@ class SetupManager(Plugin):
         '''TODO: Rename current setup, altering paths'''
 
     def add_component_to_tree(self, cmp: dict):
-        cmp_item = TreeWidgetItem(self._widget.componentTreeWidget)
-        cmp_item.setFlags(cmp_item.flags() | Qt.ItemIsUserCheckable)
-        cmp_item.setCheckState(0,bool(cmp['enabled'])*2) # for whatever reason checked = 2
-        cmp_item.setFlags(cmp_item.flags() | Qt.ItemIsEditable)
-        cmp_item.editable = [1,0,1]
-        cmp_item._name = cmp['component_name']
-        cmp_item.setText(0,cmp_item._name)
-        cmp_item.setText(1,cmp['component_package'])
-
-        cmb = QComboBox()
-        cmb.addItem('driver','1')
-        cmb.addItem('service','2')
-        cmb.addItem('routine', '3')
-        cmb.setCurrentText(cmp['component_type'])
-        self._widget.componentTreeWidget.setItemWidget(cmp_item, 2 , cmb)
-        self.cmp_type_boxes.append((cmp_item,cmb))
-
-        # add meta params
-        p = TreeWidgetItem(cmp_item)
-        p.editable = [0,0,0]
-        p._name = 'component_launch_file'
-        p.setText(0,p._name)
-        p.setText(1,cmp['component_launch_file'])
-        p.setText(2,'meta')
-
-        p = TreeWidgetItem(cmp_item)
-        p.setFlags(p.flags() | Qt.ItemIsEditable)
-        p.editable = [0,1,0]
-        p._name = 'group_name'
-        p.setText(0,p._name)
-        p.setText(1,cmp['group_name'])
-        p.setText(2,'meta')
-
-        # add arguments
-        for arg_name, val in cmp['args'].items():
-            p = TreeWidgetItem(cmp_item)
-            p.setFlags(p.flags() | Qt.ItemIsEditable)
-            p._name = arg_name
-            p.setText(0,p._name)
-            p.setText(1,val)
-            p.setText(2,'arg')
-
-        # TODO: add ros parameters
+        return self.component_model.append_item(cmp)
 
     def new_component_from_launch(self, component_path: str = None):
         '''Add a new component to the tree'''
         if not component_path:
-            component_path = pathlib.Path(self._widget.addComponentLineEdit.text())
+            component_path = self._widget.addComponentLineEdit.text()
+        component_path = pathlib.Path(component_path)
         component_name = str(component_path.name).split('.')[0] # TODO: list package path too?
 
         if component_name is None:
             return
         
-        launch_file_info = [lf for lf in self.launch_files_info if lf['launch_path'] in str(component_path)][0]
+        launch_file_info = self.launch_files_by_path.get(str(component_path))
+        if launch_file_info is None:
+            rospy.logerr(f'Not a launch file of a known package: {component_path}')
+            return
         component_package = launch_file_info['package']
-        component_relative_path = pathlib.Path(*list(component_path.parts[component_path.parts.index(component_package)+1:]))
+        component_relative_path = component_path.relative_to(launch_file_info['package_path'])
 
         # existing_cmp_names = [key for key in self.setup['components']]
-        existing_cmp_names = [self._widget.componentTreeWidget.topLevelItem(i).data(0,0)
-                              for i in range(self._widget.componentTreeWidget.topLevelItemCount())]
+        existing_cmp_names = self.component_model.component_names()
 
         matches = []
         for existing_cmp_name in existing_cmp_names:
@@ -347,96 +322,46 @@ class SetupManager(Plugin):
             }
                 
         # parse launch file for editable parameters
-        xmlroot = etree.parse(str(component_path))
-        for arg in xmlroot.findall('.//arg'):
-            arg_name = arg.attrib['name']
-            if 'value' in arg.attrib:
-                continue # TODO: show but make uneditable?
-            elif 'default' in arg.attrib:
-                val = arg.attrib['default']
-            else:
-                val = None
-            if '$' in val: # filters out calculated params
-                continue
-            
-            cmp['args'][arg_name] = val
+        signature = self.launch_signatures.signature(component_path)
+        cmp['args'].update(signature['args'])
         
-        self.add_component_to_tree(cmp)
+        cmp_index = self.add_component_to_tree(cmp)
 
-        # TODO: parse include files recursivly...?
+        # show what the component brings up
+        includes = self.launch_signatures.includes(component_path)
+        if includes:
+            self.component_model.set_tooltip(cmp_index.row(), 'includes:\n' + '\n'.join(includes))
 
-        # self.setup['components'].append(cmp) 
-        # BAD, don't construct here so that we have to read the tree (and won't be out of date)
 
     def run_component(self):
         '''run a single component in an external terminal'''
-        root = self._widget.componentTreeWidget.invisibleRootItem()
-        cmp_item = self._widget.componentTreeWidget.selectedItems()[0]
+        index = self._widget.componentTreeView.selectionModel().selectedIndexes()[0]
+        while index.parent().isValid():
+            index = index.parent()
+        cmp = self.component_model.items[index.row()]
 
-        nodes = get_subtree_nodes(cmp_item)
-        component_name = str(cmp_item.data(0,0))
-
-        cmp = {
-            'component_name':component_name,
-            'component_package': str(cmp_item.data(1,0)),
-            'component_type': str(cmp_item.data(2,0)), # driver, routine, or service 
-            'enabled':bool(cmp_item.checkState(0)==2),
-            'args':{}
-        }
-
-        cmp['component_ns'] = cmp_item.data(0,0)
-        cmp['args'] = {}
-        for node in nodes:
-            if node.data(2,0) == 'arg':
-                arg_name = node.data(0,0)
-                arg_val = node.data(1,0)
-                cmp['args'][arg_name] = arg_val
-            elif node.data(2,0) == 'meta':
-                cmp[node.data(0,0)] = node.data(1,0) # metadata like launch file
-            elif node.data(2,0) == 'ros_param':
-                pass
-
-        root = etree.Element("launch")
-        el = root
-        # el = etree.SubElement(el, "group") # TODO: make setup_ns group optional?
-        # el.attrib['ns'] = self.setup_ns 
-        if 'group_name' in cmp and not (cmp['group_name'] is None or cmp['group_name']==""):
-            el = etree.SubElement(el, "group")
-            el.attrib['ns'] = cmp['group_name']
-        cmp_child = etree.SubElement(el, "include")
-        cmp_child.attrib['file'] = f"$(find {cmp['component_package']})/{cmp['component_launch_file']}"
-
-        for arg_name, arg_val in cmp['args'].items():
-            arg_child = etree.SubElement(cmp_child, "arg")
-            arg_child.attrib['name'] = arg_name
-            arg_child.attrib['default'] = arg_val
-            
-        et = etree.ElementTree(root)
-        launch_path = str(pathlib.Path(self.setup_storage).expanduser() / self.setup_ns / 'temp_routine.launch')
-        et.write(launch_path, pretty_print=True)
+        launch_path = pathlib.Path(self.setup_storage).expanduser() / self.setup_ns / 'temp_routine.launch'
+        launchgen.write_if_changed(launch_path, launchgen.launch_to_string(launchgen.components_launch([cmp])))
 
-        subprocess.Popen(['xterm', '-e', 'roslaunch', launch_path])
+        subprocess.Popen(['xterm', '-e', 'roslaunch', str(launch_path)])
 
     def del_component(self):
-        root = self._widget.componentTreeWidget.invisibleRootItem()
-        for item in self._widget.componentTreeWidget.selectedItems():
-            (item.parent() or root).removeChild(item)
+        self.component_model.remove_indexes(self._widget.componentTreeView.selectionModel().selectedIndexes())
 
     def component_context_menu(self, point):
-        index = self._widget.componentTreeWidget.indexAt(point)
+        index = self._widget.componentTreeView.indexAt(point)
         if not index.isValid():
             return
         
-        item = self._widget.componentTreeWidget.itemAt(point)
-        name = item.text(0)
+        name = index.data()
         
         menu = QMenu()
-        if item.parent() is None: # get if it's a top level item... a component
+        if not index.parent().isValid(): # get if it's a top level item... a component
             run_action = menu.addAction("Run")
             # disable_action = menu.addAction("Disable")
             del_action = menu.addAction("Delete")
 
-        action_picked = menu.exec_(self._widget.componentTreeWidget.mapToGlobal(point))
+        action_picked = menu.exec_(self._widget.componentTreeView.mapToGlobal(point))
         if action_picked is None:
             return
         if action_picked == run_action:
@@ -460,63 +385,38 @@ class SetupManager(Plugin):
         self.topic_completer.setFilterMode(Qt.MatchContains)
         self._widget.addTopicLineEdit.setCompleter(self.topic_completer)
 
-    def load_topic(self, topic: dict, group: QTreeWidgetItem):
-        tpc_item = QTreeWidgetItem(group)
-        tpc_item.setFlags(tpc_item.flags() | Qt.ItemIsUserCheckable)
-        tpc_item.setCheckState(0,int(int(topic['enabled'])*2)) # for whatever reason checked = 2
-        # tpc_item.setFlags(tpc_item.flags() | Qt.ItemIsEditable)
-        # tpc_item.editable = [1,0,1]
-        tpc_item._name = topic['topic_name']
-        tpc_item.setText(0,tpc_item._name)
+    def load_topic(self, topic: dict, group_row: int):
+        return self.topic_model.add_topic(group_row, topic['topic_name'], topic['enabled'])
     
     def new_topic_group(self, group_name: str='UNTITLEDBAGGROUP', enabled: bool=True, end_delay: float=0.0):
         if group_name == False:
             group_name = 'UNTITLEDBAGGROUP'
         if end_delay == False or end_delay == None:
             end_delay = 0.0
-        grp_item = TopicGroupTreeWidgetItem(self._widget.topicTreeWidget)
-        grp_item.setFlags(grp_item.flags() | Qt.ItemIsEditable)
-        grp_item.setFlags(grp_item.flags() | Qt.ItemIsUserCheckable)
-        grp_item.setCheckState(0,bool(enabled)*2) # for whatever reason checked = 2
-        
-        # cmp_item.setFlags(cmp_item.flags() | Qt.ItemIsUserCheckable)
-        # cmp_item.setCheckState(0,bool(cmp['enabled'])*2) # for whatever reason checked = 2
-
-        grp_item.editable = [1,1]
-        grp_item._name = group_name
-        grp_item.setText(0,grp_item._name)
-        grp_item.setText(1,str(int(end_delay)))
-        return grp_item
+        return self.topic_model.add_group(group_name, enabled, end_delay)
 
     def new_topic(self):
-        root = self._widget.topicTreeWidget.invisibleRootItem()
-        if len(self._widget.topicTreeWidget.selectedItems()) != 1:
+        selected = self._widget.topicTreeView.selectionModel().selectedRows()
+        if len(selected) != 1:
             return
-        grp_item = list(self._widget.topicTreeWidget.selectedItems())[0]
-
-        tpc_item = QTreeWidgetItem(grp_item)
-        tpc_item.setFlags(tpc_item.flags() | Qt.ItemIsUserCheckable)
-        tpc_item.setCheckState(0,2) # for whatever reason checked = 2
-        tpc_item._name = self._widget.addTopicLineEdit.text()
-        tpc_item.setText(0,tpc_item._name)
+        grp_index = selected[0].parent() if selected[0].parent().isValid() else selected[0]
+        self.topic_model.add_topic(grp_index.row(), self._widget.addTopicLineEdit.text())
+        self._widget.topicTreeView.expand(grp_index)
 
     def del_topic(self):
-        root = self._widget.topicTreeWidget.invisibleRootItem()
-        for item in self._widget.topicTreeWidget.selectedItems():
-            (item.parent() or root).removeChild(item)
+        self.topic_model.remove_indexes(self._widget.topicTreeView.selectionModel().selectedIndexes())
 
     def topic_context_menu(self, point):
-        index = self._widget.topicTreeWidget.indexAt(point)
+        index = self._widget.topicTreeView.indexAt(point)
         if not index.isValid():
             return
         
-        item = self._widget.topicTreeWidget.itemAt(point)
-        name = item.text(0)
+        name = index.data()
         
         menu = QMenu()
         del_action = menu.addAction("Delete")
 
-        action_picked = menu.exec_(self._widget.topicTreeWidget.mapToGlobal(point))
+        action_picked = menu.exec_(self._widget.topicTreeView.mapToGlobal(point))
         if action_picked is None:
             return
         elif action_picked == del_action:
@@ -528,148 +428,65 @@ class SetupManager(Plugin):
         self.setup['data_storage_local'] = self.data_storage_local
         self.setup['data_storage_deep'] = self.data_storage_deep
 
-        # read component tree back to the dictionary           
-        self.setup['components'] = []
-        for i in range(self._widget.componentTreeWidget.topLevelItemCount()):
-
-            cmp_item = self._widget.componentTreeWidget.topLevelItem(i)
-            nodes = get_subtree_nodes(cmp_item)
-            component_name = str(cmp_item.data(0,0))
-
-            for stored_cmp_item, cmb in self.cmp_type_boxes: # read comboboxes
-                if cmp_item is stored_cmp_item:
-                    cmp_type = cmb.currentText()
-
-            cmp = {
-                'component_name':component_name,
-                'component_package': str(cmp_item.data(1,0)),
-                'component_type': cmp_type, # driver, routine, or service 
-                'enabled':bool(cmp_item.checkState(0)==2),
-                'args':{}
-            }
-
-            cmp['component_ns'] = cmp_item.data(0,0)
-            cmp['args'] = {}
-            for node in nodes:
-                if node.data(2,0) == 'arg':
-                    arg_name = node.data(0,0)
-                    arg_val = node.data(1,0)
-                    cmp['args'][arg_name] = arg_val
-                elif node.data(2,0) == 'meta':
-                    cmp[node.data(0,0)] = node.data(1,0) # metadata like launch file
-                elif node.data(2,0) == 'ros_param':
-                    pass
-
-            self.setup['components'].append(cmp)
+        # the component and topic models edit the setup dict in place
+        self.setup['components'] = self.component_model.items
+        for cmp in self.setup['components']:
+            cmp['component_ns'] = cmp['component_name']
+        self.setup['bags'] = self.topic_model.items
 
         setup_dir = pathlib.Path(self.setup_storage).expanduser() / self.setup_ns
 
-        # write drivers.launch
-        root = etree.Element("launch")
-        el = root
-        # setup_el = etree.SubElement(el, "group") # TODO: make setup_ns grouping optional
-        # setup_el.attrib['ns'] = self.setup_ns
-        # el = setup_el
-        for cmp in self.setup['components']:
-            if cmp['component_type'] != 'driver':
-                continue
-            if not cmp['enabled']:
-                continue
-            
-            if 'group_name' in cmp and not (cmp['group_name'] is None or cmp['group_name']==""):
-                print(cmp['group_name'],flush=True)
-                el = etree.SubElement(root, "group")
-                el.attrib['ns'] = cmp['group_name']
-            cmp_child = etree.SubElement(el, "include")
-            cmp_child.attrib['file'] = f"$(find {cmp['component_package']})/{cmp['component_launch_file']}"
-
-            for arg_name, arg_val in cmp['args'].items():
-                arg_child = etree.SubElement(cmp_child, "arg")
-                arg_child.attrib['name'] = arg_name
-                arg_child.attrib['default'] = arg_val
-               
-        et = etree.ElementTree(root)
-        et.write(str(setup_dir / 'drivers.launch'), pretty_print=True)
-
-        # TODO: write services launch? Start services?
-
-        # TODO: write routines launches?
-
-        # Save topics to record
-        self.setup['bags'] = []
-        for i in range(self._widget.topicTreeWidget.topLevelItemCount()):
-            grp_item = self._widget.topicTreeWidget.topLevelItem(i)
-            grp_name = str(grp_item.data(0,0))
-            grp_end_delay = float(grp_item.data(1,0))
-            grp = {'group_name':grp_name,
-                   'end_delay':grp_end_delay,
-                   'enabled': bool(grp_item.checkState(0)==2),
-                   'topics':[]}
-
-            tpc_items = [grp_item.child(i) for i in range(grp_item.childCount())]
-            for tpc_item in tpc_items:
-                topic_name = str(tpc_item.data(0,0))
-                tpc = {
-                    'topic_name': topic_name,
-                    'enabled': bool(tpc_item.checkState(0)==2)
-                }
-                grp['topics'].append(tpc)
-
-            self.setup['bags'].append(grp)
-
-        yaml.dump(self.setup, pathlib.Path(self.setup_storage).expanduser() / self.setup_ns / 'setup.yaml')
+        yaml.dump(self.setup, setup_dir / 'setup.yaml')
+
+        # write drivers.launch, services.launch and routine launch files
+        launchgen.write_launch_files(self.setup, setup_dir)
 
     def discard_setup_changes(self):
         pass
 
     def shutdown_plugin(self):
         self.save_settings(None,None)
+        if self.launch_index_thread is not None:
+            self.launch_index_thread.requestInterruption()
+            self.launch_index_thread.wait()
 
     def trigger_configuration(self): 
         pass # stub for gear icon
 
-# QT Tree management
-class TreeWidgetItem(QTreeWidgetItem):
-    def __init__(self, parent=None):
-        super(TreeWidgetItem, self).__init__(parent)
-        self.editable = [0,1,0] # defaults to locking name and type, not val
-
-    def setData(self, column, role, value): 
-        if self.editable[column] == 0 and role == 2:
-            return
-        super(TreeWidgetItem, self).setData(column, role, value)
-        self._name = str(value)
-        # TODO: make tree highlight changes until saved? Below does not work.
-        # super(TreeWidgetItem, self).setStyleSheet("color: red;")
-        # super(TreeWidgetItem, self).setBackground(1,QColor('red')) # WORKS when outside of the class??
-        # super(TreeWidgetItem, self).setBackgroundColor(1, QColor('red'))
-        # self.setStyleSheet("background-color: green;")
-
-class TopicGroupTreeWidgetItem(QTreeWidgetItem):
-    def __init__(self, parent=None):
-        super(TopicGroupTreeWidgetItem, self).__init__(parent)
-        self.editable = [1,1] # editable by default
-
-    def setData(self, column, role, value): 
-        if self.editable[column] == 0 and role == 2:
-            return
-        blacklist = [' ',',','_','-','.','/','\\',':','*','?','"', '<','>','|']
-        if column == 0 and isinstance(value,str): #TODO: check unique group name too # and any(x in value for x in blacklist)
-            for c in blacklist:
-                value = value.replace(c,'')
-        if column == 1 and not value.isnumeric():
-            return # TODO: set red
-        super(TopicGroupTreeWidgetItem, self).setData(column, role, value)
-        self._name = str(value)
-
-def get_subtree_nodes(tree_widget_item):
-    """Returns all QTreeWidgetItems in the subtree rooted at the given node."""
-    nodes = []
-    nodes.append(tree_widget_item)
-    for i in range(tree_widget_item.childCount()):
-        nodes.extend(get_subtree_nodes(tree_widget_item.child(i)))
-    return nodes
-
+class LaunchIndexThread(QThread):
+    """
+    Updates a LaunchIndex in the background, emitting found with lists of launch file infos
+
+    Results are batched so the gui thread isn't flooded with a signal per package; the index is
+    written back when done, also if interrupted part way.
+    """
+    found = Signal(list)
+
+    def __init__(self, launch_index: LaunchIndex, batch_interval: float = 0.1):
+        super(LaunchIndexThread, self).__init__()
+        self.launch_index = launch_index
+        self.batch_interval = batch_interval
+
+    def run(self):
+        packages = {pkg: rospack.get_path(pkg) for pkg in rospack.list()}
+        batch = []
+        last_emit = time.monotonic()
+        rescanned = 0
+        try:
+            for pkg, pth, lfs, rescan in self.launch_index.update(packages):
+                batch.extend(launch_file_info(pkg, pth, lf) for lf in lfs)
+                rescanned += rescan
+                if batch and time.monotonic() - last_emit > self.batch_interval:
+                    self.found.emit(batch)
+                    batch = []
+                    last_emit = time.monotonic()
+                if self.isInterruptionRequested():
+                    break
+            if batch:
+                self.found.emit(batch)
+        finally:
+            self.launch_index.write()
+        rospy.loginfo(f'Indexed launch files of {len(packages)} packages, {rescanned} rescanned')
 
 '''
 TODO list
@@ -731,4 +548,4 @@ X move setup_manager into calibratation_manager package
         # print(name)
         # data = index.model().data(index,0)
         # for key in index.model().itemData(index):
-        #     print('self.model.itemData(index):    key: %s  value: %s'%(key, str(index.model().itemData(index)[key])))
\ No newline at end of file
+        #     print('self.model.itemData(index):    key: %s  value: %s'%(key, str(index.model().itemData(index)[key])))
@@ -0,0 +1,321 @@
+'''
+Qt item models of a setup's components and recording topics, for the rqt SetupManager
+
+The models edit the setup dict in place (setup['components'] and setup['bags']), so saving is just
+dumping the dict, and views only ask for the rows they show. Only Qt is needed (via
+python_qt_binding), so they can be exercised headless with QT_QPA_PLATFORM=offscreen.
+'''
+
+from python_qt_binding.QtCore import QAbstractItemModel, QModelIndex, Qt
+from python_qt_binding.QtWidgets import QComboBox, QStyledItemDelegate
+
+COMPONENT_TYPES = ['driver', 'service', 'routine']
+META_KEYS = ['component_launch_file', 'group_name']
+GROUP_NAME_BLACKLIST = [' ',',','_','-','.','/','\\',':','*','?','"', '<','>','|']
+
+class SetupTreeModel(QAbstractItemModel):
+    """
+    Two level tree: a list of dicts as the top level rows, each with its own child rows
+
+    Top level indexes carry no pointer, child indexes point to their parent's dict. Subclasses
+    implement child_count, item_data, item_flags and set_item_data.
+    """
+    headers = []
+
+    def __init__(self, items: list = None, parent=None):
+        super(SetupTreeModel, self).__init__(parent)
+        self.items = []
+        self._rows = {} # id(item): row
+        self.set_items([] if items is None else items)
+
+    def set_items(self, items: list):
+        '''Show a new list (which is then edited in place)'''
+        for item in items:
+            self.prepare(item)
+        self.beginResetModel()
+        self.items = items
+        self._rows = {id(item): row for row, item in enumerate(items)}
+        self.endResetModel()
+
+    def prepare(self, item: dict):
+        '''Fill in what rows need but the setup.yaml may leave out'''
+
+    def child_count(self, item: dict):
+        raise NotImplementedError
+
+    def item(self, index: QModelIndex):
+        '''(top level dict, child row or None) of an index'''
+        parent_item = index.internalPointer()
+        if parent_item is None:
+            return self.items[index.row()], None
+        return parent_item, index.row()
+
+    def index(self, row, column, parent=QModelIndex()):
+        if not self.hasIndex(row, column, parent):
+            return QModelIndex()
+        if not parent.isValid():
+            return self.createIndex(row, column, None)
+        if parent.internalPointer() is None:
+            return self.createIndex(row, column, self.items[parent.row()])
+        return QModelIndex()
+
+    def parent(self, index):
+        if not index.isValid() or index.internalPointer() is None:
+            return QModelIndex()
+        return self.createIndex(self._rows[id(index.internalPointer())], 0, None)
+
+    def rowCount(self, parent=QModelIndex()):
+        if not parent.isValid():
+            return len(self.items)
+        if parent.internalPointer() is None and parent.column() == 0:
+            return self.child_count(self.items[parent.row()])
+        return 0
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(self.headers)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.headers[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        item, child = self.item(index)
+        return self.item_data(item, child, index.column(), role)
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        item, child = self.item(index)
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable | self.item_flags(item, child, index.column())
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid():
+            return False
+        item, child = self.item(index)
+        if not self.set_item_data(item, child, index.column(), value, role):
+            return False
+        self.dataChanged.emit(index, index, [role])
+        return True
+
+    def append_item(self, item: dict):
+        '''Add a top level row, returns its index'''
+        self.prepare(item)
+        row = len(self.items)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.items.append(item)
+        self._rows[id(item)] = row
+        self.endInsertRows()
+        return self.index(row, 0)
+
+    def remove_indexes(self, indexes: list):
+        '''Remove the rows of indexes (any column, top level or child)'''
+        top_rows = {index.row() for index in indexes if not index.parent().isValid()}
+        child_rows = {(index.parent().row(), index.row()) for index in indexes
+                      if index.parent().isValid() and index.parent().row() not in top_rows}
+        for parent_row, row in sorted(child_rows, reverse=True):
+            self.removeRows(row, 1, self.index(parent_row, 0))
+        for row in sorted(top_rows, reverse=True):
+            self.removeRows(row, 1)
+
+    def removeRows(self, row, count, parent=QModelIndex()):
+        if parent.isValid():
+            item = self.items[parent.row()]
+            if not self.can_remove_children(item, row, count):
+                return False
+            self.beginRemoveRows(parent, row, row + count - 1)
+            self.remove_children(item, row, count)
+            self.endRemoveRows()
+            return True
+        self.beginRemoveRows(QModelIndex(), row, row + count - 1)
+        del self.items[row:row + count]
+        self._rows = {id(item): r for r, item in enumerate(self.items)}
+        self.endRemoveRows()
+        return True
+
+    def can_remove_children(self, item: dict, row: int, count: int):
+        return True
+
+    def remove_children(self, item: dict, row: int, count: int):
+        raise NotImplementedError
+
+def check_state(enabled):
+    return Qt.Checked if enabled else Qt.Unchecked
+
+def is_checked(value):
+    # PyQt5 hands back an int, PySide2 a CheckState
+    return value == Qt.Checked or value == 2
+
+class ComponentModel(SetupTreeModel):
+    """
+    Components of a setup: one row per component (name, package, type, checked if enabled), with the
+    launch file, group name and launch args as children
+    """
+    headers = ['Component','Value','Type']
+
+    def set_items(self, items: list):
+        self.tooltips = {} # id(component): tooltip of its launch file
+        super(ComponentModel, self).set_items(items)
+
+    def prepare(self, cmp: dict):
+        if cmp.get('args') is None:
+            cmp['args'] = {}
+
+    def child_count(self, cmp: dict):
+        return len(META_KEYS) + len(cmp['args'])
+
+    def child_key(self, cmp: dict, child: int):
+        '''(key, 'meta' or 'arg') of a child row'''
+        if child < len(META_KEYS):
+            return META_KEYS[child], 'meta'
+        return list(cmp['args'])[child - len(META_KEYS)], 'arg'
+
+    def item_data(self, cmp, child, column, role):
+        if child is None:
+            if role in (Qt.DisplayRole, Qt.EditRole):
+                return str([cmp.get('component_name'), cmp.get('component_package'), cmp.get('component_type')][column] or '')
+            if role == Qt.CheckStateRole and column == 0:
+                return check_state(cmp.get('enabled', True))
+            return None
+        key, kind = self.child_key(cmp, child)
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            if column == 0:
+                return key
+            if column == 1:
+                val = cmp.get(key) if kind == 'meta' else cmp['args'][key]
+                return '' if val is None else str(val)
+            return kind
+        if role == Qt.ToolTipRole and key == 'component_launch_file':
+            return self.tooltips.get(id(cmp))
+        return None
+
+    def item_flags(self, cmp, child, column):
+        if child is None:
+            return {0: Qt.ItemIsUserCheckable | Qt.ItemIsEditable, 1: Qt.NoItemFlags, 2: Qt.ItemIsEditable}[column]
+        key, kind = self.child_key(cmp, child)
+        if column == 1 and (kind == 'arg' or key == 'group_name'):
+            return Qt.ItemIsEditable
+        return Qt.NoItemFlags
+
+    def set_item_data(self, cmp, child, column, value, role):
+        if child is None:
+            if role == Qt.CheckStateRole and column == 0:
+                cmp['enabled'] = is_checked(value)
+            elif role == Qt.EditRole and column == 0 and value:
+                cmp['component_name'] = str(value)
+            elif role == Qt.EditRole and column == 2 and value in COMPONENT_TYPES:
+                cmp['component_type'] = value
+            else:
+                return False
+            return True
+        key, kind = self.child_key(cmp, child)
+        if role != Qt.EditRole or column != 1:
+            return False
+        if kind == 'arg':
+            cmp['args'][key] = str(value)
+        else:
+            cmp[key] = str(value)
+        return True
+
+    def can_remove_children(self, cmp, row, count):
+        return row >= len(META_KEYS) # meta rows stay, args may be removed
+
+    def remove_children(self, cmp, row, count):
+        for key in list(cmp['args'])[row - len(META_KEYS):row - len(META_KEYS) + count]:
+            del cmp['args'][key]
+
+    def component_names(self):
+        return [cmp['component_name'] for cmp in self.items]
+
+    def set_tooltip(self, row: int, tooltip: str):
+        '''Tooltip of a component's launch file row, e.g. the files it includes'''
+        self.tooltips[id(self.items[row])] = tooltip
+        index = self.index(0, 1, self.index(row, 0))
+        self.dataChanged.emit(index, index, [Qt.ToolTipRole])
+
+class TopicModel(SetupTreeModel):
+    """
+    Recording groups of a setup (name and end delay, checked if enabled) with their topics as children
+    """
+    headers = ['group / topic','recording end delay (s)']
+
+    def prepare(self, grp: dict):
+        if grp.get('topics') is None:
+            grp['topics'] = []
+
+    def child_count(self, grp: dict):
+        return len(grp['topics'])
+
+    def item_data(self, grp, child, column, role):
+        if child is None:
+            if role in (Qt.DisplayRole, Qt.EditRole):
+                return str(grp['group_name']) if column == 0 else str(int(float(grp.get('end_delay') or 0)))
+            if role == Qt.CheckStateRole and column == 0:
+                return check_state(grp.get('enabled', True))
+            return None
+        tpc = grp['topics'][child]
+        if role in (Qt.DisplayRole, Qt.EditRole) and column == 0:
+            return str(tpc['topic_name'])
+        if role == Qt.CheckStateRole and column == 0:
+            return check_state(tpc.get('enabled', True))
+        return None
+
+    def item_flags(self, grp, child, column):
+        if child is None:
+            return Qt.ItemIsEditable | (Qt.ItemIsUserCheckable if column == 0 else Qt.NoItemFlags)
+        return Qt.ItemIsUserCheckable if column == 0 else Qt.NoItemFlags
+
+    def set_item_data(self, grp, child, column, value, role):
+        target = grp if child is None else grp['topics'][child]
+        if role == Qt.CheckStateRole and column == 0:
+            target['enabled'] = is_checked(value)
+            return True
+        if role != Qt.EditRole or child is not None:
+            return False
+        if column == 0: #TODO: check unique group name too
+            for c in GROUP_NAME_BLACKLIST:
+                value = str(value).replace(c,'')
+            grp['group_name'] = value
+            return True
+        try:
+            grp['end_delay'] = float(value)
+        except ValueError:
+            return False # TODO: set red
+        return True
+
+    def remove_children(self, grp, row, count):
+        del grp['topics'][row:row + count]
+
+    def add_group(self, group_name: str = 'UNTITLEDBAGGROUP', enabled: bool = True, end_delay: float = 0.0):
+        return self.append_item({'group_name': group_name, 'end_delay': float(end_delay), 'enabled': bool(enabled), 'topics': []})
+
+    def add_topic(self, group_row: int, topic_name: str, enabled: bool = True):
+        grp = self.items[group_row]
+        row = len(grp['topics'])
+        parent = self.index(group_row, 0)
+        self.beginInsertRows(parent, row, row)
+        grp['topics'].append({'topic_name': topic_name, 'enabled': bool(enabled)})
+        self.endInsertRows()
+        return self.index(row, 0, parent)
+
+class ComboBoxDelegate(QStyledItemDelegate):
+    """
+    Edits a column with a combo box of fixed choices, created only while a cell is being edited
+    """
+    def __init__(self, choices: list, parent=None):
+        super(ComboBoxDelegate, self).__init__(parent)
+        self.choices = choices
+
+    def createEditor(self, parent, option, index):
+        editor = QComboBox(parent)
+        editor.addItems(self.choices)
+        editor.activated.connect(lambda _: self.commitData.emit(editor))
+        return editor
+
+    def setEditorData(self, editor, index):
+        editor.setCurrentText(str(index.data(Qt.EditRole)))
+
+    def setModelData(self, editor, model, index):
+        model.setData(index, editor.currentText(), Qt.EditRole)
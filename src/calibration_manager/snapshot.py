@@ -0,0 +1,225 @@
+'''
+Consolidated snapshots of a setup: the selected cfg and cal of every component in a single file.
+
+Loading a setup from its directories opens a cfg.yaml, a cal.yaml and one file per array for each
+component, which is slow on network storage. A snapshot holds the same trees and file contents in one
+container that is opened with a single mmap. The component directories stay the source of truth; a
+snapshot is a derived, read-only copy to be refreezed after new calibrations (see is_current()).
+
+Layout, all offsets from the start of the file:
+    MAGIC (8 bytes), header length (uint64 little endian), header (utf-8 json), data
+The header holds the yaml trees and, for every referenced file, the offset of its content. Arrays are
+stored as their raw data at ALIGN byte aligned offsets and loaded as zero-copy views of the mmap;
+other files (tables, object arrays) are stored as the original file bytes and parsed from memory.
+'''
+
+import io
+import json
+import mmap
+import os
+import pathlib
+import struct
+
+import numpy as np
+
+MAGIC = b'CALSNAP1'
+HEADER_LENGTH = struct.Struct('<Q')
+ALIGN = 64
+SNAPSHOT_FILE = '.snapshot'
+
+def freeze(setup, path, run_time_epoch: int = None, fsync: bool = True):
+    '''Write a snapshot of the cfg and cal every component of setup would load at run_time_epoch
+
+    The file is written next to path and renamed over it, so readers see the old or the new snapshot.
+    Returns the names of the frozen components.
+    '''
+    from calibration_manager.manager import file_loaders, load_yaml
+
+    path = pathlib.Path(path)
+    header = {'version': 1, 'setup': setup.setup_name, 'run_time_epoch': run_time_epoch, 'components': {}}
+    files = [] # (source path, entry) in data order
+    offset = 0
+    for component_name in setup.list_components():
+        component = {}
+        for kind, folder in (('cfg', setup.find_cfg_dir(component_name, run_time_epoch)),
+                             ('cal', setup.find_cal_dir(component_name, run_time_epoch))):
+            if folder is None:
+                continue
+            yaml_path = folder / f'{kind}.yaml'
+            st = os.stat(yaml_path)
+            tree = load_yaml(yaml_path, mode=setup.yaml_mode)
+            entries = {}
+            for name in file_references(tree):
+                f = folder / name
+                if f.suffix not in file_loaders or not f.is_file() or name in entries:
+                    continue
+                entry = file_entry(f)
+                offset = align(offset)
+                entry['offset'] = offset
+                offset += entry['nbytes']
+                entries[name] = entry
+                files.append((f, entry))
+            component[kind] = {
+                'dir': str(folder.relative_to(setup.setup_dir)),
+                'mtime_ns': st.st_mtime_ns,
+                'tree': tree,
+                'files': entries,
+            }
+        if component:
+            header['components'][component_name] = component
+
+    header_bytes = json.dumps(header, default=to_json).encode()
+    data_start = align(len(MAGIC) + HEADER_LENGTH.size + len(header_bytes))
+    tmp_path = path.with_name(f'.{path.name}-{os.getpid()}.tmp')
+    try:
+        with open(tmp_path, 'wb') as out:
+            out.write(MAGIC)
+            out.write(HEADER_LENGTH.pack(len(header_bytes)))
+            out.write(header_bytes)
+            for f, entry in files:
+                out.seek(data_start + entry['offset'])
+                with open(f, 'rb') as src:
+                    src.seek(entry.pop('file_offset'))
+                    copy_bytes(src, out, entry['nbytes'])
+            out.truncate(max(out.tell(), data_start))
+            if fsync:
+                out.flush()
+                os.fsync(out.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    return list(header['components'])
+
+class Snapshot:
+    """
+    A read-only, memory-mapped snapshot written by freeze()
+
+    Arrays returned by load_component() are read-only views of the mapping, which stays open as long
+    as any of them is referenced.
+
+    path: the snapshot file
+    """
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        with open(self.path, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'{self.path} is not a calibration snapshot')
+        start = len(MAGIC) + HEADER_LENGTH.size
+        (length,) = HEADER_LENGTH.unpack_from(self.mmap, len(MAGIC))
+        self.header = json.loads(self.mmap[start:start + length], object_hook=from_json)
+        self.data_start = align(start + length)
+
+    @property
+    def component_names(self):
+        return list(self.header['components'])
+
+    def load_component(self, component_name: str, kind: str):
+        '''The loaded cfg or cal tree of a component (kind 'cfg' or 'cal'), and its source folder
+
+        Returns (None, None) if the component had none when frozen.
+        '''
+        component = self.header['components'][component_name].get(kind)
+        if component is None:
+            return None, None
+        return self._resolve(component['tree'], component['files']), component['dir']
+
+    def _resolve(self, d, files: dict):
+        if not isinstance(d, dict):
+            return d
+        d = dict(d)
+        for k, v in d.items():
+            if isinstance(v, str) and v in files:
+                d[k] = self.read(files[v])
+            elif isinstance(v, dict):
+                d[k] = self._resolve(v, files)
+        return d
+
+    def read(self, entry: dict):
+        offset = self.data_start + entry['offset']
+        if entry['format'] == 'array':
+            return np.ndarray(entry['shape'], dtype=np.lib.format.descr_to_dtype(entry['dtype']),
+                              buffer=self.mmap, offset=offset, order='F' if entry['fortran_order'] else 'C')
+        from calibration_manager.manager import file_loaders
+        data = io.BytesIO(self.mmap[offset:offset + entry['nbytes']])
+        return file_loaders[entry['suffix']](data)
+
+    def is_current(self, setup_dir):
+        '''Whether every frozen cfg.yaml/cal.yaml is unchanged and no component has a newer calibration
+
+        Costs a stat per component, far less than a load but not free on network storage.
+        '''
+        from calibration_manager.timeline import Timeline
+        setup_dir = pathlib.Path(setup_dir)
+        if self.header['run_time_epoch'] is not None:
+            return True # calibrations at a fixed time don't change
+        components = self.header['components']
+        if set(components) != {d.name for d in setup_dir.iterdir() if d.is_dir() and not d.name.startswith('.')}:
+            return False
+        for component_name, component in components.items():
+            latest = Timeline(setup_dir / component_name.strip('/').replace('/','+')).latest()
+            if latest != (pathlib.Path(component['cal']['dir']).name if 'cal' in component else None):
+                return False
+            for kind, source in component.items():
+                try:
+                    if os.stat(setup_dir / source['dir'] / f'{kind}.yaml').st_mtime_ns != source['mtime_ns']:
+                        return False
+                except FileNotFoundError:
+                    return False
+        return True
+
+    def close(self):
+        '''Unmap the file, only possible once no arrays of the snapshot are referenced any more'''
+        self.mmap.close()
+
+def file_references(d):
+    '''All strings in a yaml tree, candidates for file references (see load_to_dict)'''
+    if isinstance(d, dict):
+        for v in d.values():
+            if isinstance(v, str):
+                yield v
+            elif isinstance(v, dict):
+                yield from file_references(v)
+
+def file_entry(f: pathlib.Path):
+    '''Describe how to store file f: as raw array data if it is a plain .npy, otherwise its bytes'''
+    if f.suffix == '.npy':
+        try:
+            arr = np.load(f, mmap_mode='r')
+        except ValueError: # object arrays can't be mapped, store the pickle
+            pass
+        else:
+            return {
+                'format': 'array',
+                'dtype': np.lib.format.dtype_to_descr(arr.dtype),
+                'shape': list(arr.shape),
+                'fortran_order': bool(arr.flags.f_contiguous and not arr.flags.c_contiguous),
+                'file_offset': arr.offset,
+                'nbytes': arr.nbytes,
+            }
+    return {'format': 'file', 'suffix': f.suffix, 'file_offset': 0, 'nbytes': f.stat().st_size}
+
+def copy_bytes(src, dest, nbytes: int):
+    while nbytes > 0:
+        chunk = src.read(min(nbytes, 2**24))
+        if not chunk:
+            raise EOFError(f'{src.name} is shorter than expected')
+        dest.write(chunk)
+        nbytes -= len(chunk)
+
+def align(offset: int):
+    return -(-offset // ALIGN) * ALIGN
+
+def to_json(value):
+    '''Encode yaml values json has no type for (e.g. timestamps) as tagged yaml text'''
+    from calibration_manager.manager import thread_yaml
+    buf = io.StringIO()
+    thread_yaml().dump(value, buf)
+    return {'__yaml__': buf.getvalue()}
+
+def from_json(d: dict):
+    if len(d) == 1 and '__yaml__' in d:
+        from calibration_manager.manager import thread_yaml
+        return thread_yaml().load(d['__yaml__'])
+    return d
@@ -0,0 +1,122 @@
+'''
+Storage formats for pandas DataFrame calibrations
+
+csv is the original text format. parquet and feather (pyarrow) and npz (numpy record array)
+store the frame in binary, keeping dtypes, the index and the row/column labels. Labels a format
+can't store exactly are refused with a ValueError rather than changed on the way.
+'''
+
+import json
+import pathlib
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow
+    import pyarrow.feather
+    imports_pyarrow = True
+except ImportError:
+    imports_pyarrow = False
+
+def save_csv(f, df: pd.DataFrame):
+    df.to_csv(f)
+
+def load_csv(f: pathlib.Path, mmap_mode: str = None):
+    return pd.read_csv(f)
+
+def save_parquet(f, df: pd.DataFrame):
+    df.to_parquet(f)
+
+def load_parquet(f: pathlib.Path, mmap_mode: str = None):
+    return pd.read_parquet(f)
+
+def save_feather(f, df: pd.DataFrame):
+    # the index and labels are restored from the pandas metadata arrow keeps in the schema
+    for labels in [df.index, df.columns]:
+        levels = labels.levels if isinstance(labels, pd.MultiIndex) else [labels]
+        if any(level.inferred_type.startswith('mixed') for level in levels):
+            raise ValueError(f'feather tables can not store mixed type or tuple labels {list(labels[:3])}, '
+                             'use table_format npz or convert them to str')
+    pyarrow.feather.write_feather(pyarrow.Table.from_pandas(df, preserve_index=True), f)
+
+def load_feather(f: pathlib.Path, mmap_mode: str = None):
+    return pd.read_feather(f)
+
+def encode_label(label):
+    '''JSON form of a row/column label, tuples (MultiIndex keys) are tagged to come back as tuples'''
+    if isinstance(label, np.generic):
+        label = label.item()
+    if isinstance(label, tuple):
+        return {'tuple': [encode_label(l) for l in label]}
+    if label is None or isinstance(label, (str, int, float)):
+        return label
+    raise ValueError(f'npz tables can only store str, int, float, bool, None or tuple labels, not {label!r}, '
+                     'use table_format parquet or convert them')
+
+def decode_label(label):
+    if isinstance(label, dict):
+        return tuple(decode_label(l) for l in label['tuple'])
+    if isinstance(label, list): # written before tuples were tagged
+        return tuple(decode_label(l) for l in label)
+    return label
+
+def save_npz(f, df: pd.DataFrame):
+    '''Store a frame as a numpy record array, with the index and column labels alongside
+
+    The record fields are named by position (i0.. for index levels, c0.. for columns), so labels that
+    aren't valid or unique field names are kept too.
+    '''
+    n_index = df.index.nlevels
+    index_fields = [f'i{i}' for i in range(n_index)]
+    plain = df.set_axis([f'c{i}' for i in range(df.shape[1])], axis=1)
+    plain.index = plain.index.set_names(index_fields)
+    meta = {
+        'index_fields': index_fields,
+        'index_names': [encode_label(name) for name in df.index.names],
+        'columns': [encode_label(label) for label in df.columns],
+        'column_names': [encode_label(name) for name in df.columns.names],
+    }
+    np.savez(f, records=plain.to_records(index=True), meta=np.array(json.dumps(meta)))
+
+def load_npz(f: pathlib.Path, mmap_mode: str = None):
+    with np.load(f, allow_pickle=True) as z:
+        if 'records' not in z or 'meta' not in z: # not a table, return the stored arrays
+            return {k: z[k] for k in z.files}
+        records = z['records']
+        meta = json.loads(str(z['meta']))
+    df = pd.DataFrame.from_records(records, index=meta['index_fields'])
+    df.index.names = [decode_label(name) for name in meta['index_names']]
+    columns = [decode_label(label) for label in meta['columns']]
+    column_names = [decode_label(name) for name in meta.get('column_names', [None])]
+    if len(column_names) > 1:
+        df.columns = pd.MultiIndex.from_tuples(columns, names=column_names)
+    else:
+        df.columns = pd.Index(columns, name=column_names[0], tupleize_cols=False)
+    return df
+
+# table format name: (file suffix, writer)
+table_formats = {
+    'csv': ('.csv', save_csv),
+    'parquet': ('.parquet', save_parquet),
+    'feather': ('.feather', save_feather),
+    'npz': ('.npz', save_npz),
+}
+
+# readers by file suffix
+table_loaders = {
+    '.csv': load_csv,
+    '.parquet': load_parquet,
+    '.feather': load_feather,
+    '.npz': load_npz,
+}
+
+def resolve_table_format(table_format: str):
+    '''Get the (suffix, writer) of a table format, 'auto' picks parquet if pyarrow is installed, else npz'''
+    if table_format == 'auto':
+        table_format = 'parquet' if imports_pyarrow else 'npz'
+    if table_format not in table_formats:
+        raise ValueError(f'unknown table format {table_format}, choose one of {list(table_formats)} or auto')
+    if table_format in ['parquet', 'feather'] and not imports_pyarrow:
+        raise ImportError(f'table format {table_format} requires pyarrow')
+    return table_formats[table_format]
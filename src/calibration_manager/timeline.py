@@ -0,0 +1,208 @@
+import bisect
+import json
+import logging
+import os
+import pathlib
+import re
+import threading
+import time
+
+import numpy as np
+
+from calibration_manager.archive import archived_cal_ids
+
+INDEX_DIR = '.timeline'
+INDEX_FILE = 'index.json'
+INDEX_VERSION = 2
+
+CAL_ID_PATTERN = re.compile(r'^(\d+)(?:\.(\d{1,9}))?$')
+MAX_EPOCH = 9 * 10**9
+
+class Timeline:
+    """
+    A persistent, sorted index of the timestamped calibrations in a component directory
+
+    The index is stored in {component_dir}/.timeline/index.json along with the mtime of the
+    component directory at the time it was built. Adding or removing a calibration folder changes
+    that mtime, so a stale index is detected with a single stat and rebuilt from a directory scan.
+    Writing the index itself only touches the .timeline/ subdirectory, not the component directory.
+
+    Calibrations are identified by their folder name (cal id), see new_cal_id(). Calibrations moved to
+    the component's archive by pruning (see archive.py) stay in the timeline.
+
+    component_dir: path to the component folder holding the timestamped cal folders
+    """
+    def __init__(self, component_dir):
+        self.component_dir = pathlib.Path(component_dir)
+        self.index_path = self.component_dir / INDEX_DIR / INDEX_FILE
+        self._index = None # (names, keys): sorted cal ids and their sort keys in ns since epoch
+        self._dir_mtime_ns = None
+        # held while refreshing or adding; readers take _index without it, it is replaced whole, never modified
+        self._lock = threading.RLock()
+
+    def snapshot(self):
+        '''(names, keys) of the index, refreshed if stale
+
+        The pair is consistent and never modified, so it can be used while other threads add calibrations.
+        '''
+        self.refresh()
+        return self._index
+
+    def names(self):
+        '''Sorted list of all cal ids, refreshed if the index is stale'''
+        return self.snapshot()[0]
+
+    def at(self, run_time_epoch: int = None):
+        '''Cal id of the latest calibration at or before run_time_epoch, or the latest overall if None
+
+        An int run_time_epoch covers its whole second, as with whole-second cal ids, so calibrations made
+        during that second apply; a float is resolved to the nanosecond (see epoch_to_ns).
+        If run_time_epoch preceeds every calibration, the earliest calibration is returned.
+        Returns None when the component has no calibrations.
+        '''
+        names, keys = self.snapshot()
+        if len(names) == 0:
+            return None
+        if run_time_epoch is None:
+            return names[-1]
+        i = bisect.bisect_right(keys, epoch_to_ns(run_time_epoch)) - 1
+        return names[max(i, 0)]
+
+    def at_many(self, run_time_epochs, snapshot: tuple = None):
+        '''Vectorized at(): index into names() of the calibration for each of an array of epochs
+
+        Returns an int array the shape of run_time_epochs, or None if there are no calibrations.
+        snapshot: (names, keys) from snapshot() to index into, so the indices stay valid while
+        calibrations are added
+        '''
+        names, keys = self.snapshot() if snapshot is None else snapshot
+        if len(names) == 0:
+            return None
+        run_time_epochs = np.clip(np.asarray(run_time_epochs), -MAX_EPOCH, MAX_EPOCH) # keep ns in int64
+        if np.issubdtype(run_time_epochs.dtype, np.integer):
+            epoch_keys = (run_time_epochs.astype(np.int64) + 1) * 10**9 - 1 # through the end of the second
+        else:
+            epoch_keys = np.floor(run_time_epochs.astype(np.float64) * 1e9).astype(np.int64)
+        i = np.searchsorted(np.asarray(keys, dtype=np.int64), epoch_keys, side='right') - 1
+        return np.clip(i, 0, None)
+
+    def latest(self):
+        '''Cal id of the most recent calibration, or None'''
+        return self.at(None)
+
+    def add(self, name: str):
+        '''Insert a newly written calibration and persist the index
+
+        Call refresh() before writing the calibration, and hold the component lock (see atomic.py)
+        across both, so the index is known to be current apart from this calibration.
+        '''
+        with self._lock:
+            if self._index is None:
+                self.refresh()
+            names, keys = self._index
+            name = str(name)
+            key = parse_cal_id(name)
+            i = bisect.bisect_left(keys, key)
+            if i == len(keys) or names[i] != name:
+                self._index = (names[:i] + [name] + names[i:], keys[:i] + [key] + keys[i:])
+            self._dir_mtime_ns = self._stat_dir()
+            self._write()
+
+    def refresh(self):
+        '''Load the persisted index, rebuilding it if it no longer matches the directory'''
+        dir_mtime_ns = self._stat_dir()
+        if self._index is not None and dir_mtime_ns == self._dir_mtime_ns:
+            return
+        with self._lock:
+            dir_mtime_ns = self._stat_dir()
+            if self._index is not None and dir_mtime_ns == self._dir_mtime_ns:
+                return # refreshed by another thread meanwhile
+            if not self._read() or dir_mtime_ns != self._dir_mtime_ns:
+                self.rebuild()
+
+    def rebuild(self):
+        '''Rescan the component directory and rewrite the index'''
+        logging.debug(f'rebuilding timeline index for {self.component_dir}')
+        with self._lock:
+            # make the index dir before the stat, so creating it doesn't invalidate the new index
+            try:
+                (self.component_dir / INDEX_DIR).mkdir(parents=True, exist_ok=True)
+            except OSError:
+                pass # read-only setup, _write warns
+            dir_mtime_ns = self._stat_dir()
+            names = sorted(set(scan_cal_ids(self.component_dir)) | set(archived_cal_ids(self.component_dir)), key=parse_cal_id)
+            # the index before its mtime, so readers that see the new mtime see the new index
+            self._index = (names, [parse_cal_id(name) for name in names])
+            self._dir_mtime_ns = dir_mtime_ns
+            self._write()
+
+    def _stat_dir(self):
+        try:
+            return self.component_dir.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _read(self):
+        try:
+            with open(self.index_path, 'r') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if index.get('version') != INDEX_VERSION:
+            return False
+        self._index = (index['names'], index['keys'])
+        self._dir_mtime_ns = index['dir_mtime_ns']
+        return True
+
+    def _write(self):
+        if self._dir_mtime_ns is None:
+            return # component dir doesn't exist, nothing to index
+        index = {
+            'version': INDEX_VERSION,
+            'dir_mtime_ns': self._dir_mtime_ns,
+            'names': self._index[0],
+            'keys': self._index[1],
+        }
+        # one temp file per thread, Timelines of the same component may be written concurrently
+        tmp_path = self.index_path.with_name(f'{INDEX_FILE}.{os.getpid()}-{threading.get_ident()}.tmp')
+        try:
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, 'w') as f:
+                json.dump(index, f)
+            os.replace(tmp_path, self.index_path)
+        except OSError as ex: # read-only setups can still be loaded from the scan
+            logging.warning(f'failed to write timeline index {self.index_path}: {ex}')
+
+def new_cal_id(time_ns: int = None):
+    '''Cal id (folder name) for a calibration made now, {seconds}.{nanoseconds:09d}
+
+    Ids sort by time together with the older whole-second ids, and an int run_time_epoch still selects
+    every calibration made up to the end of that second (see Timeline.at). Versions of this package
+    that only know whole-second folder names don't see calibrations stored under these ids.
+    '''
+    if time_ns is None:
+        time_ns = time.time_ns()
+    return f'{time_ns // 10**9}.{time_ns % 10**9:09d}'
+
+def parse_cal_id(name: str):
+    '''Sort key (ns since epoch) of a cal id, or None if name isn't a cal id'''
+    m = CAL_ID_PATTERN.match(name)
+    if m is None:
+        return None
+    seconds, fraction = m.groups()
+    return int(seconds) * 10**9 + (int(fraction.ljust(9, '0')) if fraction else 0)
+
+def epoch_to_ns(run_time_epoch):
+    '''Last ns a run_time_epoch covers: the end of its second for ints, the epoch itself for floats'''
+    if isinstance(run_time_epoch, (int, np.integer)):
+        return (int(run_time_epoch) + 1) * 10**9 - 1
+    return int(np.floor(float(run_time_epoch) * 1e9))
+
+def scan_cal_ids(component_dir):
+    '''List the cal ids of all timestamped calibration folders in a component directory'''
+    names = []
+    with os.scandir(component_dir) as it:
+        for entry in it:
+            if CAL_ID_PATTERN.match(entry.name) and entry.is_dir():
+                names.append(entry.name)
+    return names
@@ -0,0 +1,231 @@
+'''
+Watch a setup directory for new calibrations and reload them into a running Setup.
+
+save_component_cal publishes a calibration by renaming a new `latest` symlink into the component
+directory, so a watch only has to notice that rename. inotify (via ctypes, linux only) reports it
+directly; elsewhere the latest links are polled with one readlink per component.
+'''
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import pathlib
+import select
+import struct
+import threading
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    _libc.inotify_init1
+    imports_inotify = True
+except (OSError, AttributeError, TypeError): # not linux
+    imports_inotify = False
+
+IN_CREATE = 0x00000100
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+EVENT_HEADER = struct.Struct('iIII') # wd, mask, cookie, len
+
+LATEST = 'latest'
+
+class Inotify:
+    """
+    Minimal ctypes binding of the linux inotify API
+
+    Events are returned by read() as (wd, mask, name) tuples.
+    """
+    def __init__(self):
+        self.fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+    def add_watch(self, path, mask: int):
+        wd = _libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), str(path))
+        return wd
+
+    def read(self, timeout: float = None):
+        '''Wait up to timeout seconds for events'''
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0').decode(errors='surrogateescape')
+            offset += length
+            events.append((wd, mask, name))
+        return events
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+class SetupWatcher:
+    """
+    Reloads a component's calibration into a Setup whenever its latest symlink changes
+
+    Runs on a daemon thread. Only the changed component is reloaded (with Setup.load_component_cal,
+    so it respects the setup's lazy/mmap_mode/cache options) and the registered callbacks are then
+    called as callback(component_name, cal) with the new calibration dict. Components created after
+    the watch started are picked up too.
+
+    setup: the Setup to keep up to date
+    component_names: components to watch, default all
+    ros_param_ns: if not None, reloaded calibrations are also uploaded to the parameter server
+    poll_interval: seconds between checks when polling, and the shutdown latency with inotify
+    use_inotify: set False to force polling (e.g. for setups on network filesystems, where inotify
+    doesn't see changes made by other hosts)
+    """
+    def __init__(self, setup, component_names: list = None, ros_param_ns: str = None,
+                 poll_interval: float = 1.0, use_inotify: bool = True):
+        self.setup = setup
+        self.component_names = None if component_names is None else set(component_names)
+        self.ros_param_ns = ros_param_ns
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify and imports_inotify
+        self.reloads = 0
+        self._callbacks = []
+        self._targets = {} # component dir name: latest link target at the last (re)load
+        self._wds = {} # inotify watch descriptor: component dir name
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._inotify = None
+
+    def add_callback(self, callback, component_name: str = None):
+        '''Call callback(component_name, cal) after a reload of component_name, or of any component if None'''
+        with self._lock:
+            self._callbacks.append((component_name, callback))
+
+    def remove_callback(self, callback):
+        with self._lock:
+            self._callbacks = [(name, cb) for name, cb in self._callbacks if cb is not callback]
+
+    def start(self):
+        if self._thread is not None:
+            return self
+        if self.use_inotify:
+            try:
+                self._inotify = Inotify()
+                self._inotify.add_watch(self.setup.setup_dir, IN_CREATE | IN_MOVED_TO | IN_ONLYDIR)
+            except OSError as ex: # e.g. out of inotify instances/watches
+                logging.warning(f'inotify unavailable ({ex}), polling {self.setup.setup_dir}')
+                self._close_inotify()
+        self._scan(reload=False)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name=f'SetupWatcher({self.setup.setup_name})', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: float = None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self._close_inotify()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _close_inotify(self):
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+            self._wds = {}
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self._inotify is None:
+                    self._stop.wait(self.poll_interval)
+                    self._scan()
+                else:
+                    self._handle_events(self._inotify.read(self.poll_interval))
+            except Exception:
+                logging.exception(f'error watching {self.setup.setup_dir}')
+                self._stop.wait(self.poll_interval)
+
+    def _handle_events(self, events):
+        for wd, mask, name in events:
+            if mask & IN_Q_OVERFLOW: # events were lost, compare every link
+                self._scan()
+            elif mask & IN_IGNORED: # watched component dir was removed
+                self._targets.pop(self._wds.pop(wd, None), None)
+            elif wd in self._wds:
+                if name == LATEST:
+                    self._check(self._wds[wd])
+            elif mask & IN_ISDIR and not name.startswith('.'): # new component
+                self._add_component(name, reload=True)
+
+    def _scan(self, reload: bool = True):
+        for entry in os.scandir(self.setup.setup_dir):
+            if entry.name.startswith('.') or not entry.is_dir():
+                continue
+            if entry.name not in self._targets:
+                self._add_component(entry.name, reload=reload)
+            else:
+                self._check(entry.name)
+
+    def _add_component(self, dir_name: str, reload: bool):
+        if not self._watched(dir_name):
+            return
+        if self._inotify is not None and dir_name not in self._wds.values():
+            try:
+                wd = self._inotify.add_watch(self.setup.setup_dir / dir_name, IN_CREATE | IN_MOVED_TO | IN_ONLYDIR)
+                self._wds[wd] = dir_name
+            except OSError as ex:
+                if ex.errno != errno.ENOENT:
+                    raise
+                return
+        if reload:
+            self._check(dir_name)
+        else:
+            self._targets[dir_name] = self._read_latest(dir_name)
+
+    def _watched(self, dir_name: str):
+        return self.component_names is None or dir_name in self.component_names
+
+    def _read_latest(self, dir_name: str):
+        try:
+            return os.readlink(self.setup.setup_dir / dir_name / LATEST)
+        except OSError:
+            return None
+
+    def _check(self, dir_name: str):
+        '''Reload a component if its latest link moved since the last check'''
+        target = self._read_latest(dir_name)
+        if target is None or target == self._targets.get(dir_name):
+            return
+        self._targets[dir_name] = target
+        name = dir_name
+        logging.info(f'new calibration of {name}: {pathlib.Path(target).name}')
+        self.setup.load_component_cal(name, ros_param_ns=self.ros_param_ns)
+        self.reloads += 1
+        cal = self.setup.cal.get(name)
+        with self._lock:
+            callbacks = [cb for cb_name, cb in self._callbacks if cb_name in (None, name)]
+        for callback in callbacks:
+            try:
+                callback(name, cal)
+            except Exception:
+                logging.exception(f'calibration callback {callback!r} failed for {name}')
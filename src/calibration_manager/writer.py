@@ -0,0 +1,103 @@
+import concurrent.futures
+import copy
+import logging
+import threading
+import zlib
+
+import numpy as np
+import pandas as pd
+
+class AsyncCalWriter:
+    """
+    Saves calibrations of a Setup on background threads, so the caller only pays for a copy
+
+    save_component_cal() snapshots the calibration (arrays and dataframes are copied, so the caller may
+    keep modifying its own), queues the write and returns a concurrent.futures.Future of the cal dir.
+    Saves of one component run one at a time in submission order, so the last one submitted becomes
+    latest; with workers > 1 different components are written in parallel.
+    Call flush() to wait for the queued saves and close() (or use a with block) at shutdown.
+
+    setup: the Setup to save through
+    workers: number of writer threads, components are assigned to one each
+    """
+    def __init__(self, setup, workers: int = 1):
+        self.setup = setup
+        self._executors = [concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'AsyncCalWriter-{i}')
+                           for i in range(workers)]
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def save_component_cal(self, component_name: str, calibration: dict, overwrite: bool = False, copy_values: bool = True):
+        '''Queue Setup.save_component_cal, returns a Future resolving to the calibration directory
+
+        copy_values: set False to skip the snapshot when the calibration won't be modified until saved
+        '''
+        if copy_values:
+            calibration = snapshot_tree(calibration)
+        return self._submit(component_name, self.setup.save_component_cal, component_name, calibration, overwrite)
+
+    def save_component_cfg(self, component_name: str, configuration: dict, copy_values: bool = True):
+        '''Queue Setup.save_component_cfg, ordered with the component's calibration saves'''
+        if copy_values:
+            configuration = snapshot_tree(configuration)
+        return self._submit(component_name, self.setup.save_component_cfg, component_name, configuration)
+
+    def _submit(self, component_name: str, fn, *args):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError('AsyncCalWriter is closed')
+            # crc32 rather than hash(), which is salted per process
+            executor = self._executors[zlib.crc32(component_name.encode()) % len(self._executors)]
+            future = executor.submit(fn, *args)
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self._lock:
+            self._pending.discard(future)
+        if not future.cancelled() and future.exception() is not None:
+            logging.error(f'background save failed: {future.exception()!r}')
+
+    @property
+    def pending(self):
+        '''Number of saves queued or in progress'''
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self, timeout: float = None):
+        '''Wait for every save submitted so far. Returns True if all finished within timeout'''
+        with self._lock:
+            pending = list(self._pending)
+        done, not_done = concurrent.futures.wait(pending, timeout=timeout)
+        return not not_done
+
+    def close(self, wait: bool = True):
+        '''Stop accepting saves; if wait, block until the queued ones are written'''
+        with self._lock:
+            self._closed = True
+        for executor in self._executors:
+            executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def snapshot_tree(d: dict):
+    '''Copy a calibration tree deeply enough that later changes by the caller don't reach the save'''
+    out = {}
+    for k, v in d.items():
+        if isinstance(v, dict):
+            out[k] = snapshot_tree(v)
+        elif isinstance(v, np.ndarray):
+            out[k] = np.array(v, copy=True) # also turns read-only views and memmaps into plain arrays
+        elif isinstance(v, pd.DataFrame):
+            out[k] = v.copy()
+        elif isinstance(v, (str, int, float, bool, type(None))):
+            out[k] = v
+        else:
+            out[k] = copy.deepcopy(v)
+    return out
@@ -0,0 +1,76 @@
+'''
+Checks of the asyncio Setup API
+'''
+
+import asyncio
+import pathlib
+import sys
+import threading
+import time
+
+import numpy as np
+
+REPO = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / 'src'))
+
+from calibration_manager import Setup
+
+def test_aload_matches_load(tmp_path):
+    writer = Setup(tmp_path / 'setup', fsync=False)
+    for i in range(5):
+        writer.save_component_cfg(f'/sensor{i}', {'rate': i})
+        writer.save_component_cal(f'/sensor{i}', {'offset': np.full(3, float(i))})
+    (writer.save_component_cal('/sensor2', {}) / 'cal.yaml').write_text('offset: [unclosed\n')
+
+    reader = Setup(tmp_path / 'setup')
+    names = asyncio.run(reader.aload())
+    assert names == [name for name in reader.list_components() if name != 'sensor2']
+    assert list(reader.load_errors) == ['sensor2']
+    assert reader.cfg['sensor4'] == {'rate': 4} and (reader.cal['sensor4']['offset'] == 4).all()
+
+def test_aload_concurrency_and_loop(tmp_path, monkeypatch):
+    writer = Setup(tmp_path / 'setup', fsync=False)
+    for i in range(6):
+        writer.save_component_cal(f'/sensor{i}', {'i': i})
+    reader = Setup(tmp_path / 'setup')
+    running, most = [0], [0]
+    lock = threading.Lock()
+    load_component = reader.load_component
+    def slow_load_component(*args):
+        with lock:
+            running[0] += 1
+            most[0] = max(most[0], running[0])
+        time.sleep(0.05) # blocking I/O
+        with lock:
+            running[0] -= 1
+        return load_component(*args)
+    monkeypatch.setattr(reader, 'load_component', slow_load_component)
+
+    async def main():
+        ticks = 0
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.005)
+        ticker = asyncio.create_task(tick())
+        await reader.aload(concurrency=2)
+        ticker.cancel()
+        return ticks
+    ticks = asyncio.run(main())
+    assert most[0] == 2
+    assert ticks > 10 # the loop kept running during the load
+    assert sorted(reader.cal[name]['i'] for name in reader.component_names) == list(range(6))
+
+def test_async_saves_keep_call_order(tmp_path):
+    setup = Setup(tmp_path / 'setup', fsync=False)
+    async def main():
+        await setup.asave_component_cfg('/cam', {'rate': 30})
+        saves = [setup.asave_component_cal('/cam', {'i': i}) for i in range(5)]
+        return await asyncio.gather(*saves)
+    cal_dirs = asyncio.run(main())
+    assert cal_dirs == sorted(cal_dirs)
+    reader = Setup(tmp_path / 'setup')
+    asyncio.run(reader.aload_component('/cam'))
+    assert reader.cfg['/cam'] == {'rate': 30} and reader.cal['/cam'] == {'i': 4}
+    assert reader.paths['/cam']['cal'] == cal_dirs[-1]
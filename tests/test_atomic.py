@@ -0,0 +1,55 @@
+'''
+Checks that saves failing part way leave the published calibrations and configurations as they were
+'''
+
+import os
+import pathlib
+import sys
+
+import numpy as np
+import pytest
+
+REPO = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / 'src'))
+
+from calibration_manager import Setup, manager
+
+def fail_on_yaml_dump(monkeypatch):
+    # the referenced files are written by then, the yaml is the last step before publishing
+    def dump_yaml(*args):
+        raise OSError('disk full')
+    monkeypatch.setattr(manager, 'dump_yaml', dump_yaml)
+
+def entries(component_dir: pathlib.Path):
+    return sorted(f.name for f in component_dir.iterdir() if f.name != '.staging')
+
+def test_failed_cal_save(tmp_path, monkeypatch):
+    setup = Setup(tmp_path / 'setup', fsync=False)
+    cal_dir = setup.save_component_cal('/cam', {'offset': np.zeros(3)})
+    component_dir = cal_dir.parent
+    before = entries(component_dir)
+
+    fail_on_yaml_dump(monkeypatch)
+    with pytest.raises(OSError, match='disk full'):
+        setup.save_component_cal('/cam', {'offset': np.ones(3)})
+    with pytest.raises(OSError, match='disk full'):
+        setup.save_component_cal('/cam', {'offset': np.ones(3)}, overwrite=True)
+    assert entries(component_dir) == before
+    assert os.readlink(component_dir / 'latest') == str(cal_dir)
+    assert list((component_dir / '.staging').iterdir()) == [component_dir / '.staging' / '.lock'] # staging cleaned up
+    assert entries(cal_dir) == ['cal.yaml', 'offset.npy']
+
+    reader = Setup(tmp_path / 'setup')
+    reader.load_component_cal('/cam')
+    assert not reader.cal['/cam']['offset'].any()
+
+def test_failed_cfg_save(tmp_path, monkeypatch):
+    setup = Setup(tmp_path / 'setup', fsync=False)
+    setup.save_component_cfg('/cam', {'lut': np.zeros(3), 'rate': 10})
+    fail_on_yaml_dump(monkeypatch)
+    with pytest.raises(OSError, match='disk full'):
+        setup.save_component_cfg('/cam', {'lut': np.ones(3), 'rate': 20})
+
+    reader = Setup(tmp_path / 'setup')
+    reader.load_component_cfg('/cam')
+    assert reader.cfg['/cam']['rate'] == 10 and not reader.cfg['/cam']['lut'].any()
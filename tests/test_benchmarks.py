@@ -0,0 +1,27 @@
+'''
+Runs the benchmarks at a tiny scale, so they keep working as the package changes
+'''
+
+import json
+import pathlib
+import subprocess
+import sys
+
+REPO = pathlib.Path(__file__).resolve().parents[1]
+
+def test_bench_setup(tmp_path):
+    bench = [sys.executable, str(REPO / 'benchmarks' / 'bench_setup.py'), '--components', '2', '--history', '3',
+             '--arrays', '1', '--array-size', '100', '--df-rows', '10', '--params', '5', '--setups', '3',
+             '--repeat', '2', '--no-fsync', '--dir', str(tmp_path)]
+    subprocess.run(bench + ['--output', str(tmp_path / 'before.json')], check=True, capture_output=True)
+    with open(tmp_path / 'before.json') as f:
+        before = json.load(f)
+    assert list(before['results']) == ['load', 'load_epoch', 'save_component_cal', 'list_setups', 'load_to_dict', 'save_from_dict']
+    assert all(r['p50_ms'] > 0 for r in before['results'].values())
+    assert before['args']['components'] == 2
+
+    compared = subprocess.run(bench + ['--compare', str(tmp_path / 'before.json')], check=True, capture_output=True, text=True)
+    lines = compared.stdout.splitlines()
+    table = lines[[line.startswith('case') for line in lines].index(True):]
+    assert 'vs base' in table[0] and len(table) == 1 + len(before['results'])
+    assert all(line.endswith('x') for line in table[1:]) # every case compared
@@ -0,0 +1,59 @@
+'''
+Checks of the in-process calibration cache shared between Setups
+'''
+
+import os
+import pathlib
+import sys
+
+import numpy as np
+import pytest
+
+REPO = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / 'src'))
+
+from calibration_manager import Setup
+from calibration_manager.cache import CalibrationCache
+
+def test_setups_share_cached_files(tmp_path):
+    matrix = np.arange(6.0)
+    Setup(tmp_path / 'setup', fsync=False).save_component_cal('/cam', {'matrix': matrix})
+    cache = CalibrationCache()
+    first = Setup(tmp_path / 'setup', cache=cache)
+    first.load_component_cal('/cam')
+    assert cache.stats()['misses'] == 2 and cache.stats()['hits'] == 0 # cal.yaml and matrix.npy
+
+    second = Setup(tmp_path / 'setup', cache=cache)
+    second.load_component_cal('/cam')
+    assert cache.stats()['hits'] == 2
+    assert np.array_equal(second.cal['/cam']['matrix'], matrix)
+    # handed out read-only, a caller can't change what the next one loads
+    with pytest.raises(ValueError):
+        second.cal['/cam']['matrix'][0] = 1.0
+    second.cal['/cam']['extra'] = 1
+    assert 'extra' not in first.cal['/cam']
+
+def test_changed_files_are_reloaded(tmp_path):
+    f = tmp_path / 'matrix.npy'
+    np.save(f, np.zeros(3))
+    cache = CalibrationCache()
+    assert not cache.get(f, np.load).any()
+    np.save(f, np.ones(4))
+    os.utime(f, ns=(0, 0)) # a different mtime, whatever the clock resolution
+    assert cache.get(f, np.load).all()
+    assert cache.stats()['entries'] == 1 # the stale entry was replaced
+
+def test_least_recently_used_are_evicted(tmp_path):
+    files = []
+    for i in range(3):
+        files.append(tmp_path / f'{i}.npy')
+        np.save(files[-1], np.zeros(1000))
+    cache = CalibrationCache(max_bytes=2 * 8000)
+    cache.get(files[0], np.load)
+    cache.get(files[1], np.load)
+    cache.get(files[0], np.load) # 1 is now the least recently used
+    cache.get(files[2], np.load)
+    assert cache.stats()['evictions'] == 1
+    cache.get(files[0], np.load)
+    cache.get(files[1], np.load)
+    assert cache.stats()['hits'] == 2 and cache.stats()['misses'] == 4
@@ -0,0 +1,79 @@
+'''
+Checks of the setup catalog keeping up with setups saved through Setup and with folders changed by hand
+'''
+
+import errno
+import json
+import os
+import pathlib
+import shutil
+import sys
+
+REPO = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / 'src'))
+
+from calibration_manager import Setup, catalog
+
+def make_setup(storage, name):
+    setup = Setup(storage / name, fsync=False)
+    setup.save_component_cfg('/cam', {'gain': 1.0})
+    setup.save_component_cal('/cam', {'offset': 0.5})
+    return setup
+
+def test_catalog_follows_setup_folders(tmp_path):
+    storage = tmp_path / 'setups'
+    for name in ('a', 'b'):
+        make_setup(storage, name)
+    assert catalog.SetupCatalog(storage).names() == ['a', 'b']
+    assert sorted(os.listdir(storage)) == ['.catalog', 'a', 'b']
+
+    make_setup(storage, 'c') # recorded in the journal
+    (storage / 'selected_setup').symlink_to(storage / 'a')
+    shutil.copytree(storage / 'a', storage / 'd') # not recorded
+    shutil.rmtree(storage / 'b')
+    cat = catalog.SetupCatalog(storage)
+    assert cat.names() == ['a', 'c', 'd']
+    assert cat.get('d')['components']['cam']['latest_cal'] == cat.get('a')['components']['cam']['latest_cal']
+
+    # the catch up was persisted, a new reader takes the index as is
+    index = json.loads((storage / catalog.CATALOG_DIR / catalog.INDEX_FILE).read_text())
+    assert index['dir_mtime_ns'] == storage.stat().st_mtime_ns
+    assert sorted(index['setups']) == ['a', 'c', 'd']
+
+    (storage / 'e').mkdir()
+    assert cat.names() == ['a', 'c', 'd', 'e']
+    assert cat.get('e')['components'] == {}
+
+def test_catalog_of_read_only_storage(tmp_path, monkeypatch):
+    storage = tmp_path / 'setups'
+    for name in ('a', 'b'):
+        make_setup(storage, name)
+    mkdir = os.mkdir
+    def read_only_mkdir(path, *args, **kwargs):
+        if str(path).startswith(str(storage)):
+            raise OSError(errno.EROFS, 'Read-only file system', str(path))
+        return mkdir(path, *args, **kwargs)
+    monkeypatch.setattr(os, 'mkdir', read_only_mkdir)
+
+    cat = catalog.SetupCatalog(storage)
+    assert cat.names() == ['a', 'b']
+    assert cat.get('a')['components']['cam']['latest_cal'] is not None
+    assert sorted(os.listdir(storage)) == ['a', 'b']
+    shutil.rmtree(storage / 'b')
+    assert cat.names() == ['a']
+
+def test_list_setups_reuses_the_catalog(tmp_path, monkeypatch):
+    from calibration_manager import manager
+    monkeypatch.setenv('HOME', str(tmp_path))
+    storage = tmp_path / '.ros' / 'setups'
+    for name in ('a', 'b'):
+        make_setup(storage, name)
+    assert manager.list_setups() == ['a', 'b']
+    manager.select_setup('a') # touches the storage mtime, without adding a setup
+    assert manager.list_setups() == ['a', 'b']
+
+    listings = []
+    setup_dir_names = catalog.setup_dir_names
+    monkeypatch.setattr(catalog, 'setup_dir_names', lambda storage: listings.append(storage) or setup_dir_names(storage))
+    assert manager.list_setups('b') == ['b']
+    assert listings == []
@@ -0,0 +1,54 @@
+'''
+Checks that chunked arrays (.npc) read back, whole or by slice, exactly as they were saved
+'''
+
+import pathlib
+import sys
+
+import numpy as np
+import pytest
+
+REPO = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / 'src'))
+
+from calibration_manager import Setup
+from calibration_manager.chunked import ChunkedArray, codecs, load_chunked, save_chunked
+
+KEYS = [np.s_[:], np.s_[5:37], np.s_[-20:], np.s_[::7], np.s_[90:3:-4], np.s_[30:10], np.s_[3], np.s_[-1],
+        np.s_[12:50, 2], np.s_[40, ::-1, 1:], np.s_[[4, 60, 2]], np.s_[..., 0]]
+
+@pytest.mark.parametrize('codec', list(codecs))
+def test_slices_match_numpy(tmp_path, codec):
+    arr = np.arange(100 * 6 * 3, dtype=np.int32).reshape(100, 6, 3)
+    save_chunked(tmp_path / 'arr.npc', arr, codec=codec, chunk_bytes=8 * arr[0].nbytes) # 13 chunks
+    chunked = ChunkedArray(tmp_path / 'arr.npc')
+    assert (chunked.shape, chunked.dtype, len(chunked.chunks)) == (arr.shape, arr.dtype, 13)
+    assert np.array_equal(np.asarray(chunked), arr)
+    for key in KEYS:
+        assert np.array_equal(chunked[key], arr[key]), key
+
+def test_only_touched_chunks_are_read(tmp_path, monkeypatch):
+    arr = np.random.default_rng(0).random((1000, 4))
+    save_chunked(tmp_path / 'arr.npc', arr, chunk_bytes=100 * arr[0].nbytes)
+    chunked = ChunkedArray(tmp_path / 'arr.npc', workers=1)
+    read = []
+    chunk = ChunkedArray._chunk
+    monkeypatch.setattr(ChunkedArray, '_chunk', lambda self, i: read.append(i) or chunk(self, i))
+    assert np.array_equal(chunked[250:420], arr[250:420])
+    assert read == [2, 3, 4]
+
+def test_setup_saves_large_arrays_chunked(tmp_path):
+    big = np.arange(50_000, dtype=np.float64)
+    scalar = np.array(3.5)
+    cal_dir = Setup(tmp_path / 'setup', fsync=False, chunk_threshold=100_000).save_component_cal('/cam', {'big': big, 'small': big[:10]})
+    assert sorted(f.name for f in cal_dir.iterdir()) == ['big.npc', 'cal.yaml', 'small.npy']
+    save_chunked(tmp_path / 'scalar.npc', scalar)
+    assert load_chunked(tmp_path / 'scalar.npc') == scalar
+
+    reader = Setup(tmp_path / 'setup', mmap_mode='r')
+    reader.load_component_cal('/cam')
+    assert isinstance(reader.cal['/cam']['big'], ChunkedArray) # stays on disk with an mmap_mode
+    assert np.array_equal(reader.cal['/cam']['big'][1000:1010], big[1000:1010])
+    reader = Setup(tmp_path / 'setup')
+    reader.load_component_cal('/cam')
+    assert type(reader.cal['/cam']['big']) is np.ndarray and np.array_equal(reader.cal['/cam']['big'], big)
@@ -0,0 +1,73 @@
+'''
+Checks that the fast (libyaml) and round-trip (ruamel) yaml modes read and write the same trees
+'''
+
+import math
+import pathlib
+import sys
+
+REPO = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / 'src'))
+
+from calibration_manager import fastyaml
+from calibration_manager.manager import dump_yaml, load_yaml
+
+SCALARS = '''\
+mode: on
+flag: no
+answer: yes
+off_: Off
+t: 1:30
+t_float: 1:30.5
+oct: 010
+oct12: 0o17
+hex: 0x1F
+bin: 0b101
+thousand: 1_000
+neg: -42
+f1: 1.5
+f2: 1e3
+f3: .5
+f4: -.inf
+f5: .nan
+b1: true
+b2: False
+n1: ~
+n2:
+quoted: 'on'
+version: 1.2.3
+date: 2020-01-02
+seq: [on, 010, 1:30, no, 0o10]
+anchor: &a {x: 1}
+ref: *a
+merged:
+  <<: *a
+  y: 2
+'''
+
+def plain(tree):
+    '''tree with nan replaced, so trees can be compared with =='''
+    if isinstance(tree, dict):
+        return {k: plain(v) for k, v in tree.items()}
+    if isinstance(tree, list):
+        return [plain(v) for v in tree]
+    if isinstance(tree, float) and math.isnan(tree):
+        return 'nan'
+    return tree
+
+def test_fast_load_matches_rt(tmp_path):
+    f = tmp_path / 'cal.yaml'
+    f.write_text(SCALARS)
+    rt = load_yaml(f, mode='rt')
+    fast = load_yaml(f, mode='fast')
+    assert plain(fast) == plain(rt)
+    assert (fast['mode'], fast['flag'], fast['t'], fast['oct'], fast['oct12']) == ('on', 'no', '1:30', 10, 15)
+
+def test_fast_dump_reads_back_in_both_modes(tmp_path):
+    tree = {'strings': ['on', 'no', '010', '0o10', '1:30', '1e3', '=', '12', 'x'],
+            'values': [8, 1e20, True, None, 1.5, float('inf')], 'nested': {'respawn': 'no'}}
+    dump_yaml(tree, tmp_path / 'fast.yaml', 'fast')
+    dump_yaml(tree, tmp_path / 'rt.yaml', 'rt')
+    for name in ('fast.yaml', 'rt.yaml'):
+        for mode in fastyaml.YAML_MODES:
+            assert plain(load_yaml(tmp_path / name, mode=mode)) == tree
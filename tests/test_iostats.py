@@ -0,0 +1,44 @@
+'''
+Checks of the I/O timing recorded by Setup(stats=True)
+'''
+
+import json
+import pathlib
+import sys
+
+import numpy as np
+
+REPO = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / 'src'))
+
+from calibration_manager import Setup
+from calibration_manager.iostats import IOStats
+
+def test_setup_stats(tmp_path):
+    setup = Setup(tmp_path / 'setup', fsync=False, stats=True)
+    setup.save_component_cfg('/cam', {'gain': 1.0})
+    setup.save_component_cal('/cam', {'matrix': np.zeros((100, 100))})
+    setup.stats.clear()
+    setup.load_component('/cam')
+
+    by_component = setup.stats.by_component()
+    assert list(by_component) == ['/cam'] and by_component['/cam']['count'] == 1
+    phases = setup.stats.by_phase()
+    assert phases['load.npy']['bytes'] >= 100 * 100 * 8
+    assert phases['yaml_load']['count'] == 2 # cfg.yaml and cal.yaml
+    trace = setup.stats.to_chrome_trace(tmp_path / 'trace.json')
+    assert json.loads((tmp_path / 'trace.json').read_text()) == trace
+    assert any(e['name'] == 'load.npy /cam' for e in trace['traceEvents'])
+
+def test_events_are_bounded(tmp_path):
+    stats = IOStats(max_events=10)
+    for i in range(1000):
+        stats.record('load.npy', f'c{i % 2}', i, 10**6, nbytes=100)
+    assert len(stats.events) == 10
+    assert stats.events[-1].start_ns == 999
+    total = stats.by_phase()['load.npy']
+    assert (total['count'], total['bytes']) == (1000, 100000) and abs(total['seconds'] - 1.0) < 1e-9
+    assert stats.summary(('component',))[('c0',)]['count'] == 500
+    assert sum(total['count'] for total in stats.summary(('thread',)).values()) == 10 # kept events only
+    stats.clear()
+    assert not stats.events and stats.summary() == {}
@@ -0,0 +1,71 @@
+'''
+Checks of the launch files generated from setup.yaml
+'''
+
+import os
+import pathlib
+import sys
+
+REPO = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / 'src'))
+
+from calibration_manager import launchgen
+
+SETUP = '''components:
+- component_name: cam0
+  group_name: /
+  component_package: cams
+  component_type: driver
+  component_launch_file: launch/cam.launch
+  enabled: true
+  args: {respawn: no, mode: on, serial: '0123'}
+'''
+
+def test_generate_all_keeps_arg_strings(tmp_path):
+    setup_dir = tmp_path / 'my_machine'
+    setup_dir.mkdir()
+    (setup_dir / launchgen.SETUP_FILE).write_text(SETUP)
+    assert launchgen.generate_all([setup_dir], workers=1) == {setup_dir: [launchgen.DRIVERS_LAUNCH, launchgen.SERVICES_LAUNCH]}
+    drivers = (setup_dir / launchgen.DRIVERS_LAUNCH).read_text()
+    for arg in ('name="respawn" default="no"', 'name="mode" default="on"', 'name="serial" default="0123"'):
+        assert arg in drivers
+
+FLEET_SETUP = '''components:
+- {component_name: cam0, group_name: /cams, component_package: cams, component_type: driver, component_launch_file: launch/cam.launch, args: {serial: 7}}
+- {component_name: imu0, group_name: '', component_package: imus, component_type: driver, component_launch_file: launch/imu.launch, enabled: false}
+- {component_name: tf, component_package: tools, component_type: service, component_launch_file: launch/tf.launch}
+- {component_name: intrinsics, component_package: cal_routines, component_type: routine, component_launch_file: launch/intrinsics.launch}
+'''
+
+def test_generate_and_check_a_fleet(tmp_path):
+    import subprocess
+    from xml.etree import ElementTree
+    storage = tmp_path / 'setups'
+    for name in ('machine_a', 'machine_b'):
+        (storage / name).mkdir(parents=True)
+        (storage / name / launchgen.SETUP_FILE).write_text(FLEET_SETUP)
+    (storage / 'selected_setup').symlink_to(storage / 'machine_a')
+    (storage / 'notes').mkdir()
+    assert launchgen.find_setups(storage) == [storage / 'machine_a', storage / 'machine_b']
+
+    setup_dir = storage / 'machine_a'
+    assert launchgen.generate(setup_dir) == [launchgen.DRIVERS_LAUNCH, launchgen.SERVICES_LAUNCH, 'routine_intrinsics.launch']
+    drivers = ElementTree.parse(setup_dir / launchgen.DRIVERS_LAUNCH).getroot()
+    assert [(group.get('ns'), include.get('file')) for group in drivers for include in group] == \
+        [('/cams', '$(find cams)/launch/cam.launch')] # imu0 is disabled
+    assert drivers.find('group/include/arg').attrib == {'name': 'serial', 'default': '7'}
+    services = ElementTree.parse(setup_dir / launchgen.SERVICES_LAUNCH).getroot()
+    assert [include.get('file') for include in services] == ['$(find tools)/launch/tf.launch']
+    assert launchgen.generate(setup_dir) == [] # nothing rewritten
+
+    cli = [sys.executable, '-m', 'calibration_manager.launchgen', '--storage', str(storage), '--workers', '1']
+    env = {**os.environ, 'PYTHONPATH': str(REPO / 'src')}
+    assert subprocess.run(cli + ['--check'], env=env, capture_output=True).returncode == 1 # machine_b never generated
+    assert not (storage / 'machine_b' / launchgen.DRIVERS_LAUNCH).exists()
+    assert subprocess.run(cli, env=env, capture_output=True).returncode == 0
+    assert subprocess.run(cli + ['--check'], env=env, capture_output=True).returncode == 0
+
+    # routines removed from setup.yaml lose their launch file
+    (setup_dir / launchgen.SETUP_FILE).write_text(FLEET_SETUP.rsplit('- {component_name: intrinsics', 1)[0])
+    assert launchgen.generate(setup_dir) == ['routine_intrinsics.launch']
+    assert not (setup_dir / 'routine_intrinsics.launch').exists()
@@ -0,0 +1,85 @@
+'''
+Checks of the launch file index and launch file signatures on temporary packages
+'''
+
+import os
+import pathlib
+import sys
+
+REPO = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / 'src'))
+
+from calibration_manager.launchindex import LaunchIndex, LaunchSignatures
+
+def test_scan_follows_symlinked_dirs(tmp_path):
+    package = tmp_path / 'cam_driver'
+    (package / 'launch').mkdir(parents=True)
+    (package / 'launch' / 'cam.launch').write_text('<launch/>')
+    shared = tmp_path / 'shared_launch'
+    shared.mkdir()
+    (shared / 'lidar.launch').write_text('<launch/>')
+    os.symlink(shared, package / 'launch' / 'shared')
+    os.symlink(package, shared / 'loop') # a cycle back into the package
+
+    launch_files = LaunchIndex(path=None).scan('cam_driver', str(package))
+    assert sorted(os.path.basename(f) for f in launch_files) == ['cam.launch', 'lidar.launch']
+
+def test_update_rescans_changed_packages_only(tmp_path):
+    packages = {}
+    for name in ('cam_driver', 'imu_driver', 'old_driver'):
+        packages[name] = tmp_path / 'src' / name
+        (packages[name] / 'launch').mkdir(parents=True)
+        (packages[name] / 'launch' / f'{name}.launch').write_text('<launch/>')
+    index_path = tmp_path / 'launch_index.json'
+    index = LaunchIndex(index_path)
+    assert all(rescanned for *_, rescanned in index.update(packages))
+    index.write()
+
+    del packages['old_driver']
+    (packages['imu_driver'] / 'launch' / 'imu_extra.launch').write_text('<launch/>')
+    index = LaunchIndex(index_path) # read back from disk
+    results = {package: (sorted(os.path.basename(f) for f in launch_files), rescanned)
+               for package, _, launch_files, rescanned in index.update(packages)}
+    assert results == {'cam_driver': (['cam_driver.launch'], False),
+                       'imu_driver': (['imu_driver.launch', 'imu_extra.launch'], True)}
+    assert sorted(info['package'] for info in index.launch_files_info()) == ['cam_driver', 'imu_driver', 'imu_driver']
+
+def test_signatures_and_includes(tmp_path):
+    driver = tmp_path / 'cam_driver' / 'launch'
+    common = tmp_path / 'common' / 'launch'
+    driver.mkdir(parents=True)
+    common.mkdir(parents=True)
+    (driver / 'cam.launch').write_text('''<launch>
+  <arg name="serial"/>
+  <arg name="rate" default="30"/>
+  <arg name="frame" value="cam"/>
+  <arg name="ns" default="$(arg serial)_ns"/>
+  <group ns="cam">
+    <arg name="exposure" default="auto"/>
+    <include file="$(dirname)/lens.launch"/>
+  </group>
+  <include file="$(find common)/launch/tf.launch"/>
+  <include file="$(arg extra)"/>
+</launch>''')
+    (driver / 'lens.launch').write_text('<launch><include file="$(find common)/launch/tf.launch"/></launch>')
+    (common / 'tf.launch').write_text('<launch><include file="$(find cam_driver)/launch/cam.launch"/></launch>')
+
+    signatures = LaunchSignatures(find=lambda package: tmp_path / package)
+    signature = signatures.signature(driver / 'cam.launch')
+    assert signature['args'] == {'serial': None, 'rate': '30', 'exposure': 'auto'} # fixed and computed args left out
+    assert signature['includes'] == [str(driver / 'lens.launch'), str(common / 'tf.launch')]
+    assert signature['unresolved'] == ['$(arg extra)']
+    # recursively, each file once although tf.launch includes cam.launch back
+    assert signatures.includes(driver / 'cam.launch') == [str(driver / 'lens.launch'), str(common / 'tf.launch')]
+
+def test_signatures_are_cached_until_the_file_changes(tmp_path, monkeypatch):
+    launch = tmp_path / 'cam.launch'
+    launch.write_text('<launch><arg name="rate" default="30"/></launch>')
+    signatures = LaunchSignatures()
+    parsed = []
+    parse = signatures.parse
+    monkeypatch.setattr(signatures, 'parse', lambda path: parsed.append(path) or parse(path))
+    assert signatures.signature(launch) is signatures.signature(launch)
+    launch.write_text('<launch><arg name="rate" default="60"/><arg name="serial"/></launch>')
+    assert signatures.signature(launch)['args'] == {'rate': '60', 'serial': None}
+    assert parsed == [str(launch)] * 2
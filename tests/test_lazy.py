@@ -0,0 +1,42 @@
+'''
+Checks that a lazy Setup reads referenced files on first access only
+'''
+
+import pathlib
+import sys
+
+import numpy as np
+import pandas as pd
+
+REPO = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / 'src'))
+
+from calibration_manager import Setup, manager
+from calibration_manager.lazy import LazyDict, LazyFile
+
+def test_lazy_load_reads_on_access(tmp_path, monkeypatch):
+    matrix = np.arange(6.0).reshape(2, 3)
+    table = pd.DataFrame({'x': [1.0, 2.0], 'y': [3.0, 4.0]})
+    Setup(tmp_path / 'setup', fsync=False).save_component_cal('/cam', {'matrix': matrix, 'lens': {'table': table}, 'gain': 2.0})
+    read = []
+    load_file = manager.load_file
+    def counting_load_file(f, *args, **kwargs):
+        read.append(f.name)
+        return load_file(f, *args, **kwargs)
+    monkeypatch.setattr(manager, 'load_file', counting_load_file)
+
+    setup = Setup(tmp_path / 'setup', lazy=True)
+    setup.load_component_cal('/cam')
+    cal = setup.cal['/cam']
+    assert read == [] and cal['gain'] == 2.0
+    assert isinstance(cal, LazyDict) and isinstance(dict.__getitem__(cal, 'matrix'), LazyFile)
+
+    assert np.array_equal(cal['matrix'], matrix)
+    assert read == ['matrix.npy']
+    assert cal['matrix'] is cal['matrix'] # resolved once, then kept
+    assert read == ['matrix.npy']
+
+    plain = cal.materialize()
+    assert type(plain) is dict and type(plain['lens']) is dict
+    pd.testing.assert_frame_equal(plain['lens']['table'][['x', 'y']], table)
+    assert sorted(read) == ['lens+table.csv', 'matrix.npy']
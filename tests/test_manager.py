@@ -0,0 +1,170 @@
+'''
+Checks of saving and loading calibrations with a Setup on a temporary setup folder
+'''
+
+import pathlib
+import sys
+
+import numpy as np
+import pytest
+
+REPO = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / 'src'))
+
+from calibration_manager import Setup
+
+def test_dedup_overwrite_same_content(tmp_path):
+    setup = Setup(tmp_path / 'setup', fsync=False, dedup=True)
+    matrix = np.arange(12.0).reshape(3, 4)
+    cal_dir = setup.save_component_cal('/cam', {'matrix': matrix, 'gain': 1.5})
+    # unchanged arrays are staged as links to the very blobs already in cal_dir
+    assert setup.save_component_cal('/cam', {'matrix': matrix, 'gain': 1.5}, overwrite=True) == cal_dir
+    assert setup.save_component_cal('/cam', {'matrix': matrix, 'gain': 2.0}, overwrite=True) == cal_dir
+    assert not any(pathlib.Path(cal_dir).parent.glob('.staging/*/'))
+
+    setup = Setup(tmp_path / 'setup', fsync=False, dedup=True)
+    setup.load_component_cal('/cam')
+    assert setup.cal['/cam']['gain'] == 2.0
+    assert np.array_equal(setup.cal['/cam']['matrix'], matrix)
+
+def test_load_while_pruned(tmp_path, monkeypatch):
+    from calibration_manager import manager
+    from calibration_manager.retention import RetentionPolicy
+    setup = Setup(tmp_path / 'setup', fsync=False)
+    cal_dirs = [setup.save_component_cal('/cam', {'matrix': np.full(3, float(i))}) for i in range(3)]
+    epoch = manager.parse_cal_id(cal_dirs[0].name) / 1e9
+
+    # prune the calibration being loaded right after its cal.yaml was read
+    load_to_dict = manager.load_to_dict
+    prunes = []
+    def pruning_load_to_dict(*args, **kwargs):
+        if not prunes:
+            prunes.append(setup.prune(RetentionPolicy(tiers=[(0, None)]), now=epoch + 10**6)['cam']['archived'])
+        return load_to_dict(*args, **kwargs)
+    monkeypatch.setattr(manager, 'load_to_dict', pruning_load_to_dict)
+
+    reader = Setup(tmp_path / 'setup')
+    reader.load_component_cal('/cam', epoch)
+    assert prunes[0] == [cal_dirs[0].name, cal_dirs[1].name]
+    assert not cal_dirs[0].exists()
+    assert np.array_equal(reader.cal['/cam']['matrix'], np.zeros(3))
+    assert reader.paths['/cam']['cal'].parent.name == 'extracted'
+
+def test_dedup_save_streams_to_the_blob_store(tmp_path):
+    import tracemalloc
+    setup = Setup(tmp_path / 'setup', fsync=False, dedup=True, chunk_threshold=2**25)
+    big = np.arange(2**21, dtype=np.float64) # 16 MiB, written as .npy
+    chunked = np.ones((2**12, 2**10)) # 32 MiB, written as .npc
+    setup.save_component_cal('/cam', {'big': big[:2**20], 'chunked': chunked})
+    tracemalloc.start()
+    try:
+        setup.save_component_cal('/lidar', {'big': big})
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak < big.nbytes / 2 # nothing is serialized into memory first
+    cal_dir = setup.save_component_cal('/cam', {'big': big, 'chunked': chunked})
+    assert not [f for f in (tmp_path / 'setup' / '.blobs').iterdir() if f.is_file()] # no temporary files left
+
+    reader = Setup(tmp_path / 'setup')
+    reader.load_component_cal('/cam')
+    assert np.array_equal(reader.cal['/cam']['big'], big) and np.array_equal(reader.cal['/cam']['chunked'], chunked)
+    # the unchanged chunked array is the very same blob
+    assert (cal_dir / 'chunked.npc').stat().st_nlink == 3
+
+def test_load_component_uploads_the_parsed_cfg(tmp_path, monkeypatch):
+    from calibration_manager import manager
+    from calibration_manager.paramsync import FakeParamServer, ParamSync
+    server = FakeParamServer()
+    setup = Setup(tmp_path / 'setup', fsync=False, param_sync=ParamSync(server))
+    setup.save_component_cfg('/cam', {'exposure': 10, 'mode': 'auto'})
+    parsed = []
+    load_yaml = manager.load_yaml
+    def counting_load_yaml(f, *args):
+        parsed.append(f.name)
+        return load_yaml(f, *args)
+    monkeypatch.setattr(manager, 'load_yaml', counting_load_yaml)
+
+    # without a calibration the cfg is uploaded, from the tree already parsed to load it
+    setup.load_component('/cam', ros_param_ns='/cam')
+    assert parsed == ['cfg.yaml']
+    assert server.get_param('/cam') == {'exposure': 10, 'mode': 'auto'}
+
+    # with one only the calibration is
+    setup.save_component_cal('/cam', {'gain': 1.5})
+    parsed.clear()
+    setup.load_component('/cam', ros_param_ns='/cam')
+    assert sorted(parsed) == ['cal.yaml', 'cfg.yaml']
+    assert server.get_param('/cam') == {'gain': 1.5}
+
+def test_parallel_load(tmp_path):
+    setup = Setup(tmp_path / 'setup', fsync=False)
+    for i in range(6):
+        setup.save_component_cfg(f'/sensor{i}', {'rate': 10 * i})
+        setup.save_component_cal(f'/sensor{i}', {'offset': np.full(4, float(i))})
+    broken_dir = setup.save_component_cal('/sensor3', {'offset': np.zeros(4)})
+    (broken_dir / 'cal.yaml').write_text('offset: [unclosed\n')
+
+    serial = Setup(tmp_path / 'setup')
+    serial.load_component('/sensor0')
+    parallel = Setup(tmp_path / 'setup')
+    names = parallel.load(workers=4)
+    # the broken component is reported, the others all load
+    assert sorted(names) == [f'sensor{i}' for i in range(6) if i != 3]
+    assert list(parallel.load_errors) == ['sensor3']
+    assert names == [name for name in parallel.list_components() if name != 'sensor3']
+    assert parallel.cfg['sensor5'] == {'rate': 50}
+    assert np.array_equal(parallel.cal['sensor0']['offset'], serial.cal['/sensor0']['offset'])
+    assert np.array_equal(parallel.cal['sensor5']['offset'], np.full(4, 5.0))
+
+def test_mmap_load(tmp_path):
+    matrix = np.arange(12.0).reshape(3, 4)
+    labels = np.array(['a', None, 3], dtype=object)
+    cal_dir = Setup(tmp_path / 'setup', fsync=False).save_component_cal('/cam', {'matrix': matrix, 'labels': labels})
+
+    setup = Setup(tmp_path / 'setup', mmap_mode='r')
+    setup.load_component_cal('/cam')
+    mapped = setup.cal['/cam']['matrix']
+    # mapped from the calibration file itself, so every process loading it shares the pages
+    assert isinstance(mapped, np.memmap) and pathlib.Path(mapped.filename) == cal_dir / 'matrix.npy'
+    assert np.array_equal(mapped, matrix)
+    with pytest.raises(ValueError):
+        mapped[0, 0] = 1.0
+    # object arrays can't be mapped and are read as before
+    assert not isinstance(setup.cal['/cam']['labels'], np.memmap)
+    assert list(setup.cal['/cam']['labels']) == ['a', None, 3]
+
+def test_query_epochs(tmp_path, monkeypatch):
+    from calibration_manager import manager
+    setup = Setup(tmp_path / 'setup', fsync=False)
+    cal_dirs = [setup.save_component_cal('/cam', {'offset': np.full(3, float(i))}) for i in range(3)]
+    keys = [manager.parse_cal_id(cal_dir.name) for cal_dir in cal_dirs]
+    between = [(keys[0] + keys[1]) / 2e9, (keys[1] + keys[2]) / 2e9, keys[2] / 1e9 + 10]
+    epochs = np.array([[between[0], between[2], between[0]], [between[1], between[1], between[2]]])
+    parsed = []
+    load_yaml = manager.load_yaml
+    def counting_load_yaml(f, *args):
+        parsed.append(f.parent.name)
+        return load_yaml(f, *args)
+    monkeypatch.setattr(manager, 'load_yaml', counting_load_yaml)
+
+    reader = Setup(tmp_path / 'setup')
+    result = reader.query_epochs(epochs, ['/cam'])['/cam']
+    assert sorted(parsed) == sorted(cal_dir.name for cal_dir in cal_dirs) # each calibration loaded once
+    assert reader.cal == {} and reader.paths == {}
+    assert result['cal_ids'] == [cal_dir.name for cal_dir in cal_dirs] and result['cal_dirs'] == cal_dirs
+    assert result['index'].tolist() == [[0, 2, 0], [1, 1, 2]]
+    assert {cal_id: group.tolist() for cal_id, group in result['groups'].items()} == \
+        {cal_dirs[0].name: [0, 2], cal_dirs[1].name: [3, 4], cal_dirs[2].name: [1, 5]}
+    for epoch, i in zip(epochs.ravel(), result['index'].ravel()):
+        reader.load_component_cal('/cam', epoch)
+        assert np.array_equal(result['cal'][i]['offset'], reader.cal['/cam']['offset'])
+
+def test_save_after_a_failed_yaml_dump(tmp_path):
+    setup = Setup(tmp_path / 'setup', fsync=False)
+    with pytest.raises(Exception):
+        setup.save_component_cal('/imu', {'bias': object()})
+    cal_dir = setup.save_component_cal('/imu', {'bias': 1.5})
+    assert (cal_dir / 'cal.yaml').is_file()
+    setup.load_component_cal('/imu')
+    assert setup.cal['/imu'] == {'bias': 1.5}
@@ -0,0 +1,89 @@
+'''
+Checks of the incremental ros parameter upload, against an in-memory parameter server
+'''
+
+import pathlib
+import sys
+import types
+import xmlrpc.client
+
+REPO = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / 'src'))
+
+from calibration_manager import paramsync
+from calibration_manager.paramsync import FakeParamServer, ParamSync, RosParamClient
+
+def test_uploads_only_changes():
+    server = FakeParamServer()
+    sync = ParamSync(server)
+    tree = {'gain': 1, 'lens': {'k1': 0.1, 'k2': 0.2, 'k3': 0.3}, 'name': 'cam'}
+    assert sync.upload('/setup/cam', tree) == 1
+    assert server.calls == [('set_params', ['/setup/cam'])]
+    assert server.get_param('/setup/cam') == tree
+
+    server.calls.clear()
+    assert sync.upload('/setup/cam', tree) == 0 # unchanged, nothing sent
+    tree = {'gain': 1.0, 'lens': {'k1': 0.1, 'k2': 0.25, 'k3': 0.3}, 'mode': 'auto'}
+    assert sync.upload('/setup/cam', tree) == 4
+    assert server.calls == [('delete_params', ['/setup/cam/name']),
+                            ('set_params', ['/setup/cam/gain', '/setup/cam/lens/k2', '/setup/cam/mode'])] # one batch
+    assert server.get_param('/setup/cam') == tree and type(server.get_param('/setup/cam/gain')) is float
+
+    server.calls.clear()
+    tree = {**tree, 'lens': {'k1': 0.0, 'k2': 0.0, 'k3': 0.0}}
+    sync.upload('/setup/cam', tree) # all of lens changed, it is replaced as a whole
+    assert server.calls == [('set_params', ['/setup/cam/lens'])]
+    assert server.get_param('/setup/cam') == tree
+
+def test_offline_and_forget():
+    server = FakeParamServer(online=False)
+    sync = ParamSync(server)
+    assert sync.upload('cam', {'gain': 1}) == 0 and server.calls == []
+    server.online = True
+    sync.upload('cam', {'gain': 1})
+    server.params.clear() # e.g. the roscore restarted
+    sync.forget('cam')
+    sync.upload('cam', {'gain': 1})
+    assert server.get_param('/cam/gain') == 1
+
+def ros_doubles(monkeypatch, multicall=True):
+    '''rospy/rosgraph stand-ins recording what RosParamClient calls'''
+    calls = []
+    def system_multicall(batch):
+        if not multicall:
+            raise xmlrpc.client.Fault(1, 'no system.multicall')
+        calls.append(('multicall', [call['params'][1:] for call in batch]))
+        return [[[1, 'ok', 0]] for _ in batch]
+    handle = types.SimpleNamespace(system=types.SimpleNamespace(multicall=system_multicall))
+    rosgraph = types.SimpleNamespace(Master=lambda caller_id: types.SimpleNamespace(handle=handle),
+                                     is_master_online=lambda: calls.append(('is_master_online',)) or True,
+                                     MasterError=Exception)
+    rospy = types.SimpleNamespace(get_name=lambda: '/node', resolve_name=lambda key: key,
+                                  set_param=lambda key, value: calls.append(('set_param', key, value)))
+    monkeypatch.setattr(paramsync, 'imports_ros', True)
+    monkeypatch.setattr(paramsync, 'rosgraph', rosgraph, raising=False)
+    monkeypatch.setattr(paramsync, 'rospy', rospy, raising=False)
+    return calls
+
+def test_params_are_set_in_one_multicall(monkeypatch):
+    calls = ros_doubles(monkeypatch)
+    RosParamClient().set_params([('/cam/gain', 1), ('/cam/mode', 'auto')])
+    assert calls == [('multicall', [('/cam/gain', 1), ('/cam/mode', 'auto')])]
+
+def test_masters_without_multicall(monkeypatch):
+    calls = ros_doubles(monkeypatch, multicall=False)
+    client = RosParamClient()
+    client.set_params([('/cam/gain', 1), ('/cam/mode', 'auto')])
+    client.set_params([('/cam/gain', 2), ('/cam/mode', 'manual')]) # not tried again
+    assert calls == [('set_param', '/cam/gain', 1), ('set_param', '/cam/mode', 'auto'),
+                     ('set_param', '/cam/gain', 2), ('set_param', '/cam/mode', 'manual')]
+
+def test_master_check_is_cached(monkeypatch):
+    calls = ros_doubles(monkeypatch)
+    now = [100.0]
+    monkeypatch.setattr(paramsync.time, 'monotonic', lambda: now[0])
+    client = RosParamClient(online_ttl=5.0)
+    assert all(client.is_online() for _ in range(10))
+    now[0] += 6.0
+    assert client.is_online()
+    assert calls == [('is_master_online',)] * 2
@@ -0,0 +1,57 @@
+'''
+Checks of the retention policy and of pruning calibrations into the component archive
+'''
+
+import pathlib
+import sys
+
+REPO = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / 'src'))
+
+from calibration_manager import Setup, manager
+from calibration_manager.retention import DAY, RetentionPolicy
+from calibration_manager.timeline import new_cal_id
+
+NOW = 1000 * DAY + 12 * 3600
+
+def at(days_ago: int, hour: int):
+    return ((1000 - days_ago) * DAY + hour * 3600) * 10**9
+
+# calibration name: time, newest first
+TIMES = {
+    'a': at(0, 11), 'b': at(0, 10), # kept, younger than a day
+    'd': at(2, 20), 'c': at(2, 3), 'e': at(3, 5), # one per day: d replaces c
+    'f': at(10, 1), 'g': at(11, 1), # one per week: f replaces g
+    'h': at(40, 0), # older than any tier
+}
+
+def test_tier_selection():
+    policy = RetentionPolicy(keep_all_days=1, daily_days=5, weekly_days=30)
+    cal_ids = {new_cal_id(t): name for name, t in TIMES.items()}
+    assert sorted(cal_ids[cal_id] for cal_id in policy.select(list(cal_ids), now=NOW)) == ['a', 'b', 'd', 'e', 'f']
+    everything = RetentionPolicy(tiers=[(None, None)])
+    assert everything.select(list(cal_ids), now=NOW) == set(cal_ids)
+
+def test_prune_keeps_history_loadable(tmp_path, monkeypatch):
+    setup = Setup(tmp_path / 'setup', fsync=False)
+    cal_ids = {}
+    for name, t in sorted(TIMES.items(), key=lambda item: item[1]):
+        monkeypatch.setattr(manager.time, 'time_ns', lambda: t)
+        cal_ids[name] = setup.save_component_cal('/cam', {'name': name}).name
+    monkeypatch.undo()
+    setup.pin_cal('/cam', cal_ids['h'])
+
+    policy = RetentionPolicy(keep_all_days=0, daily_days=5, weekly_days=30)
+    component_dir = tmp_path / 'setup' / 'cam'
+    dry_run = setup.prune(policy, dry_run=True, now=NOW)['cam']
+    assert all((component_dir / cal_id).is_dir() for cal_id in cal_ids.values())
+    report = setup.prune(policy, now=NOW)['cam']
+    assert report == dry_run
+    # b shares the day of a, which is latest anyway; h is pinned
+    assert sorted(report['archived']) == sorted([cal_ids['b'], cal_ids['c'], cal_ids['g']])
+    assert not any((component_dir / cal_ids[name]).exists() for name in 'bcg')
+
+    reader = Setup(tmp_path / 'setup')
+    for name, t in TIMES.items():
+        reader.load_component_cal('/cam', t / 1e9)
+        assert reader.cal['/cam'] == {'name': name}
@@ -0,0 +1,179 @@
+'''
+Offscreen checks of the rqt SetupManager: the component/topic item models, and the plugin starting up
+on an existing setup with the ros modules stubbed out. Skipped without PyQt5.
+'''
+
+import os
+import pathlib
+import sys
+import types
+
+import pytest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+QtCore = pytest.importorskip('PyQt5.QtCore')
+QtWidgets = pytest.importorskip('PyQt5.QtWidgets')
+QtTest = pytest.importorskip('PyQt5.QtTest')
+from PyQt5 import uic
+
+REPO = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / 'src'))
+
+def install_module(monkeypatch, name, **attrs):
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    monkeypatch.setitem(sys.modules, name, module)
+    return module
+
+@pytest.fixture
+def qt(monkeypatch):
+    '''A QApplication, with python_qt_binding mapped onto PyQt5 if it isn't installed'''
+    try:
+        import python_qt_binding
+    except ImportError:
+        install_module(monkeypatch, 'python_qt_binding', loadUi=uic.loadUi)
+        core = install_module(monkeypatch, 'python_qt_binding.QtCore', **vars(QtCore))
+        core.Signal = QtCore.pyqtSignal
+        install_module(monkeypatch, 'python_qt_binding.QtWidgets', **vars(QtWidgets))
+        for name in ('calibration_manager.setupmodel', 'calibration_manager.rqt_setup_manager'):
+            monkeypatch.delitem(sys.modules, name, raising=False)
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    yield app
+
+def component(i, **kwargs):
+    cmp = {'component_name': f'c{i}', 'component_package': 'pkg', 'component_type': 'driver',
+           'component_launch_file': 'launch/c.launch', 'group_name': '/', 'enabled': True,
+           'args': {f'a{j}': str(j) for j in range(5)}}
+    cmp.update(kwargs)
+    return cmp
+
+def test_component_model(qt):
+    from calibration_manager.setupmodel import COMPONENT_TYPES, ComboBoxDelegate, ComponentModel
+    Qt = QtCore.Qt
+    components = [component(i) for i in range(300)]
+    model = ComponentModel(components)
+    QtTest.QAbstractItemModelTester(model, QtTest.QAbstractItemModelTester.FailureReportingMode.Fatal)
+    view = QtWidgets.QTreeView()
+    view.setModel(model)
+    view.setItemDelegateForColumn(2, ComboBoxDelegate(COMPONENT_TYPES, view))
+    view.show()
+    qt.processEvents()
+
+    cmp_index = model.index(1, 0)
+    assert model.data(cmp_index) == 'c1'
+    assert model.data(cmp_index, Qt.CheckStateRole) == Qt.Checked
+    assert model.setData(cmp_index, Qt.Unchecked, Qt.CheckStateRole) and components[1]['enabled'] is False
+    assert model.setData(model.index(1, 2), 'routine') and components[1]['component_type'] == 'routine'
+    assert not model.setData(model.index(1, 2), 'bogus')
+    arg_index = model.index(2, 1, cmp_index)
+    assert model.data(arg_index) == '0'
+    assert model.setData(arg_index, '9') and components[1]['args']['a0'] == '9'
+    assert not model.flags(model.index(0, 1, cmp_index)) & Qt.ItemIsEditable # launch file
+    assert model.flags(model.index(1, 1, cmp_index)) & Qt.ItemIsEditable # group name
+
+    # the type delegate writes the combo box choice back
+    view.edit(model.index(0, 2))
+    qt.processEvents()
+    editor = view.focusWidget()
+    assert isinstance(editor, QtWidgets.QComboBox)
+    editor.setCurrentText('service')
+    view.commitData(editor)
+    assert components[0]['component_type'] == 'service'
+
+    model.remove_indexes([model.index(3, 0, cmp_index), model.index(5, 1, model.index(0, 0)), model.index(0, 0)])
+    assert len(components) == 299 and components[0]['component_name'] == 'c1' and 'a1' not in components[0]['args']
+    index = model.append_item(component('new', args=None))
+    assert model.rowCount() == 300 and model.rowCount(index) == 2
+    model.set_tooltip(index.row(), 'includes')
+    assert model.data(model.index(0, 1, index), Qt.ToolTipRole) == 'includes'
+
+def test_topic_model(qt):
+    from calibration_manager.setupmodel import TopicModel
+    bags = [{'group_name': 'g', 'end_delay': 1.0, 'enabled': True, 'topics': [{'topic_name': '/a', 'enabled': True}]}]
+    model = TopicModel(bags)
+    QtTest.QAbstractItemModelTester(model, QtTest.QAbstractItemModelTester.FailureReportingMode.Fatal)
+    model.add_group('x', True, 2)
+    model.add_topic(1, '/b')
+    assert bags[1]['topics'] == [{'topic_name': '/b', 'enabled': True}]
+    assert model.setData(model.index(1, 0), 'a b_c') and bags[1]['group_name'] == 'abc'
+    assert not model.setData(model.index(1, 1), 'zz')
+    assert model.setData(model.index(1, 1), '3') and bags[1]['end_delay'] == 3.0 and model.data(model.index(1, 1)) == '3'
+    model.remove_indexes([model.index(0, 0, model.index(0, 0))])
+    assert bags[0]['topics'] == []
+
+@pytest.fixture
+def ros_stubs(monkeypatch, tmp_path):
+    '''Stub modules for ros, rqt and tkinter, with HOME in tmp_path'''
+    monkeypatch.setenv('HOME', str(tmp_path))
+    monkeypatch.setenv('ROS_SETUP', 'my_machine')
+    for name in ('calibration_manager.rqt_setup_manager',):
+        monkeypatch.delitem(sys.modules, name, raising=False)
+
+    def log(*args, **kwargs):
+        pass
+    install_module(monkeypatch, 'rospy', logerr=log, loginfo=log, logwarn=log, get_published_topics=lambda: [])
+
+    class RosPack:
+        def list(self):
+            return ['calibration_manager']
+        def get_path(self, package):
+            return str(REPO)
+    install_module(monkeypatch, 'rospkg', RosPack=RosPack)
+    install_module(monkeypatch, 'std_msgs')
+    install_module(monkeypatch, 'std_msgs.msg')
+    install_module(monkeypatch, 'sensor_msgs')
+    install_module(monkeypatch, 'sensor_msgs.msg')
+    install_module(monkeypatch, 'cv_bridge', CvBridge=lambda: None)
+
+    class Plugin(QtCore.QObject):
+        def __init__(self, context):
+            super(Plugin, self).__init__()
+    install_module(monkeypatch, 'qt_gui')
+    install_module(monkeypatch, 'qt_gui.plugin', Plugin=Plugin)
+
+    class Tk:
+        def withdraw(self):
+            pass
+    install_module(monkeypatch, 'tkinter', Tk=Tk, filedialog=None, simpledialog=None, messagebox=None)
+    QtCore.QSettings.setPath(QtCore.QSettings.NativeFormat, QtCore.QSettings.UserScope, str(tmp_path / '.config'))
+    return tmp_path
+
+class Context:
+    def serial_number(self):
+        return 1
+    def add_widget(self, widget):
+        self.widget = widget
+
+def test_plugin_starts_on_existing_setup(qt, ros_stubs):
+    setup_dir = ros_stubs / '.ros' / 'setups_local' / 'my_machine'
+    setup_dir.mkdir(parents=True)
+    (setup_dir / 'setup.yaml').write_text('''components:
+- component_name: cam0
+  group_name: /
+  component_package: cams
+  component_type: driver
+  component_launch_file: launch/cam.launch
+  enabled: true
+  args: {serial: '123'}
+bags:
+- group_name: g
+  end_delay: 1.0
+  enabled: true
+  topics:
+  - {topic_name: /a, enabled: true}
+data_storage_local: /data
+data_storage_deep: /deepdata
+''')
+    from calibration_manager.rqt_setup_manager import SetupManager
+    manager = SetupManager(Context())
+    try:
+        assert manager.component_model.component_names() == ['cam0']
+        assert manager.topic_model.rowCount() == 1
+        assert manager.setup_names == ['my_machine']
+
+        manager.component_model.setData(manager.component_model.index(0, 2), 'service')
+        manager.save_setup()
+        assert 'cams' in (setup_dir / 'services.launch').read_text()
+        assert 'cams' not in (setup_dir / 'drivers.launch').read_text()
+    finally:
+        manager.shutdown_plugin()
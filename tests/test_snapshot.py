@@ -0,0 +1,59 @@
+'''
+Checks that a setup loaded from its snapshot matches the setup loaded from its folders
+'''
+
+import pathlib
+import sys
+
+import numpy as np
+import pandas as pd
+
+REPO = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / 'src'))
+
+from calibration_manager import Setup
+from calibration_manager.manager import parse_cal_id
+
+def assert_trees_equal(a, b):
+    if isinstance(a, dict): # plain dicts from the snapshot, yaml maps from the folders
+        assert isinstance(b, dict) and list(a) == list(b)
+        for k in a:
+            assert_trees_equal(a[k], b[k])
+    elif isinstance(a, np.ndarray):
+        assert isinstance(b, np.ndarray) and a.dtype == b.dtype and a.shape == b.shape and (a == b).all()
+    elif isinstance(a, pd.DataFrame):
+        pd.testing.assert_frame_equal(a, b)
+    else:
+        assert a == b
+
+def make_setup(path):
+    setup = Setup(path, fsync=False, table_format='npz')
+    setup.save_component_cfg('/cam', {'rate': 30, 'lut': np.arange(256, dtype=np.uint8)})
+    setup.load_component_cfg('/cam') # copied into the calibrations
+    first = setup.save_component_cal('/cam', {'K': np.eye(3), 'lens': {'k': [0.1, 0.2]}})
+    setup.save_component_cal('/cam', {'K': 2 * np.eye(3), 'lens': {'k': [0.3, 0.4]},
+                                      'labels': np.array(['a', None], dtype=object),
+                                      'table': pd.DataFrame({'x': [1.0, 2.0]}, index=pd.Index([5, 7], name='t'))})
+    setup.save_component_cfg('/imu', {'rate': 200})
+    return setup, parse_cal_id(first.name) / 1e9
+
+def test_snapshot_loads_like_folders(tmp_path):
+    _, first_epoch = make_setup(tmp_path / 'setup')
+    for run_time_epoch in (None, first_epoch):
+        folders = Setup(tmp_path / 'setup')
+        folders.load(run_time_epoch)
+        frozen = Setup(tmp_path / 'setup')
+        frozen.load_snapshot(frozen.freeze(tmp_path / 'snapshot', run_time_epoch))
+        assert sorted(frozen.component_names) == sorted(folders.component_names)
+        assert_trees_equal(frozen.cfg, folders.cfg)
+        assert_trees_equal(frozen.cal, folders.cal)
+        assert frozen.paths == folders.paths
+
+def test_out_of_date_snapshot_is_ignored(tmp_path):
+    setup, _ = make_setup(tmp_path / 'setup')
+    setup.freeze()
+    setup.save_component_cal('/imu', {'bias': np.zeros(3)})
+    reader = Setup(tmp_path / 'setup')
+    reader.load_snapshot(check=True)
+    assert reader.snapshot is None # loaded from the folders instead
+    assert not reader.cal['imu']['bias'].any()
@@ -0,0 +1,45 @@
+'''
+Checks that dataframes come back from each table format with their index and labels unchanged
+'''
+
+import pathlib
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+REPO = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / 'src'))
+
+from calibration_manager import tables
+
+FRAMES = {
+    'named index': pd.DataFrame({'gain': [1.0, 2.0]}, index=pd.Index([3, 5], name='t')),
+    'int columns': pd.DataFrame(np.arange(4.0).reshape(2, 2)),
+    'multiindex rows': pd.DataFrame({'gain': [1, 2, 3]},
+                                    index=pd.MultiIndex.from_tuples([(1, 'x'), (1, 'y'), (2, 'x')], names=['n', 's'])),
+    'multiindex columns': pd.DataFrame(np.ones((2, 2)), columns=pd.MultiIndex.from_tuples([('a', 1), ('a', 2)], names=['k', None])),
+    'str index': pd.DataFrame({'gain': [1, 2]}, index=['p', 'q']),
+}
+
+@pytest.mark.parametrize('table_format', ['feather', 'npz'])
+@pytest.mark.parametrize('name', list(FRAMES))
+def test_round_trip(tmp_path, table_format, name):
+    suffix, save = tables.resolve_table_format(table_format)
+    f = tmp_path / f'table{suffix}'
+    save(f, FRAMES[name])
+    pd.testing.assert_frame_equal(tables.table_loaders[suffix](f), FRAMES[name])
+
+def test_npz_keeps_labels_that_are_not_field_names(tmp_path):
+    for df in [pd.DataFrame([[1, 2]], columns=[0, '0']),
+               pd.DataFrame([[1, 2]], columns=['index', 'a']),
+               pd.DataFrame(np.ones((1, 2)), columns=pd.Index([('a', 1), ('b', 2)], tupleize_cols=False))]:
+        tables.save_npz(tmp_path / 'table.npz', df)
+        pd.testing.assert_frame_equal(tables.load_npz(tmp_path / 'table.npz'), df)
+
+def test_labels_that_can_not_be_kept_are_refused(tmp_path):
+    with pytest.raises(ValueError, match='feather'):
+        tables.save_feather(tmp_path / 'table.feather', pd.DataFrame([[1, 2]], columns=[0, 'a']))
+    with pytest.raises(ValueError, match='npz'):
+        tables.save_npz(tmp_path / 'table.npz', pd.DataFrame([[1]], columns=[pd.Timestamp('2024-01-01')]))
@@ -0,0 +1,93 @@
+'''
+Checks of the timeline index of a component folder
+'''
+
+import concurrent.futures
+import pathlib
+import sys
+
+import numpy as np
+
+REPO = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / 'src'))
+
+from calibration_manager import Setup
+from calibration_manager.timeline import INDEX_DIR, Timeline, new_cal_id, parse_cal_id
+
+def test_concurrent_rebuilds(tmp_path, caplog):
+    cal_ids = [new_cal_id(10**18 + i * 10**9) for i in range(20)]
+    for cal_id in cal_ids:
+        (tmp_path / cal_id).mkdir()
+
+    def rebuild(i):
+        for _ in range(200):
+            Timeline(tmp_path).rebuild()
+        return Timeline(tmp_path).names()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as pool:
+        assert all(names == cal_ids for names in pool.map(rebuild, range(8)))
+    assert not caplog.records # e.g. failed to write timeline index
+    assert [f.name for f in (tmp_path / INDEX_DIR).iterdir()] == ['index.json']
+
+def test_add_leaves_read_index_alone(tmp_path):
+    '''Adds replace the index instead of inserting into the lists readers may be bisecting'''
+    timeline = Timeline(tmp_path)
+    cal_ids = [new_cal_id(10**18 + i * 10**9) for i in range(10)]
+    for cal_id in cal_ids[1:]:
+        timeline.add(cal_id)
+    names, keys = timeline.snapshot()
+    timeline.add(cal_ids[0])
+    assert (names, keys) == (cal_ids[1:], [parse_cal_id(cal_id) for cal_id in cal_ids[1:]])
+    assert timeline.names() == cal_ids
+    assert timeline.at(parse_cal_id(cal_ids[1]) / 1e9 + 0.5) == cal_ids[1]
+
+def test_save_while_loading(tmp_path):
+    setup = Setup(tmp_path / 'setup', fsync=False)
+    reader = Setup(tmp_path / 'setup')
+    futures = [setup.save_component_cal_async('/cam', {'i': i}) for i in range(100)]
+    seen = []
+    while not all(f.done() for f in futures):
+        cal_dir = reader.load_component_cal('/cam')
+        if cal_dir is not None:
+            seen.append(reader.cal['/cam']['i'])
+    setup.flush()
+    assert seen == sorted(seen)
+    cal_dirs = [f.result() for f in futures]
+    keys = [parse_cal_id(cal_dir.name) for cal_dir in cal_dirs]
+    for i in (0, 50, 98):
+        reader.load_component_cal('/cam', (keys[i] + keys[i + 1]) / 2e9) # between saves, float epochs keep ~us
+        assert reader.cal['/cam']['i'] == i
+
+def test_int_epochs_cover_their_second(tmp_path):
+    second = 1_700_000_000
+    cal_ids = [str(second - 1), new_cal_id(second * 10**9 + 250_000_000), new_cal_id(second * 10**9 + 750_000_000), str(second + 1)]
+    for cal_id in cal_ids:
+        (tmp_path / cal_id).mkdir()
+    timeline = Timeline(tmp_path)
+    assert timeline.at(second) == cal_ids[2] # made later in that second
+    assert timeline.at(np.int64(second)) == cal_ids[2]
+    assert timeline.at(second + 0.5) == cal_ids[1]
+    assert timeline.at(float(second)) == cal_ids[0]
+    assert timeline.at(second + 1) == cal_ids[3]
+    names = timeline.names()
+    assert [names[i] for i in timeline.at_many([second - 1, second, second + 1])] == [cal_ids[0], cal_ids[2], cal_ids[3]]
+    assert [names[i] for i in timeline.at_many([second + 0.5, float(second)])] == [cal_ids[1], cal_ids[0]]
+
+def test_writers_in_the_same_ns(tmp_path, monkeypatch):
+    from calibration_manager import manager
+    now = 1_700_000_000 * 10**9 + 123
+    monkeypatch.setattr(manager.time, 'time_ns', lambda: now)
+    (tmp_path / 'setup' / 'cam').mkdir(parents=True)
+    (tmp_path / 'setup' / 'cam' / '1699999999').mkdir() # a whole-second id of an older version
+    writers = [Setup(tmp_path / 'setup', fsync=False) for _ in range(4)]
+    with concurrent.futures.ThreadPoolExecutor(4) as pool:
+        futures = [pool.submit(writer.save_component_cal, '/cam', {'i': i}) for i, writer in enumerate(writers)]
+    cal_dirs = [f.result() for f in futures]
+    # each writer got its own calibration, at the next free ns
+    assert sorted(parse_cal_id(cal_dir.name) for cal_dir in cal_dirs) == [now + i for i in range(4)]
+    assert sorted(cal_dir.name for cal_dir in cal_dirs)[0] == '1700000000.000000123'
+    reader = Setup(tmp_path / 'setup')
+    assert reader.timeline(tmp_path / 'setup' / 'cam').names()[0] == '1699999999'
+    reader.load_component_cal('/cam')
+    assert reader.paths['/cam']['cal'] == max(cal_dirs)
+    assert reader.cal['/cam']['i'] == cal_dirs.index(max(cal_dirs))
@@ -0,0 +1,32 @@
+'''
+Checks that a watching Setup picks up calibrations saved by another Setup
+'''
+
+import pathlib
+import queue
+import sys
+
+import pytest
+
+REPO = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / 'src'))
+
+from calibration_manager import Setup
+from calibration_manager.watcher import SetupWatcher, imports_inotify
+
+@pytest.mark.parametrize('use_inotify', [pytest.param(True, marks=pytest.mark.skipif(not imports_inotify, reason='no inotify')), False])
+def test_reloads_saved_calibrations(tmp_path, use_inotify):
+    writer = Setup(tmp_path / 'setup', fsync=False)
+    writer.save_component_cal('/cam', {'gain': 1})
+    writer.save_component_cal('/imu', {'gain': 1})
+    reader = Setup(tmp_path / 'setup')
+    reloads = queue.Queue()
+    with SetupWatcher(reader, component_names=['cam', 'lidar'], poll_interval=0.05, use_inotify=use_inotify) as watcher:
+        watcher.add_callback(lambda name, cal: reloads.put((name, dict(cal))))
+        writer.save_component_cal('/imu', {'gain': 2}) # not watched
+        writer.save_component_cal('/cam', {'gain': 2})
+        assert reloads.get(timeout=5) == ('cam', {'gain': 2})
+        assert reader.cal['cam'] == {'gain': 2}
+        writer.save_component_cal('/lidar', {'gain': 3}) # created after the watch started
+        assert reloads.get(timeout=5) == ('lidar', {'gain': 3})
+    assert reloads.empty() and watcher.reloads == 2 and 'imu' not in reader.cal
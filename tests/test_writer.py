@@ -0,0 +1,43 @@
+'''
+Checks of background calibration saves
+'''
+
+import pathlib
+import sys
+
+import numpy as np
+import pytest
+
+REPO = pathlib.Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO / 'src'))
+
+from calibration_manager import Setup
+from calibration_manager.writer import AsyncCalWriter
+
+class Unsaveable:
+    pass
+
+def test_background_saves(tmp_path):
+    setup = Setup(tmp_path / 'setup', fsync=False)
+    offset = np.zeros(3)
+    with AsyncCalWriter(setup, workers=2) as writer:
+        futures = []
+        for i in range(5):
+            offset[:] = i
+            futures.append(writer.save_component_cal('/cam', {'offset': offset, 'lens': {'i': i}}))
+            offset[:] = -1 # the caller keeps using its array while the save is queued
+        failed = writer.save_component_cal('/imu', {'bias': Unsaveable()})
+        futures.append(writer.save_component_cal('/imu', {'bias': offset}))
+        assert writer.flush(timeout=30) and writer.pending == 0
+    with pytest.raises(RuntimeError):
+        writer.save_component_cal('/cam', {})
+
+    assert failed.exception() is not None # reported through its future, later saves still run
+    cal_dirs = [f.result() for f in futures]
+    assert cal_dirs[:5] == sorted(cal_dirs[:5]) # in submission order
+    reader = Setup(tmp_path / 'setup')
+    reader.load_component_cal('/cam')
+    assert reader.paths['/cam']['cal'] == cal_dirs[4]
+    assert reader.cal['/cam']['lens'] == {'i': 4} and (reader.cal['/cam']['offset'] == 4).all()
+    reader.load_component_cal('/imu')
+    assert (reader.cal['/imu']['bias'] == -1).all()